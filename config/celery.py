@@ -3,6 +3,7 @@ from __future__ import absolute_import, unicode_literals
 import os
 
 from celery import Celery
+from celery.signals import worker_process_shutdown, worker_ready
 
 # Установка переменной окружения для настроек проекта
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
@@ -15,3 +16,27 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 
 # Автоматическое обнаружение и регистрация задач из файлов tasks.py в приложениях Django
 app.autodiscover_tasks()
+
+# Метрики задач: ожидание в очереди, время выполнения, исходы и рост памяти (отдаются на CELERY_METRICS_PORT)
+import config.celery_signals  # noqa: E402,F401
+
+
+@worker_ready.connect
+def start_metrics_exporter(**kwargs):
+    """ HTTP-экспортёр метрик воркера (соединения с БД и т.д.) на CELERY_METRICS_PORT """
+    from django.conf import settings
+    from prometheus_client import start_http_server
+
+    from config.metrics import get_registry
+
+    if settings.CELERY_METRICS_PORT:
+        start_http_server(int(settings.CELERY_METRICS_PORT), registry=get_registry())
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    # В режиме PROMETHEUS_MULTIPROC_DIR значения завершённого процесса-исполнителя убираются из livesum-метрик
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid or os.getpid())
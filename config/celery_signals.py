@@ -0,0 +1,72 @@
+import os
+import resource
+import time
+from datetime import datetime
+
+from celery.signals import before_task_publish, task_failure, task_postrun, task_prerun, task_retry
+
+from config.metrics import (CELERY_TASK_MEMORY_GROWTH, CELERY_TASK_QUEUE_SECONDS, CELERY_TASK_RUNTIME_SECONDS,
+                            CELERY_TASKS, CELERY_WORKER_RSS)
+
+# task_id -> (начало выполнения, RSS до задачи); заполняется и очищается в одном процессе-исполнителе
+_running = {}
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss():
+    """ Текущий RSS процесса в байтах; без /proc — пиковый RSS из getrusage """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@before_task_publish.connect
+def stamp_sent_at(headers=None, **kwargs):
+    # Заголовок сообщения доступен исполнителю как task.request.sent_at; у повтора (retry) он свой
+    if headers is not None:
+        headers["sent_at"] = time.time()
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, task=None, **kwargs):
+    sent_at = getattr(task.request, "sent_at", None)
+    if sent_at is not None:
+        # Для задач с eta/countdown ожидание отсчитывается от назначенного времени
+        eta = task.request.eta
+        ready_at = max(sent_at, _timestamp(eta)) if eta else sent_at
+        CELERY_TASK_QUEUE_SECONDS.labels(task.name).observe(max(time.time() - ready_at, 0))
+    _running[task_id] = (time.perf_counter(), current_rss())
+
+
+@task_postrun.connect
+def stop_task_timer(task_id=None, task=None, state=None, **kwargs):
+    started = _running.pop(task_id, None)
+    if started is None:
+        return
+    started_at, rss_before = started
+    CELERY_TASK_RUNTIME_SECONDS.labels(task.name).observe(time.perf_counter() - started_at)
+    rss = current_rss()
+    CELERY_WORKER_RSS.set(rss)
+    if rss > rss_before:
+        CELERY_TASK_MEMORY_GROWTH.labels(task.name).inc(rss - rss_before)
+    if state == "SUCCESS":
+        CELERY_TASKS.labels(task.name, "success").inc()
+
+
+@task_failure.connect
+def count_task_failure(sender=None, **kwargs):
+    CELERY_TASKS.labels(sender.name, "failure").inc()
+
+
+@task_retry.connect
+def count_task_retry(sender=None, **kwargs):
+    CELERY_TASKS.labels(sender.name, "retry").inc()
+
+
+def _timestamp(eta):
+    # eta приходит строкой ISO 8601 или datetime в зависимости от протокола
+    if isinstance(eta, str):
+        eta = datetime.fromisoformat(eta)
+    return eta.timestamp()
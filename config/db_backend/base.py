@@ -0,0 +1,30 @@
+import time
+
+from django.db.backends.postgresql import base
+
+from config.metrics import DB_CONNECT_SECONDS, DB_CONNECTION_ERRORS, DB_CONNECTIONS_OPEN, DB_CONNECTIONS_OPENED
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """ PostgreSQL-бэкенд Django с метриками соединений: число, открытые сейчас и время установки """
+    counted_open = False
+
+    def get_new_connection(self, conn_params):
+        started = time.perf_counter()
+        try:
+            connection = super().get_new_connection(conn_params)
+        except Exception:
+            DB_CONNECTION_ERRORS.labels(self.alias).inc()
+            raise
+        DB_CONNECT_SECONDS.labels(self.alias).observe(time.perf_counter() - started)
+        DB_CONNECTIONS_OPENED.labels(self.alias).inc()
+        DB_CONNECTIONS_OPEN.labels(self.alias).inc()
+        self.counted_open = True
+        return connection
+
+    def _close(self):
+        # close() внутри atomic не обнуляет self.connection, поэтому учитываем закрытие по флагу
+        if self.counted_open:
+            DB_CONNECTIONS_OPEN.labels(self.alias).dec()
+            self.counted_open = False
+        super()._close()
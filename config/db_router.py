@@ -0,0 +1,176 @@
+import hashlib
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from redis import RedisError
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Отставание реплики в секундах. Если реплика догнала мастер (receive LSN = replay LSN), отставание
+# равно 0 даже при давнем последнем коммите; на сервере не в режиме восстановления функции возвращают NULL.
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+@dataclass
+class RoutingState:
+    use_replica: bool = False
+    wrote: bool = False
+
+
+_routing = ContextVar("db_routing", default=None)
+# alias -> (время проверки, отставание в секундах или None, если реплика недоступна)
+_replica_lag = {}
+
+
+@contextmanager
+def replica_reads(use_replica=True):
+    """ Чтения внутри блока идут на реплики (если они настроены и не отстают), записи — на мастер """
+    state = RoutingState(use_replica=use_replica)
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+def replica_lag(alias):
+    """ Отставание реплики с кэшированием на REPLICA_LAG_CHECK_INTERVAL секунд в пределах процесса """
+    checked_at, lag = _replica_lag.get(alias, (None, None))
+    now = time.monotonic()
+    if checked_at is not None and now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return lag
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(REPLICA_LAG_SQL)
+            lag = float(cursor.fetchone()[0])
+    except DatabaseError as exc:
+        logger.warning("Реплика %s недоступна: %s", alias, exc)
+        lag = None
+    _replica_lag[alias] = (now, lag)
+    return lag
+
+
+def healthy_replicas():
+    return [alias for alias in settings.DATABASE_REPLICAS
+            if (lag := replica_lag(alias)) is not None and lag <= settings.REPLICA_MAX_LAG_SECONDS]
+
+
+class PrimaryReplicaRouter:
+    """
+    Чтения в блоке replica_reads() — на случайную реплику из DATABASE_REPLICAS, всё остальное — на default.
+
+    Реплика, которая отстаёт больше REPLICA_MAX_LAG_SECONDS или недоступна, исключается до следующей
+    проверки; если подходящих реплик нет, чтение идёт на мастер.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or not state.use_replica or not settings.DATABASE_REPLICAS:
+            return None
+        replicas = healthy_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            # Дальнейшие чтения этого запроса и клиента должны видеть запись
+            state.wrote = True
+            state.use_replica = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def sticky_key(request):
+    """
+    Ключ клиента для окна чтения с мастера: токен из Authorization или cookie сессии, у анонимного клиента — None.
+    Адрес клиента не годится: за прокси REMOTE_ADDR один на всех.
+    """
+    ident = request.META.get("HTTP_AUTHORIZATION") or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not ident:
+        return None
+    return f"db:sticky:{hashlib.sha256(ident.encode()).hexdigest()}"
+
+
+def sticky_error(exc):
+    logger.warning("Redis недоступен, чтения клиента идут на мастер: %s", exc)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Направляет чтения безопасных запросов (GET/HEAD/OPTIONS) на реплики.
+
+    После запроса с записью клиент REPLICA_STICKY_SECONDS секунд читает с мастера,
+    чтобы сразу видеть свои изменения (read-your-writes). Пока окно нельзя проверить (Redis недоступен),
+    чтения идут на мастер. Без настроенных реплик ничего не делает.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        key = sticky_key(request)
+        use_replica = request.method in SAFE_METHODS
+        if use_replica and key is not None:
+            try:
+                use_replica = not cache.get(key)
+            except RedisError as exc:
+                sticky_error(exc)
+                use_replica = False
+        with replica_reads(use_replica) as state:
+            response = self.get_response(request)
+        if key is not None and (state.wrote or request.method not in SAFE_METHODS):
+            try:
+                cache.set(key, 1, settings.REPLICA_STICKY_SECONDS)
+            except RedisError as exc:
+                sticky_error(exc)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        key = sticky_key(request)
+        use_replica = request.method in SAFE_METHODS
+        if use_replica and key is not None:
+            try:
+                use_replica = not await cache.aget(key)
+            except RedisError as exc:
+                sticky_error(exc)
+                use_replica = False
+        with replica_reads(use_replica) as state:
+            response = await self.get_response(request)
+        if key is not None and (state.wrote or request.method not in SAFE_METHODS):
+            try:
+                await cache.aset(key, 1, settings.REPLICA_STICKY_SECONDS)
+            except RedisError as exc:
+                sticky_error(exc)
+        return response
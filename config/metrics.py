@@ -0,0 +1,56 @@
+import hmac
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+# Метрики процесса. При нескольких процессах (gunicorn, prefork-воркеры Celery) задайте PROMETHEUS_MULTIPROC_DIR —
+# значения будут собираться из всех процессов.
+
+DB_CONNECTIONS_OPENED = Counter(
+    "db_connections_opened_total", "Установленные соединения с БД", ["alias"])
+DB_CONNECTION_ERRORS = Counter(
+    "db_connection_errors_total", "Неудачные попытки соединения с БД", ["alias"])
+DB_CONNECTIONS_OPEN = Gauge(
+    "db_connections_open", "Открытые сейчас соединения с БД", ["alias"], multiprocess_mode="livesum")
+DB_CONNECT_SECONDS = Histogram(
+    "db_connect_seconds", "Время ожидания нового соединения с БД", ["alias"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
+# Задачи Celery (config.celery_signals)
+TASK_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+CELERY_TASK_QUEUE_SECONDS = Histogram(
+    "celery_task_queue_seconds", "Ожидание задачи в очереди от отправки до начала выполнения", ["task"],
+    buckets=TASK_BUCKETS)
+CELERY_TASK_RUNTIME_SECONDS = Histogram(
+    "celery_task_runtime_seconds", "Время выполнения задачи", ["task"], buckets=TASK_BUCKETS)
+CELERY_TASKS = Counter(
+    "celery_tasks_total", "Завершённые задачи по исходу: success, failure, retry", ["task", "state"])
+CELERY_TASK_MEMORY_GROWTH = Counter(
+    "celery_task_memory_growth_bytes_total", "Рост RSS процесса-исполнителя за время задач", ["task"])
+CELERY_WORKER_RSS = Gauge(
+    "celery_worker_rss_bytes", "RSS процесса-исполнителя после последней задачи", multiprocess_mode="liveall")
+
+
+def get_registry():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    """
+    Метрики в формате Prometheus с заголовком Authorization: Bearer <METRICS_TOKEN>. Без METRICS_TOKEN метрики
+    открыты только при DEBUG, иначе адреса нет (404): они раскрывают устройство БД и очередей.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            raise Http404
+    elif not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,168 @@
+import functools
+import heapq
+import logging
+import random
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+# Сколько самых долгих запросов хранится для журнала медленных запросов и сколько символов SQL выводится
+TOP_QUERIES = 5
+SQL_PREVIEW = 300
+
+
+@dataclass
+class RequestProfile:
+    """ Замер одного запроса: SQL (число, время, самые долгие) и время участков (serializer, auth) """
+    sql_count: int = 0
+    sql_time: float = 0.0
+    sections: dict = field(default_factory=dict)
+    top_queries: list = field(default_factory=list)
+
+    def add_query(self, duration, sql):
+        self.sql_count += 1
+        self.sql_time += duration
+        item = (duration, self.sql_count, sql)
+        if len(self.top_queries) < TOP_QUERIES:
+            heapq.heappush(self.top_queries, item)
+        elif duration > self.top_queries[0][0]:
+            heapq.heapreplace(self.top_queries, item)
+
+
+_profile = ContextVar("request_profile", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(time.perf_counter() - started, sql)
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    # Обёртка остаётся на объекте соединения при переподключениях, поэтому добавляется один раз
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+def profiled(section):
+    """
+    Декоратор: время вызова добавляется к участку section замера текущего запроса (без SQL внутри него).
+
+    Вне замеряемого запроса стоит одного обращения к ContextVar.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _profile.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            started, sql_before = time.perf_counter(), profile.sql_time
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started - (profile.sql_time - sql_before)
+                profile.sections[section] = profile.sections.get(section, 0.0) + elapsed
+        return wrapper
+    return decorator
+
+
+class ProfiledSerializerMixin:
+    """ Время сериализации и проверки данных DRF-сериализатора попадает в участок serializer """
+
+    @profiled("serializer")
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
+    @profiled("serializer")
+    def is_valid(self, *args, **kwargs):
+        return super().is_valid(*args, **kwargs)
+
+
+class ProfilingMiddleware:
+    """
+    Выборочное профилирование запросов.
+
+    Доля PROFILING_SAMPLE_RATE запросов (и запросы с заголовком X-Profile, равным PROFILING_TOKEN) получает
+    заголовок Server-Timing: sql (время и число запросов), serializer, auth, app (остальной код) и total.
+    Запросы дольше PROFILING_SLOW_REQUEST_MS записываются в журнал config.profiling, для замеряемых — с самыми
+    долгими SQL-запросами. Незамеряемый запрос стоит двух вызовов perf_counter.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection=connection)
+
+    def should_profile(self, request):
+        token = settings.PROFILING_TOKEN
+        if token and request.headers.get("X-Profile") == token:
+            return True
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = RequestProfile() if self.should_profile(request) else None
+        token = _profile.set(profile)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        self.finish(request, response, profile, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        profile = RequestProfile() if self.should_profile(request) else None
+        token = _profile.set(profile)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        self.finish(request, response, profile, time.perf_counter() - started)
+        return response
+
+    def finish(self, request, response, profile, total):
+        if profile is not None:
+            response["Server-Timing"] = self.server_timing(profile, total)
+        if total * 1000 >= settings.PROFILING_SLOW_REQUEST_MS:
+            self.log_slow(request, response, profile, total)
+
+    def server_timing(self, profile, total):
+        app = total - profile.sql_time - sum(profile.sections.values())
+        metrics = [f'sql;dur={profile.sql_time * 1000:.2f};desc="{profile.sql_count} queries"']
+        metrics += [f"{name};dur={elapsed * 1000:.2f}" for name, elapsed in sorted(profile.sections.items())]
+        metrics += [f"app;dur={app * 1000:.2f}", f"total;dur={total * 1000:.2f}"]
+        return ", ".join(metrics)
+
+    def log_slow(self, request, response, profile, total):
+        if profile is None:
+            logger.warning("Медленный запрос %s %s -> %s: %.1f мс", request.method, request.path,
+                           response.status_code, total * 1000)
+            return
+        queries = "".join(
+            f"\n  {duration * 1000:.1f} мс: {sql[:SQL_PREVIEW]}"
+            for duration, _, sql in sorted(profile.top_queries, reverse=True)
+        )
+        logger.warning("Медленный запрос %s %s -> %s: %s%s", request.method, request.path, response.status_code,
+                       self.server_timing(profile, total), queries)
@@ -0,0 +1,11 @@
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    """ Общий клиент Redis процесса (пул соединений создаётся один раз) """
+    return redis.Redis.from_url(settings.REDIS_URL, socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                                socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT)
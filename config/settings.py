@@ -41,7 +41,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'config.db_router.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -72,19 +74,39 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
+    "DEFAULT_RENDERER_CLASSES": [
+        "main.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "main.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    # Ставки config.throttling.ScopedSlidingWindowThrottle по throttle_scope представления
+    "DEFAULT_THROTTLE_RATES": {
+        "list_public": os.getenv("THROTTLE_RATE_LIST_PUBLIC", "120/min"),
+        "register": os.getenv("THROTTLE_RATE_REGISTER", "5/hour"),
+        "login": os.getenv("THROTTLE_RATE_LOGIN", "10/min"),
+        "login_email": os.getenv("THROTTLE_RATE_LOGIN_EMAIL", "5/min"),
+    },
+    # Число обратных прокси перед приложением: IP клиента для ограничений берётся из X-Forwarded-For только
+    # на столько адресов от конца; 0 — только REMOTE_ADDR, иначе клиент подставит любой адрес в заголовок
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 0)),
 }
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # PostgreSQL-бэкенд Django с метриками соединений (config.metrics)
+        'ENGINE': 'config.db_backend',
         'NAME': os.getenv('POSTGRES_DB'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
@@ -94,6 +116,39 @@ DATABASES = {
     }
 }
 
+# Соединения с БД:
+#   persistent (по умолчанию) — процесс web/Celery держит соединение DB_CONN_MAX_AGE секунд с проверкой перед
+#       повторным использованием;
+#   pgbouncer — соединения к PgBouncer в режиме transaction pooling (docker compose --profile pgbouncer), держатся
+#       без ограничения по времени; серверные курсоры (iterator()) используются только внутри транзакции;
+#   none — новое соединение на каждый запрос и задачу.
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'persistent')
+if DB_POOL_MODE == 'none':
+    DATABASES['default'].update({'CONN_MAX_AGE': 0})
+elif DB_POOL_MODE == 'pgbouncer':
+    DATABASES['default'].update({'CONN_MAX_AGE': None, 'CONN_HEALTH_CHECKS': True})
+else:
+    DATABASES['default'].update({'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)), 'CONN_HEALTH_CHECKS': True})
+
+# Реплики для чтения: POSTGRES_REPLICA_HOSTS=replica1,replica2:5433 (остальные параметры — как у default)
+DATABASE_REPLICAS = []
+for index, address in enumerate(filter(None, os.getenv('POSTGRES_REPLICA_HOSTS', '').split(','))):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['config.db_router.PrimaryReplicaRouter']
+# Сколько секунд после записи клиент читает с мастера
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+# Реплика, отстающая сильнее, не используется; отставание проверяется раз в REPLICA_LAG_CHECK_INTERVAL секунд
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 10))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', 5))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -148,6 +203,9 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
+# users.authentication.CachedJWTAuthentication: разобранных токенов в LRU процесса и время жизни пользователя в кэше
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 4096))
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', 60))
 
 EMAIL_HOST = os.getenv('EMAIL_HOST')
 EMAIL_PORT = os.getenv('EMAIL_PORT')
@@ -175,12 +233,65 @@ CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND')
 
+REDIS_URL = os.getenv('REDIS_URL') or CELERY_BROKER_URL or 'redis://localhost:6379/0'
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.25))
+
+# config.profiling.ProfilingMiddleware: доля запросов с замером SQL и участков (заголовок Server-Timing),
+# порог журнала медленных запросов и токен заголовка X-Profile для принудительного замера
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0.01))
+PROFILING_SLOW_REQUEST_MS = float(os.getenv('PROFILING_SLOW_REQUEST_MS', 500))
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN')
+
+# На сколько дней назад можно отметить выполнение привычки
+CHECKIN_BACKFILL_DAYS = int(os.getenv('CHECKIN_BACKFILL_DAYS', 7))
+# Отметки через поток Redis: запрос подтверждается после XADD, в БД их пачками пишет consume_checkins.
+# Сообщение без подтверждения дольше CHECKIN_CLAIM_IDLE_MS забирает другой потребитель
+CHECKIN_WRITE_BEHIND = os.getenv('CHECKIN_WRITE_BEHIND', 'False') == 'True'
+CHECKIN_STREAM = os.getenv('CHECKIN_STREAM', 'checkins')
+CHECKIN_BATCH_SIZE = int(os.getenv('CHECKIN_BATCH_SIZE', 5000))
+CHECKIN_CLAIM_IDLE_MS = int(os.getenv('CHECKIN_CLAIM_IDLE_MS', 60000))
+
+# Статистика пользователей (GET /stats/): изменения учитываются задачей refresh_habit_stats раз в
+# STATS_REFRESH_INTERVAL секунд пачками по STATS_REFRESH_BATCH; записи в обход приложения (COPY) — не позже
+# STATS_MAX_AGE секунд. Лучшее время суток — по выполнениям за STATS_BEST_TIME_DAYS дней
+STATS_REFRESH_INTERVAL = int(os.getenv('STATS_REFRESH_INTERVAL', 60))
+STATS_REFRESH_BATCH = int(os.getenv('STATS_REFRESH_BATCH', 1000))
+STATS_MAX_AGE = int(os.getenv('STATS_MAX_AGE', 24 * 60 * 60))
+STATS_BEST_TIME_DAYS = int(os.getenv('STATS_BEST_TIME_DAYS', 28))
+
+# Календарь привычек (GET /calendar/): период по умолчанию и наибольший, дней
+CALENDAR_DAYS = int(os.getenv('CALENDAR_DAYS', 30))
+CALENDAR_MAX_DAYS = int(os.getenv('CALENDAR_MAX_DAYS', 92))
+# Сколько секунд кэш хранит тело ICS-подписки; после изменения привычек тело строится заново независимо от срока
+CALENDAR_FEED_CACHE_TTL = int(os.getenv('CALENDAR_FEED_CACHE_TTL', 86400))
+
+# Рейтинги публичных привычек в Redis (GET /trending/): очки затухают вдвое за TRENDING_HALF_LIFE секунд.
+# Задача compact_trending раз в TRENDING_COMPACT_INTERVAL секунд удаляет очки ниже TRENDING_MIN_SCORE и всё
+# за пределами TRENDING_MAX_SIZE лучших
+TRENDING_HALF_LIFE = int(os.getenv('TRENDING_HALF_LIFE', 24 * 60 * 60))
+TRENDING_MIN_SCORE = float(os.getenv('TRENDING_MIN_SCORE', 0.05))
+TRENDING_MAX_SIZE = int(os.getenv('TRENDING_MAX_SIZE', 10000))
+TRENDING_COMPACT_INTERVAL = int(os.getenv('TRENDING_COMPACT_INTERVAL', 60 * 60))
+
+# /metrics для Prometheus: требуется Authorization: Bearer <METRICS_TOKEN>; без токена открыт только при DEBUG
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Порт HTTP-экспортёра метрик воркера Celery (не задан — экспортёр не запускается)
+CELERY_METRICS_PORT = os.getenv('CELERY_METRICS_PORT')
+
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 CELERY_BEAT_SCHEDULE = {
     "tg_notification": {
         "task": "main.tasks.tg_notification",
         "schedule": timedelta(seconds=30),
     },
+    "refresh_habit_stats": {
+        "task": "main.tasks.refresh_habit_stats",
+        "schedule": timedelta(seconds=STATS_REFRESH_INTERVAL),
+    },
+    "compact_trending": {
+        "task": "main.tasks.compact_trending",
+        "schedule": timedelta(seconds=TRENDING_COMPACT_INTERVAL),
+    },
 }
 
 TELEGRAM_URL = 'https://api.telegram.org/bot'
@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from redis import RedisError
+from redis.commands.core import Script
+from rest_framework.throttling import SimpleRateThrottle
+
+from config.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Скользящее окно в sorted set: член — запрос, score — время в мс. Очистка, подсчёт и запись
+# выполняются атомарно одним EVALSHA; время берётся у Redis, чтобы часы веб-серверов не влияли на окно.
+# KEYS[1] — ключ окна; ARGV: длина окна в мс, лимит, уникальный суффикс члена.
+SLIDING_WINDOW_LUA = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now_ms - window)
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now_ms, now_ms .. ':' .. ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return {1, 0}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {0, tonumber(oldest[2]) + window - now_ms}
+"""
+
+# Скрипт без привязки к клиенту: SHA считается один раз, клиент передаётся при вызове
+SLIDING_WINDOW_SCRIPT = Script(None, SLIDING_WINDOW_LUA.encode())
+
+# После ошибки Redis ограничение отключается на это время, чтобы не ждать таймаут на каждом запросе
+REDIS_RETRY_INTERVAL = 5
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Ограничение частоты запросов скользящим окном в Redis.
+
+    Ставки задаются в REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] по scope ("10/min").
+    В отличие от SimpleRateThrottle история хранится не в кэше Django целиком,
+    а в sorted set и обновляется атомарным Lua-скриптом. Если Redis недоступен,
+    запросы пропускаются (fail open).
+    """
+    cache_format = "throttle:%(scope)s:%(ident)s"
+    redis_down_until = 0
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return f"ip:{self.get_ident(request)}"
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {"scope": self.scope, "ident": self.get_ident_key(request)}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None or time.monotonic() < SlidingWindowThrottle.redis_down_until:
+            return True
+
+        try:
+            allowed, retry_ms = SLIDING_WINDOW_SCRIPT(
+                keys=[self.key], args=[self.duration * 1000, self.num_requests, os.urandom(6).hex()],
+                client=get_redis())
+        except RedisError as exc:
+            SlidingWindowThrottle.redis_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+            logger.warning("Redis недоступен, ограничение частоты запросов отключено на %s с: %s",
+                           REDIS_RETRY_INTERVAL, exc)
+            return True
+
+        self.retry_after = retry_ms / 1000
+        return bool(allowed)
+
+    def wait(self):
+        return getattr(self, "retry_after", None)
+
+
+class ScopedSlidingWindowThrottle(SlidingWindowThrottle):
+    """ Лимит по throttle_scope представления — отдельная ставка на каждый эндпоинт """
+    scope_attr = "throttle_scope"
+
+    def __init__(self):
+        # Ставка зависит от представления и определяется в allow_request, как в ScopedRateThrottle
+        pass
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+
+class LoginEmailThrottle(SlidingWindowThrottle):
+    """ Лимит попыток входа на один email независимо от IP — против подбора пароля с разных адресов """
+    scope = "login_email"
+
+    def get_cache_key(self, request, view):
+        email = request.data.get(get_user_model().USERNAME_FIELD) if hasattr(request.data, "get") else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        # В ключ попадает хэш, а не сам адрес
+        digest = hashlib.sha256(email.strip().lower().encode()).hexdigest()
+        return self.cache_format % {"scope": self.scope, "ident": digest}
@@ -3,8 +3,11 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from config.metrics import metrics_view
+
 urlpatterns = [
                   path('admin/', admin.site.urls),
                   path('', include('main.urls', namespace='main')),
                   path("users/", include('users.urls', namespace='users')),
+                  path('metrics', metrics_view, name='metrics'),
               ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
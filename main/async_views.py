@@ -0,0 +1,166 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import (APIException, AuthenticationFailed, NotAuthenticated, NotFound, Throttled,
+                                       ValidationError)
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from config.throttling import ScopedSlidingWindowThrottle
+from main.filters import HabitFilter
+from main.mixins import make_etag, parse_requested_fields, set_validator_headers
+from main.models import Habit
+from main.paginators import HabitPaginator
+from main.renderers import FastJSONRenderer
+from main.serializers import HabitValuesSerializer
+
+
+class AsyncHabitView(View):
+    """
+    Базовое асинхронное представление привычек только для чтения.
+
+    Запросы к БД выполняются через async ORM, поэтому под ASGI-сервером
+    медленный запрос не занимает рабочий поток на всё время ответа.
+    Аутентификация, ?fields=, фильтры, пагинация, ETag и формат ответа
+    совпадают с синхронными DRF-представлениями.
+    """
+    http_method_names = ["get", "head", "options"]
+    allow_anonymous = False
+    throttle_classes = []
+    fields_query_param = "fields"
+    renderer = FastJSONRenderer()
+
+    async def authenticate(self, request):
+        for authenticator in self.authenticators:
+            result = await sync_to_async(authenticator.authenticate)(request)
+            if result is not None:
+                return result[0]
+        return AnonymousUser()
+
+    async def check_throttles(self, request):
+        # Классы ограничений DRF работают с rest_framework.request.Request
+        drf_request = Request(request, authenticators=())
+        drf_request.user = request.user
+        for throttle in [throttle_class() for throttle_class in self.throttle_classes]:
+            if not await sync_to_async(throttle.allow_request)(drf_request, self):
+                raise Throttled(throttle.wait())
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+        try:
+            request.user = await self.authenticate(request)
+            if not self.allow_anonymous and not request.user.is_authenticated:
+                raise NotAuthenticated()
+            await self.check_throttles(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return self.handle_exception(request, exc)
+
+    def handle_exception(self, request, exc):
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+        response = self.render(data, exc.status_code)
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)) and self.authenticators:
+            response.headers["WWW-Authenticate"] = self.authenticators[0].authenticate_header(request)
+        if getattr(exc, "wait", None):
+            response.headers["Retry-After"] = "%d" % exc.wait
+        return response
+
+    def render(self, data, status_code=status.HTTP_200_OK):
+        return HttpResponse(self.renderer.render(data), content_type=self.renderer.media_type, status=status_code)
+
+    def get_queryset(self):
+        return Habit.objects.all()
+
+    def get_serializer(self):
+        fields = parse_requested_fields(self.request.GET.get(self.fields_query_param), self.fields_query_param)
+        return HabitValuesSerializer(fields=fields)
+
+    async def get_validators(self):
+        """
+        Возвращает (etag, last_modified); (None, None) — ответ без условной обработки, в том числе когда ресурса
+        нет. По умолчанию валидаторов нет.
+        """
+        return None, None
+
+    async def get_data(self):
+        """ По умолчанию — все строки get_queryset() в формате сериализатора """
+        serializer = self.get_serializer()
+        return serializer.to_representation([row async for row in serializer.get_values(self.get_queryset())])
+
+    async def get(self, request, *args, **kwargs):
+        etag, last_modified = await self.get_validators()
+        if etag is None:
+            return self.render(await self.get_data())
+
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = self.render(await self.get_data())
+        return set_validator_headers(response, etag, timestamp)
+
+
+class AsyncHabitRetrieveView(AsyncHabitView):
+    """ Просмотр одной привычки (async) """
+
+    async def get_validators(self):
+        pk = self.kwargs.get("pk")
+        updated_at = await self.get_queryset().filter(pk=pk).values_list("updated_at", flat=True).afirst()
+        if updated_at is None:
+            return None, None
+        return make_etag(self.request, pk, updated_at.isoformat()), updated_at
+
+    async def get_data(self):
+        serializer = self.get_serializer()
+        row = await serializer.get_values(self.get_queryset().filter(pk=self.kwargs.get("pk"))).afirst()
+        if row is None:
+            raise NotFound()
+        return serializer.to_representation([row])[0]
+
+
+class AsyncHabitListView(AsyncHabitView):
+    """ Список привычек (async) """
+    pagination_class = HabitPaginator
+
+    def get_queryset(self):
+        return Habit.objects.order_by("time", "id")
+
+    def filter_queryset(self, queryset):
+        filterset = HabitFilter(self.request.GET, queryset=queryset, request=self.request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        return filterset.qs
+
+    async def get_validators(self):
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        version = await queryset.aaggregate(count=Count("pk"), last_modified=Max("updated_at"))
+        last_modified = version["last_modified"]
+        stamp = last_modified.isoformat() if last_modified else ""
+        # Без Last-Modified, как HabitListConditionalMixin: удаление не меняет max(updated_at)
+        return make_etag(self.request, version["count"], stamp), None
+
+    async def get_data(self):
+        serializer = self.get_serializer()
+        rows = serializer.get_values(self.filter_queryset(self.get_queryset()))
+        if self.pagination_class is None:
+            return serializer.to_representation([row async for row in rows])
+
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(rows, Request(self.request))
+        if page is None:
+            return serializer.to_representation([row async for row in rows])
+        return paginator.get_paginated_data(serializer.to_representation(page))
+
+
+class AsyncHabitPublicView(AsyncHabitListView):
+    """ Список публичных привычек (async) """
+    allow_anonymous = True
+    pagination_class = None
+    throttle_classes = [ScopedSlidingWindowThrottle]
+    throttle_scope = "list_public"
+
+    def get_queryset(self):
+        return Habit.objects.filter(is_public=True).order_by("time", "id")
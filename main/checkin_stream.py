@@ -0,0 +1,96 @@
+import logging
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from redis import ResponseError
+
+from config.redis_client import get_redis
+from main.completions import record_batch
+from main.models import Habit
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_GROUP = "checkin-writers"
+
+
+def enqueue_checkin(habit, done_at, idempotency_key):
+    """ Добавляет отметку в поток CHECKIN_STREAM и возвращает id сообщения; ошибки Redis не перехватываются """
+    message_id = get_redis().xadd(settings.CHECKIN_STREAM, {
+        "habit": habit.pk, "done_at": done_at.isoformat(), "key": idempotency_key,
+    })
+    return message_id.decode()
+
+
+class CheckinStreamConsumer:
+    """
+    Переносит отметки из потока Redis в БД пачками через record_batch.
+
+    Сообщения подтверждаются (XACK) и удаляются из потока только после фиксации транзакции, поэтому доставка
+    «хотя бы один раз»: после падения процесса или ошибки БД пачка останется в списке ожидающих группы и через
+    claim_idle_ms будет забрана этим или другим потребителем (XAUTOCLAIM). Повторная запись не удваивает
+    выполнения — у каждой отметки есть ключ идемпотентности.
+    """
+
+    def __init__(self, name, batch_size=None, block_ms=1000, claim_idle_ms=None):
+        self.name = name
+        self.stream = settings.CHECKIN_STREAM
+        self.batch_size = batch_size or settings.CHECKIN_BATCH_SIZE
+        self.block_ms = block_ms
+        self.claim_idle_ms = settings.CHECKIN_CLAIM_IDLE_MS if claim_idle_ms is None else claim_idle_ms
+        self.redis = get_redis()
+
+    def ensure_group(self):
+        try:
+            self.redis.xgroup_create(self.stream, CONSUMER_GROUP, id="0", mkstream=True)
+        except ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+    def read(self):
+        """ Пачка сообщений: сначала давно не подтверждённые (свои и упавших потребителей), затем новые """
+        claimed = self.redis.xautoclaim(self.stream, CONSUMER_GROUP, self.name, min_idle_time=self.claim_idle_ms,
+                                        count=self.batch_size)
+        messages = claimed[1]
+        if not messages:
+            response = self.redis.xreadgroup(CONSUMER_GROUP, self.name, {self.stream: ">"}, count=self.batch_size,
+                                             block=self.block_ms)
+            messages = response[0][1] if response else []
+        return messages
+
+    def parse(self, messages):
+        """ (id привычки, время, ключ) по сообщениям; повреждённые сообщения пропускаются с записью в журнал """
+        checkins = []
+        for message_id, fields in messages:
+            # Сообщение, удалённое из потока, но оставшееся в списке ожидающих, приходит без полей
+            if not fields:
+                continue
+            try:
+                habit_id = int(fields[b"habit"])
+                done_at = parse_datetime(fields[b"done_at"].decode())
+                key = fields[b"key"].decode()
+            except (KeyError, ValueError):
+                done_at = None
+            if done_at is None:
+                logger.error("Повреждённая отметка %s в потоке %s: %r", message_id, self.stream, fields)
+                continue
+            checkins.append((habit_id, done_at, key))
+        return checkins
+
+    def flush(self, messages):
+        """ Записывает пачку одной транзакцией, затем подтверждает её; возвращает число отметок в пачке """
+        checkins = self.parse(messages)
+        # Отметки удалённых после XADD привычек отбрасываются
+        habits = (Habit.objects.only("id", "user_id", "frequency", "is_public")
+                  .in_bulk({habit_id for habit_id, _, _ in checkins}))
+        record_batch((habits[habit_id], done_at, key) for habit_id, done_at, key in checkins if habit_id in habits)
+
+        ids = [message_id for message_id, _ in messages]
+        pipeline = self.redis.pipeline()
+        pipeline.xack(self.stream, CONSUMER_GROUP, *ids)
+        pipeline.xdel(self.stream, *ids)
+        pipeline.execute()
+        return len(checkins)
+
+    def run_once(self):
+        messages = self.read()
+        return self.flush(messages) if messages else 0
@@ -0,0 +1,226 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from main.models import (PERIOD_UNITS, HabitCompletion, HabitDailyRollup, HabitProgress, HabitWeeklyRollup,
+                         period_index)
+from main.pgcopy import copy_rows
+from main.stats import mark_stats_changed
+from main.trending import bump_on_commit
+
+COMPLETION_FIELDS = ("habit", "user", "done_at", "day", "idempotency_key", "created_at")
+
+# Сводки обновляются одним INSERT ... ON CONFLICT на пачку; xmax = 0 у только что вставленной строки
+DAILY_UPSERT_SQL = """
+INSERT INTO {table} AS rollup (habit_id, day, completions, last_done_at)
+SELECT * FROM unnest(%s::bigint[], %s::date[], %s::integer[], %s::timestamptz[])
+ON CONFLICT (habit_id, day) DO UPDATE
+SET completions = rollup.completions + EXCLUDED.completions,
+    last_done_at = GREATEST(rollup.last_done_at, EXCLUDED.last_done_at)
+RETURNING habit_id, day, rollup.xmax = 0
+"""
+WEEKLY_UPSERT_SQL = """
+INSERT INTO {table} AS rollup (habit_id, week, completions, days)
+SELECT * FROM unnest(%s::bigint[], %s::date[], %s::integer[], %s::smallint[])
+ON CONFLICT (habit_id, week) DO UPDATE
+SET completions = rollup.completions + EXCLUDED.completions, days = rollup.days + EXCLUDED.days
+RETURNING habit_id, week, rollup.xmax = 0
+"""
+PROGRESS_INSERT_SQL = """
+INSERT INTO {table} (habit_id, period_unit, total_completions, periods_done, current_streak, longest_streak)
+SELECT habit_id, period_unit, 0, 0, 0, 0 FROM unnest(%s::bigint[], %s::varchar[]) AS data(habit_id, period_unit)
+ON CONFLICT (habit_id) DO NOTHING
+"""
+# Уже записанные ключи пачки ищутся по уникальному индексу (habit_id, idempotency_key)
+RECORDED_KEYS_SQL = """
+SELECT completion.habit_id, completion.idempotency_key
+FROM {table} AS completion
+JOIN unnest(%s::bigint[], %s::varchar[]) AS batch(habit_id, idempotency_key)
+    ON completion.habit_id = batch.habit_id AND completion.idempotency_key = batch.idempotency_key
+"""
+# bulk_update строит CASE WHEN на каждую строку и поле — на пачках в тысячи строк это секунды
+PROGRESS_UPDATE_SQL = """
+UPDATE {table} AS progress
+SET period_unit = data.period_unit, total_completions = data.total_completions, periods_done = data.periods_done,
+    first_period = data.first_period, last_period = data.last_period, current_streak = data.current_streak,
+    longest_streak = data.longest_streak, last_done_at = data.last_done_at
+FROM unnest(%s::bigint[], %s::varchar[], %s::integer[], %s::integer[], %s::integer[], %s::integer[], %s::integer[],
+            %s::integer[], %s::timestamptz[])
+    AS data(habit_id, period_unit, total_completions, periods_done, first_period, last_period, current_streak,
+            longest_streak, last_done_at)
+WHERE progress.habit_id = data.habit_id
+"""
+PROGRESS_FIELDS = ("habit_id", "period_unit", "total_completions", "periods_done", "first_period", "last_period",
+                   "current_streak", "longest_streak", "last_done_at")
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_bounds(day):
+    start = day.replace(day=1)
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+
+def period_unit_of(habit):
+    return PERIOD_UNITS.get(habit.frequency, "day")
+
+
+def execute_columns(sql, model, columns):
+    """ Выполняет запрос по таблице модели со столбцами-массивами для unnest """
+    cursor = connection.cursor()
+    cursor.execute(sql.format(table=connection.ops.quote_name(model._meta.db_table)), columns)
+    return cursor
+
+
+def upsert(sql, model, columns):
+    """ Выполняет upsert сводки; возвращает ключи (habit_id, дата) новых строк """
+    with execute_columns(sql, model, columns) as cursor:
+        return {(habit_id, day) for habit_id, day, inserted in cursor.fetchall() if inserted}
+
+
+def lock_progress(habits):
+    """ Создаёт недостающие HabitProgress и блокирует строки пачки в порядке habit_id (без взаимных блокировок) """
+    ids = sorted(habits)
+    execute_columns(PROGRESS_INSERT_SQL, HabitProgress,
+                    [ids, [period_unit_of(habits[habit_id]) for habit_id in ids]]).close()
+    return {progress.habit_id: progress
+            for progress in HabitProgress.objects.select_for_update().filter(habit_id__in=ids).order_by("habit_id")}
+
+
+def new_month_periods(habit_ids, new_days):
+    """ Месяцы, в которых все дни с выполнением — новые: {(habit_id, период)} """
+    months = defaultdict(set)
+    days = [day for _, day in new_days]
+    existing = (HabitDailyRollup.objects
+                .filter(habit_id__in=habit_ids, day__gte=month_bounds(min(days))[0], day__lt=month_bounds(max(days))[1])
+                .values_list("habit_id", "day"))
+    for habit_id, day in existing:
+        months[habit_id, period_index("month", day)].add((habit_id, day) in new_days)
+    return {key for key, flags in months.items() if all(flags)}
+
+
+def rebuild_streaks(progress):
+    """ Пересчёт серий по дневным сводкам — только для отметок задним числом и смены периодичности """
+    days = HabitDailyRollup.objects.filter(habit_id=progress.habit_id).values_list("day", flat=True)
+    periods = sorted({period_index(progress.period_unit, day) for day in days})
+    progress.periods_done = len(periods)
+    progress.first_period = periods[0] if periods else None
+    progress.last_period = periods[-1] if periods else None
+    progress.current_streak = progress.longest_streak = 0
+    previous = None
+    for period in periods:
+        progress.current_streak = progress.current_streak + 1 if previous == period - 1 else 1
+        progress.longest_streak = max(progress.longest_streak, progress.current_streak)
+        previous = period
+
+
+def advance_streaks(progress, periods):
+    """ Продлевает серии новыми периодами за O(1) на период; False, если период раньше последнего """
+    for period in sorted(periods):
+        if progress.last_period is not None and period < progress.last_period:
+            return False
+        if progress.last_period is not None and period == progress.last_period + 1:
+            progress.current_streak += 1
+        else:
+            progress.current_streak = 1
+        progress.periods_done += 1
+        progress.first_period = period if progress.first_period is None else progress.first_period
+        progress.last_period = period
+        progress.longest_streak = max(progress.longest_streak, progress.current_streak)
+    return True
+
+
+def record_batch(entries):
+    """
+    Записывает пачку выполнений разных привычек одной транзакцией и обновляет сводки за день и неделю и
+    HabitProgress.
+
+    entries — кортежи (привычка, время выполнения, ключ идемпотентности или None); у привычки нужны id, user_id,
+    frequency и is_public. Отметка с ключом, уже записанным для этой привычки (раньше или в этой же пачке),
+    пропускается, поэтому повторная доставка пачки ничего не удваивает. Строки HabitProgress пачки блокируются до
+    конца транзакции: отметки одной привычки применяются по очереди. Журнал пишется через COPY, сводки — одним
+    upsert на таблицу. Серия продлевается за O(1) на новый период; период раньше последнего (задним числом) или
+    смена периодичности пересчитывают серии по дневным сводкам. После фиксации отметки публичных привычек
+    добавляют очки в рейтинг completions. Возвращает {habit_id: HabitProgress}.
+    """
+    habits = {}
+    rows = []
+    keys = set()
+    for habit, moment, key in entries:
+        habits[habit.pk] = habit
+        if key is not None:
+            if (habit.pk, key) in keys:
+                continue
+            keys.add((habit.pk, key))
+        rows.append((habit.pk, moment, timezone.localdate(moment), key))
+    if not habits:
+        return {}
+
+    with transaction.atomic():
+        progresses = lock_progress(habits)
+        if keys:
+            with execute_columns(RECORDED_KEYS_SQL, HabitCompletion, list(map(list, zip(*keys)))) as cursor:
+                recorded = set(cursor.fetchall())
+            rows = [row for row in rows if row[3] is None or (row[0], row[3]) not in recorded]
+        rows.sort(key=lambda row: (row[0], row[1]))
+
+        new_days = set()
+        new_weeks = set()
+        if rows:
+            now = timezone.now()
+            copy_rows(HabitCompletion, COMPLETION_FIELDS, (
+                (habit_id, habits[habit_id].user_id, moment, day, key, now) for habit_id, moment, day, key in rows))
+
+            # Строки отсортированы по времени, поэтому последнее значение — самое позднее выполнение за день
+            per_day = Counter((habit_id, day) for habit_id, _, day, _ in rows)
+            last_by_day = {(habit_id, day): moment for habit_id, moment, day, _ in rows}
+            new_days = upsert(DAILY_UPSERT_SQL, HabitDailyRollup, list(map(list, zip(*(
+                (habit_id, day, count, last_by_day[habit_id, day]) for (habit_id, day), count in per_day.items())))))
+
+            per_week = Counter((habit_id, week_start(day)) for habit_id, _, day, _ in rows)
+            days_per_week = Counter((habit_id, week_start(day)) for habit_id, day in new_days)
+            new_weeks = upsert(WEEKLY_UPSERT_SQL, HabitWeeklyRollup, list(map(list, zip(*(
+                (habit_id, week, count, days_per_week[habit_id, week])
+                for (habit_id, week), count in per_week.items())))))
+            mark_stats_changed({habits[habit_id].user_id for habit_id, _, _, _ in rows})
+            bump_on_commit("completions", Counter(habit_id for habit_id, _, _, _ in rows if habits[habit_id].is_public))
+
+        new_periods = defaultdict(set)
+        month_days = set()
+        for habit_id, day in new_days:
+            unit = period_unit_of(habits[habit_id])
+            if unit == "day":
+                new_periods[habit_id].add(period_index(unit, day))
+            elif unit == "month":
+                month_days.add((habit_id, day))
+        for habit_id, week in new_weeks:
+            if period_unit_of(habits[habit_id]) == "week":
+                new_periods[habit_id].add(period_index("week", week))
+        if month_days:
+            for habit_id, period in new_month_periods({habit_id for habit_id, _ in month_days}, month_days):
+                new_periods[habit_id].add(period)
+
+        totals = Counter(row[0] for row in rows)
+        last_done = {habit_id: moment for habit_id, moment, _, _ in rows}
+        for habit_id, progress in progresses.items():
+            unit = period_unit_of(habits[habit_id])
+            progress.total_completions += totals[habit_id]
+            moment = last_done.get(habit_id)
+            if moment is not None and (progress.last_done_at is None or moment > progress.last_done_at):
+                progress.last_done_at = moment
+            rebuild = progress.period_unit != unit
+            progress.period_unit = unit
+            if not advance_streaks(progress, new_periods[habit_id]) or rebuild:
+                rebuild_streaks(progress)
+        execute_columns(PROGRESS_UPDATE_SQL, HabitProgress, [
+            [getattr(progress, name) for progress in progresses.values()] for name in PROGRESS_FIELDS]).close()
+    return progresses
+
+
+def record_completions(habit, moments, idempotency_key=None):
+    """ Записывает выполнения одной привычки (см. record_batch); возвращает её HabitProgress """
+    return record_batch((habit, moment, idempotency_key) for moment in moments)[habit.pk]
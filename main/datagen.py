@@ -0,0 +1,181 @@
+import logging
+import random
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from redis import RedisError
+
+from main.models import Habit, HabitCompletion, HabitDailyRollup, HabitProgress, HabitWeeklyRollup
+from main.pgcopy import copy_rows, reserve_ids
+from main.trending import BOARDS, compact
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ("бег", "чтение книги", "медитация", "зарядка", "прогулка с собакой", "уборка", "изучение английского",
+           "йога", "планирование дня", "контрастный душ", "растяжка", "дневник благодарности", "отжимания",
+           "стакан воды", "разбор почты", "сон до 23:00")
+PLEASENT_ACTIONS = ("чашка кофе", "любимый сериал", "ванна", "прогулка в парке", "музыка", "игра на гитаре",
+                    "десерт", "звонок другу")
+PLACES = ("дом", "парк", "офис", "спортзал", "набережная", "балкон", "библиотека", "кухня", "бассейн", "дача")
+REWARDS = ("кусочек шоколада", "серия сериала", "10 минут в телефоне", "кофе с собой", "новая книга")
+
+# Время привычек: утренний и вечерний пики (среднее в минутах от полуночи, отклонение, доля) и равномерный фон днём
+TIME_PEAKS = ((7 * 60, 60, 0.45), (20 * 60 + 30, 90, 0.35))
+DAYTIME = (9 * 60, 19 * 60)
+FREQUENCIES = (("daily", 0.7), ("weekly", 0.25), ("monthly", 0.05))
+
+USER_FIELDS = ["id", "password", "is_superuser", "first_name", "last_name", "email", "is_staff", "is_active",
+               "date_joined"]
+HABIT_FIELDS = ["id", "user", "place", "time", "action", "is_pleasent", "associated_habit", "frequency",
+                "frequency_in_days", "reward", "time_doing", "is_public", "updated_at", "created_at"]
+
+
+class HabitDatasetGenerator:
+    """
+    Синтетические пользователи и привычки для нагрузочных тестов.
+
+    Данные полностью определяются seed: одинаковые параметры дают одинаковые строки (id зависят только от
+    текущего значения последовательностей). Пользователи получают email {email_prefix}{номер}@example.com
+    и общий пароль. У каждого пользователя pleasent_ratio привычек приятные, часть остальных (link_ratio)
+    ссылается на его приятную привычку, остальные с вероятностью 0.5 получают вознаграждение — все строки
+    проходят правила main.rules. Запись идёт через COPY порциями по batch_size привычек, каждая порция
+    в своей транзакции.
+    """
+
+    def __init__(self, users, habits_per_user, seed=1, email_prefix=None, password="loadtest",
+                 public_ratio=0.2, pleasent_ratio=0.3, link_ratio=0.5, batch_size=100_000):
+        self.users = users
+        self.habits_per_user = habits_per_user
+        self.seed = seed
+        self.email_prefix = email_prefix or f"load{seed}-"
+        self.password = password
+        self.public_ratio = public_ratio
+        self.pleasent_ratio = pleasent_ratio
+        self.link_ratio = link_ratio
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        # Даты отсчитываются от фиксированного момента, а не от текущего времени
+        self.epoch = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+    def email(self, number):
+        return f"{self.email_prefix}{number}@example.com"
+
+    def random_time(self):
+        rng = self.rng
+        roll = rng.random()
+        for mean, deviation, share in TIME_PEAKS:
+            if roll < share:
+                minutes = int(rng.gauss(mean, deviation)) % (24 * 60)
+                break
+            roll -= share
+        else:
+            minutes = rng.randrange(*DAYTIME)
+        return time(minutes // 60, minutes % 60)
+
+    def random_frequency(self):
+        roll = self.rng.random()
+        for frequency, share in FREQUENCIES:
+            if roll < share:
+                return frequency
+            roll -= share
+        return FREQUENCIES[0][0]
+
+    def user_rows(self, first_id):
+        # Хеш пароля считается один раз: PBKDF2 на каждого пользователя занял бы большую часть времени генерации
+        password = make_password(self.password)
+        for number in range(self.users):
+            joined = self.epoch + timedelta(seconds=self.rng.randrange(365 * 24 * 3600))
+            yield [first_id + number, password, False, "", "", self.email(number), False, True, joined]
+
+    def habit_rows(self, user_id, first_id):
+        rng = self.rng
+        pleasent_count = round(self.habits_per_user * self.pleasent_ratio)
+        pleasent_ids = range(first_id, first_id + pleasent_count)
+        for index in range(self.habits_per_user):
+            is_pleasent = index < pleasent_count
+            associated = reward = None
+            if is_pleasent:
+                action = rng.choice(PLEASENT_ACTIONS)
+            else:
+                action = rng.choice(ACTIONS)
+                if pleasent_ids and rng.random() < self.link_ratio:
+                    associated = rng.choice(pleasent_ids)
+                elif rng.random() < 0.5:
+                    reward = rng.choice(REWARDS)
+            frequency = self.random_frequency()
+            row = [
+                first_id + index, user_id, rng.choice(PLACES), self.random_time(), action, is_pleasent, associated,
+                frequency, rng.randint(1, 7) if frequency == "weekly" else None, reward,
+                timedelta(seconds=rng.choice((30, 60, 60, 90, 120)) - rng.randrange(10)),
+                rng.random() < self.public_ratio,
+                self.epoch + timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+            ]
+            # created_at совпадает с updated_at
+            row.append(row[-1])
+            yield row
+
+    def run(self, progress=None):
+        """ Создаёт данные; progress(создано_привычек) вызывается после каждой порции. Возвращает число привычек """
+        if not self.users:
+            return 0
+        first_user = reserve_ids(User, self.users)
+        with transaction.atomic():
+            copy_rows(User, USER_FIELDS, self.user_rows(first_user))
+
+        total = self.users * self.habits_per_user
+        if not total:
+            return 0
+        next_habit = reserve_ids(Habit, total)
+        # Порция — целые пользователи, поэтому связанные привычки всегда в той же транзакции
+        users_per_batch = max(1, self.batch_size // self.habits_per_user)
+        created = 0
+        for start in range(0, self.users, users_per_batch):
+            rows = []
+            for number in range(start, min(start + users_per_batch, self.users)):
+                rows.extend(self.habit_rows(first_user + number, next_habit))
+                next_habit += self.habits_per_user
+            with transaction.atomic():
+                copy_rows(Habit, HABIT_FIELDS, rows)
+            created += len(rows)
+            if progress:
+                progress(created)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {User._meta.db_table}, {Habit._meta.db_table}")
+        return created
+
+    def clear(self):
+        """
+        Удаляет пользователей с email_prefix и их привычки. Возвращает число удалённых привычек.
+
+        Сборщик ORM загрузил бы каждую привычку ради сигналов, поэтому зависимые таблицы (отметки, сводки,
+        прогресс) и сами привычки удаляются запросами по подзапросу id. Через ORM удаляются только чужие
+        привычки, связанные с удаляемыми (associated_habit, on_delete=CASCADE): их сигналы отмечают статистику
+        и календари владельцев. Статистика и подписки самих пользователей удаляются каскадом вместе с ними,
+        рейтинги популярных привычек сжимаются после фиксации.
+        """
+        users = User.objects.filter(email__startswith=self.email_prefix, email__endswith="@example.com")
+        habits = Habit.objects.filter(user__in=users)
+        with transaction.atomic():
+            Habit.objects.filter(associated_habit__in=habits).exclude(user__in=users).delete()
+            for model in (HabitCompletion, HabitDailyRollup, HabitWeeklyRollup, HabitProgress):
+                model.objects.filter(habit__in=habits).delete()
+            # У Habit.user on_delete=SET_NULL: каскадом от пользователей привычки не удалились бы
+            sql, params = habits.values("id").query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {Habit._meta.db_table} WHERE id IN ({sql})", params)
+                deleted = cursor.rowcount
+            users.delete()
+            transaction.on_commit(compact_boards)
+        return deleted
+
+
+def compact_boards():
+    """ Убирает удалённые привычки из рейтингов; рейтинг не обязателен, поэтому ошибки Redis только в журнал """
+    for board in BOARDS:
+        try:
+            compact(board)
+        except RedisError as exc:
+            logger.warning("Redis недоступен, рейтинг %s не сжат: %s", board, exc)
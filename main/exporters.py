@@ -0,0 +1,64 @@
+import csv
+
+from django.db import transaction
+
+from main.renderers import FastJSONRenderer
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает записанную строку вместо буферизации."""
+
+    def write(self, value):
+        return value
+
+
+def iter_chunks(lines, chunk_size):
+    """Склеивает строки в блоки по chunk_size, чтобы не отдавать клиенту тысячи мелких кусков."""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield b"".join(chunk)
+            chunk = []
+    if chunk:
+        yield b"".join(chunk)
+
+
+def ndjson_lines(items):
+    renderer = FastJSONRenderer()
+    for item in items:
+        yield renderer.render(item) + b"\n"
+
+
+def csv_lines(items, field_names):
+    writer = csv.writer(Echo())
+    yield writer.writerow(field_names).encode()
+    for item in items:
+        yield writer.writerow(["" if item[name] is None else item[name] for name in field_names]).encode()
+
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "habits.ndjson"),
+    "csv": ("text/csv; charset=utf-8", "habits.csv"),
+}
+
+
+def export_habits(serializer, rows, export_format, chunk_size):
+    """Генератор тела ответа: строки из values_list() в NDJSON или CSV блоками по chunk_size."""
+    items = serializer.iter_representation(rows)
+    if export_format == "csv":
+        lines = csv_lines(items, serializer.field_names)
+    else:
+        lines = ndjson_lines(items)
+    return iter_chunks(lines, chunk_size)
+
+
+def atomic_stream(chunks, using):
+    """
+    Отдаёт блоки внутри транзакции.
+
+    Вне транзакции Django объявляет серверный курсор WITH HOLD, и PostgreSQL материализует всю выборку при
+    коммите; в транзакции курсор живёт до её конца, что работает и через PgBouncer в режиме transaction pooling.
+    """
+    with transaction.atomic(using=using):
+        yield from chunks
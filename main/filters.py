@@ -0,0 +1,13 @@
+from django_filters import rest_framework as filters
+
+from main.models import Habit
+
+
+class HabitFilter(filters.FilterSet):
+    """ Фильтры списков привычек: интервал времени, периодичность, приятность и публичность """
+    time_after = filters.TimeFilter(field_name="time", lookup_expr="gte", label="Время не раньше")
+    time_before = filters.TimeFilter(field_name="time", lookup_expr="lte", label="Время не позже")
+
+    class Meta:
+        model = Habit
+        fields = ("frequency", "is_pleasent", "is_public")
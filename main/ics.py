@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import uuid
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import quote_etag
+from redis import RedisError
+
+from main.models import CalendarFeed, Habit
+from main.occurrences import interval_days
+
+ICS_CONTENT_TYPE = "text/calendar; charset=utf-8"
+
+# Строки ICS не длиннее 75 октетов без перевода строки (RFC 5545, 3.1)
+MAX_LINE_OCTETS = 75
+
+logger = logging.getLogger(__name__)
+
+FEED_FIELDS = ("id", "action", "place", "time", "time_doing", "frequency", "frequency_in_days", "reward",
+               "created_at", "updated_at")
+
+
+def feed_cache_key(token):
+    return f"ics:feed:{token}"
+
+
+def feed_version_key(user_id):
+    return f"ics:version:{user_id}"
+
+
+def escape_text(value):
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def fold_line(line):
+    """ Переносит строку по 75 октетов, не разрезая символы UTF-8; продолжение начинается с пробела """
+    parts = []
+    limit = MAX_LINE_OCTETS
+    while len(line.encode()) > limit:
+        cut = limit
+        while len(line[:cut].encode()) > limit:
+            cut -= 1
+        parts.append(line[:cut])
+        line = line[cut:]
+        limit = MAX_LINE_OCTETS - 1
+    parts.append(line)
+    return "\r\n ".join(parts)
+
+
+def format_utc(moment):
+    return moment.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def format_start(day, time):
+    """ DTSTART в TIME_ZONE: повторения остаются в то же местное время и после перехода на летнее время """
+    if settings.TIME_ZONE == "UTC":
+        return f"DTSTART:{day:%Y%m%d}T{time:%H%M%S}Z"
+    return f"DTSTART;TZID={settings.TIME_ZONE}:{day:%Y%m%d}T{time:%H%M%S}"
+
+
+def recurrence_rule(frequency, frequency_in_days, anchor):
+    """
+    RRULE по тому же расписанию, что и календарь (main.occurrences): интервал interval_days от даты отсчёта,
+    ежемесячная — в день месяца даты отсчёта, а в коротких месяцах в последний день (BYSETPOS=-1 выбирает
+    наибольший из существующих дней 28..anchor).
+    """
+    step = interval_days(frequency, frequency_in_days)
+    if step is None:
+        if anchor.day <= 28:
+            return "RRULE:FREQ=MONTHLY"
+        return f"RRULE:FREQ=MONTHLY;BYMONTHDAY={','.join(map(str, range(28, anchor.day + 1)))};BYSETPOS=-1"
+    if step == 7:
+        return "RRULE:FREQ=WEEKLY"
+    return "RRULE:FREQ=DAILY" + (f";INTERVAL={step}" if step > 1 else "")
+
+
+def render_calendar(rows, name="Привычки"):
+    """ Тело ICS: по событию с правилом повторения на каждую строку FEED_FIELDS """
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//habits//calendar feed//RU", "CALSCALE:GREGORIAN",
+             "METHOD:PUBLISH", f"X-WR-CALNAME:{escape_text(name)}"]
+    for (habit_id, action, place, time, time_doing, frequency, frequency_in_days, reward, created_at,
+         updated_at) in rows:
+        anchor = timezone.localdate(created_at)
+        lines += ["BEGIN:VEVENT", f"UID:habit-{habit_id}@habits", f"DTSTAMP:{format_utc(updated_at)}",
+                  format_start(anchor, time), recurrence_rule(frequency, frequency_in_days, anchor),
+                  f"SUMMARY:{escape_text(action)}", f"LOCATION:{escape_text(place)}"]
+        if time_doing:
+            lines.append(f"DURATION:PT{int(time_doing.total_seconds())}S")
+        if reward:
+            lines.append(f"DESCRIPTION:{escape_text(f'Вознаграждение: {reward}')}")
+        lines.append("END:VEVENT")
+    lines.append("END:VCALENDAR")
+    return "".join(f"{fold_line(line)}\r\n" for line in lines)
+
+
+def feed_version(user_id):
+    """ Текущая версия календаря пользователя; отсутствующая (вытесненная из кэша) заводится заново """
+    key = feed_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def forget_feeds(user_ids):
+    """
+    Новая версия календарей пользователей после фиксации транзакции: закэшированные тела прежних версий
+    больше не отдаются и будут построены заново при следующем запросе.
+    """
+    keys = {feed_version_key(user_id): uuid.uuid4().hex for user_id in set(user_ids) if user_id is not None}
+    if keys:
+        transaction.on_commit(lambda: update_cache(cache.set_many, keys, None))
+
+
+def forget_token(token):
+    """ Отозванный токен перестаёт открывать календарь сразу после фиксации транзакции """
+    transaction.on_commit(lambda: update_cache(cache.delete, feed_cache_key(token)))
+
+
+def update_cache(method, *args):
+    """
+    Запись в кэш календарей, которая не превращает недоступный Redis в ошибку запроса. Если не удался сброс после
+    фиксации, прежнее тело календаря отдаётся до истечения CALENDAR_FEED_CACHE_TTL.
+    """
+    try:
+        method(*args)
+    except RedisError as exc:
+        logger.warning("Redis недоступен, кэш календарей не обновлён: %s", exc)
+
+
+def build_feed(user_id):
+    body = render_calendar(Habit.objects.filter(user_id=user_id).values_list(*FEED_FIELDS).order_by("id"))
+    return quote_etag(hashlib.md5(body.encode(), usedforsecurity=False).hexdigest()), body
+
+
+def cached_feed(token):
+    """
+    (ETag, тело ICS) по токену подписки или None, если токена нет.
+
+    Тело хранится в кэше вместе с версией календаря, при которой построено: попадание — два чтения кэша без
+    обращения к БД. Версия читается до привычек, поэтому изменение, зафиксированное во время построения, сменит
+    версию и тело построится заново. Пока Redis недоступен, тело строится при каждом запросе.
+    """
+    try:
+        return read_through(token)
+    except RedisError as exc:
+        logger.warning("Redis недоступен, календарь строится без кэша: %s", exc)
+    user_id = CalendarFeed.objects.filter(token=token).values_list("user_id", flat=True).first()
+    return None if user_id is None else build_feed(user_id)
+
+
+def read_through(token):
+    entry = cache.get(feed_cache_key(token))
+    if entry is not None:
+        user_id, version, etag, body = entry
+        if cache.get(feed_version_key(user_id)) == version:
+            return etag, body
+
+    user_id = CalendarFeed.objects.filter(token=token).values_list("user_id", flat=True).first()
+    if user_id is None:
+        return None
+    version = feed_version(user_id)
+    etag, body = build_feed(user_id)
+    update_cache(cache.set, feed_cache_key(token), (user_id, version, etag, body), settings.CALENDAR_FEED_CACHE_TTL)
+    return etag, body
@@ -0,0 +1,217 @@
+import codecs
+import csv
+import json
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_duration, parse_time
+
+from main.ics import forget_feeds
+from main.models import Habit
+from main.pgcopy import copy_rows, supports_copy
+from main.renderers import orjson
+from main.rules import as_model_attrs, habit_rules
+from main.stats import mark_stats_changed
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+TRUE_VALUES = {"true", "1", "yes", "on", "да"}
+FALSE_VALUES = {"false", "0", "no", "off", "нет", ""}
+FREQUENCY_CHOICES = {value for value, _ in Habit._meta.get_field("frequency").choices}
+
+json_loads = orjson.loads if orjson else json.loads
+
+
+def iter_ndjson(stream):
+    """Построчно читает NDJSON; строка, которую не удалось разобрать, возвращается как ошибка."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json_loads(line)
+        except ValueError as exc:
+            yield {"__error__": f"Некорректный JSON: {exc}"}
+            continue
+        yield row if isinstance(row, dict) else {"__error__": "Строка должна быть JSON-объектом."}
+
+
+def iter_csv(stream):
+    """Читает CSV с заголовком; пустые ячейки считаются отсутствующими значениями."""
+    reader = csv.DictReader(codecs.iterdecode(stream, "utf-8-sig"))
+    for row in reader:
+        yield {key: value for key, value in row.items() if key and value not in (None, "")}
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError("Ожидается логическое значение.")
+
+
+def parse_int(value):
+    if isinstance(value, bool):
+        raise ValueError("Ожидается целое число.")
+    return int(value)
+
+
+def parse_int_field(name):
+    """ Целое в пределах колонки поля модели: значение вне диапазона отклонило бы COPY всей порции (DataError) """
+    field = Habit._meta.get_field(name)
+    internal_type = (field.target_field if field.is_relation else field).get_internal_type()
+    min_value, max_value = connection.ops.integer_field_range(internal_type)
+
+    def parse(value):
+        value = parse_int(value)
+        if not min_value <= value <= max_value:
+            raise ValueError(f"Ожидается целое число от {min_value} до {max_value}.")
+        return value
+    return parse
+
+
+def parse_text(max_length):
+    def parse(value):
+        value = str(value)
+        if len(value) > max_length:
+            raise ValueError(f"Не более {max_length} символов.")
+        return value
+    return parse
+
+
+def parse_frequency(value):
+    if value not in FREQUENCY_CHOICES:
+        raise ValueError(f"Допустимые значения: {', '.join(sorted(FREQUENCY_CHOICES))}.")
+    return value
+
+
+def parse_time_value(value):
+    parsed = parse_time(str(value))
+    if parsed is None:
+        raise ValueError("Ожидается время в формате hh:mm[:ss].")
+    return parsed
+
+
+def parse_duration_value(value):
+    parsed = parse_duration(str(value))
+    if parsed is None:
+        raise ValueError("Ожидается длительность в формате [DD] [HH:[MM:]]ss.")
+    return parsed
+
+
+FIELD_PARSERS = {
+    "place": parse_text(100),
+    "time": parse_time_value,
+    "action": parse_text(100),
+    "is_pleasent": parse_bool,
+    "associated_habit": parse_int_field("associated_habit"),
+    "frequency": parse_frequency,
+    "frequency_in_days": parse_int_field("frequency_in_days"),
+    "reward": parse_text(100),
+    "time_doing": parse_duration_value,
+    "is_public": parse_bool,
+}
+REQUIRED_FIELDS = ("place", "time", "action", "time_doing")
+# search_vector заполняет триггер БД
+COPY_FIELDS = [field.name for field in Habit._meta.concrete_fields
+               if not field.primary_key and field.name != "search_vector"]
+FIELD_DEFAULTS = {name: Habit._meta.get_field(name).get_default() for name in FIELD_PARSERS}
+
+
+def parse_row(raw):
+    """Приводит сырую строку к значениям полей модели. Возвращает (attrs, errors)."""
+    if "__error__" in raw:
+        return None, {"non_field_errors": [raw["__error__"]]}
+
+    attrs, errors = {}, {}
+    for name, parse in FIELD_PARSERS.items():
+        value = raw.get(name)
+        if value is None:
+            continue
+        try:
+            attrs[name] = parse(value)
+        except (TypeError, ValueError) as exc:
+            errors[name] = [str(exc)]
+    for name in REQUIRED_FIELDS:
+        if name not in attrs and name not in errors:
+            errors[name] = ["Обязательное поле."]
+    return attrs, errors
+
+
+class HabitImporter:
+    """
+    Потоковый импорт привычек.
+
+    Строки разбираются и проверяются порциями по chunk_size через
+    HabitRuleEngine (связанные привычки порции читаются одним запросом;
+    связать можно только свою или публичную привычку).
+    Корректные строки записываются в транзакции порции через COPY (на
+    PostgreSQL) или bulk_create. Отклонённые строки собираются в отчёт
+    (не более max_reported).
+    """
+
+    def __init__(self, user, chunk_size=5000, max_reported=1000):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.max_reported = max_reported
+        self.created = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, row_number, errors):
+        self.rejected += 1
+        if len(self.errors) < self.max_reported:
+            self.errors.append({"row": row_number, "errors": errors})
+
+    def import_chunk(self, chunk):
+        # Правила всей порции проверяются одним проходом, связанные привычки читаются одним запросом
+        rule_errors = habit_rules.validate_many([attrs for _, attrs in chunk], user=self.user)
+        valid = []
+        for (row_number, attrs), errors in zip(chunk, rule_errors):
+            if errors:
+                self.reject(row_number, errors)
+            else:
+                valid.append(attrs)
+
+        with transaction.atomic():
+            self.write(valid)
+            mark_stats_changed([self.user.pk])
+            forget_feeds([self.user.pk])
+        self.created += len(valid)
+
+    def write(self, valid):
+        if not supports_copy():
+            Habit.objects.bulk_create([Habit(user=self.user, **as_model_attrs(attrs)) for attrs in valid],
+                                      batch_size=self.chunk_size)
+            return
+        # COPY обходит ORM, поэтому user, даты и значения по умолчанию заполняются здесь
+        now = timezone.now()
+        defaults = {**FIELD_DEFAULTS, "user": self.user.pk, "updated_at": now, "created_at": now}
+        copy_rows(Habit, COPY_FIELDS, ([attrs.get(name, defaults[name]) for name in COPY_FIELDS] for attrs in valid))
+
+    def run(self, rows):
+        chunk = []
+        for row_number, raw in enumerate(rows, start=1):
+            attrs, errors = parse_row(raw)
+            if errors:
+                self.reject(row_number, errors)
+                continue
+            chunk.append((row_number, attrs))
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        return self.report()
+
+    def report(self):
+        errors = sorted(self.errors, key=lambda error: error["row"])
+        return {"created": self.created, "rejected": self.rejected, "errors": errors}
+
+
+def read_rows(stream, import_format):
+    return iter_csv(stream) if import_format == "csv" else iter_ndjson(stream)
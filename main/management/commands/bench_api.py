@@ -0,0 +1,265 @@
+import io
+import json
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from config.throttling import SlidingWindowThrottle
+from main.models import Habit
+from users.models import User
+from users.serializers import MyTokenObtainPairSerializer
+
+FLOWS = ("login", "create", "retrieve", "update", "list", "public")
+BASELINE_PATH = settings.BASE_DIR / "benchmarks" / "api_baseline.json"
+# Допуски по умолчанию: падение пропускной способности, рост p95 (доли) и лишние SQL-запросы на запрос
+DEFAULT_THRESHOLDS = {"throughput": 0.2, "latency": 0.25, "queries": 0.5}
+BENCH_HOST = "bench.localhost"
+
+
+class WSGITransport:
+    """ Запросы к приложению в процессе, без сети; считает SQL-запросы каждого запроса """
+
+    def __init__(self):
+        self.app = WSGIHandler()
+        self.local = threading.local()
+
+    def count_query(self, execute, sql, params, many, context):
+        self.local.queries = getattr(self.local, "queries", 0) + 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        if self.count_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self.count_query)
+
+    def request(self, method, path, body=None, token=None, remote_addr="127.0.0.1"):
+        data = json.dumps(body).encode() if body is not None else b""
+        environ = {
+            "REQUEST_METHOD": method, "PATH_INFO": path, "QUERY_STRING": "", "SCRIPT_NAME": "",
+            "SERVER_NAME": BENCH_HOST, "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1", "REMOTE_ADDR": remote_addr,
+            "HTTP_HOST": BENCH_HOST, "CONTENT_TYPE": "application/json", "CONTENT_LENGTH": str(len(data)),
+            "wsgi.input": io.BytesIO(data), "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http",
+        }
+        if token:
+            environ["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        statuses = []
+        self.local.queries = 0
+        result = self.app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        try:
+            content = b"".join(result)
+        finally:
+            result.close()
+        return int(statuses[0].split()[0]), content, self.local.queries
+
+    def __enter__(self):
+        connection_created.connect(self.install)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.install)
+
+
+class HTTPTransport:
+    """ Запросы к запущенному серверу; число SQL-запросов снаружи неизвестно """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, path, body=None, token=None, remote_addr=None):
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, response.read(), None
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read(), None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def percentile(ordered, share):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] * 1000
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный тест API (вход, создание, просмотр, изменение, списки) на данных generate_habits "
+            "со сравнением с базовым замером")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help="Адрес запущенного сервера (по умолчанию приложение в процессе)")
+        parser.add_argument("--flow", choices=FLOWS, action="append", help="Замеряемые сценарии (по умолчанию все)")
+        parser.add_argument("--requests", type=int, default=300, help="Запросов на сценарий")
+        parser.add_argument("--login-requests", type=int, default=20,
+                            help="Запросов входа (каждый проверяет пароль PBKDF2)")
+        parser.add_argument("--concurrency", type=int, default=8, help="Одновременных запросов")
+        parser.add_argument("--rounds", type=int, default=3,
+                            help="Повторов каждого сценария; в отчёт идёт повтор с медианной пропускной способностью")
+        parser.add_argument("--users", type=int, default=50, help="Пользователей generate_habits в нагрузке")
+        parser.add_argument("--email-prefix", default="load1-", help="Префикс email из generate_habits")
+        parser.add_argument("--password", default="loadtest", help="Пароль пользователей generate_habits")
+        parser.add_argument("--baseline", default=str(BASELINE_PATH), help="Файл базового замера")
+        parser.add_argument("--save-baseline", action="store_true", help="Записать результат как базовый замер")
+        for name, value in DEFAULT_THRESHOLDS.items():
+            parser.add_argument(f"--max-{name}-regression", type=float, dest=f"threshold_{name}",
+                                help=f"Допуск {name} (по умолчанию из файла или {value})")
+
+    def load_users(self, options):
+        users = list(User.objects.filter(email__startswith=options["email_prefix"], is_active=True)
+                     .order_by("id")[:options["users"]])
+        if not users:
+            raise CommandError(f"Нет пользователей {options['email_prefix']}*: запустите generate_habits")
+        habits = {}
+        for pk, user_id, place in (Habit.objects.filter(user__in=users).order_by("id")
+                                   .values_list("pk", "user_id", "place")):
+            habits.setdefault(user_id, []).append((pk, place))
+        return [
+            {"email": user.email, "token": str(MyTokenObtainPairSerializer.get_token(user).access_token),
+             "habits": habits.get(user.pk) or [(None, None)]}
+            for user in users
+        ]
+
+    def build_requests(self, flow, count, users, password):
+        """ Список (метод, путь, тело, токен) сценария; пользователи и привычки чередуются по кругу """
+        requests = []
+        for index in range(count):
+            user = users[index % len(users)]
+            pk, place = user["habits"][index // len(users) % len(user["habits"])]
+            if flow == "login":
+                requests.append(("POST", "/users/login/", {"email": user["email"], "password": password}, None))
+            elif flow == "create":
+                body = {"place": "дом", "time": "07:30", "action": f"нагрузка {index}", "time_doing": "00:01:00"}
+                requests.append(("POST", "/create/", body, user["token"]))
+            elif flow == "retrieve":
+                requests.append(("GET", f"/retrieve/{pk}/", None, user["token"]))
+            elif flow == "update":
+                # Значение поля не меняется, данные generate_habits остаются прежними
+                requests.append(("PATCH", f"/update/{pk}/", {"place": place}, user["token"]))
+            elif flow == "list":
+                requests.append(("GET", "/list/", None, user["token"]))
+            else:
+                requests.append(("GET", "/list_public/", None, None))
+        return requests
+
+    def run_flow(self, transport, requests, concurrency):
+        def timed(item):
+            index, (method, path, body, token) = item
+            # Разные адреса — как у разных клиентов
+            address = f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+            started = time.perf_counter()
+            code, content, queries = transport.request(method, path, body, token, address)
+            return time.perf_counter() - started, code, content, queries
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(timed, enumerate(requests)))
+        return time.perf_counter() - started, results
+
+    def summarize(self, elapsed, results):
+        latencies = sorted(latency for latency, *_ in results)
+        queries = [count for *_, count in results if count is not None]
+        return {
+            "requests": len(results),
+            "errors": sum(1 for _, code, *_ in results if code >= 400),
+            "throughput": round(len(results) / elapsed, 1),
+            "p50": round(percentile(latencies, 0.5), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "queries": round(statistics.mean(queries), 2) if queries else None,
+        }
+
+    def compare(self, flow, result, baseline, thresholds):
+        """ Нарушения допусков относительно базового замера """
+        failures = []
+        if result["errors"]:
+            failures.append(f"ошибок {result['errors']}")
+        if baseline is None:
+            return failures
+        if result["throughput"] < baseline["throughput"] * (1 - thresholds["throughput"]):
+            failures.append(f"req/s {result['throughput']} < {baseline['throughput']}")
+        if result["p95"] > baseline["p95"] * (1 + thresholds["latency"]):
+            failures.append(f"p95 {result['p95']} мс > {baseline['p95']} мс")
+        if None not in (result["queries"], baseline["queries"]) and \
+                result["queries"] > baseline["queries"] + thresholds["queries"]:
+            failures.append(f"SQL-запросов {result['queries']} > {baseline['queries']}")
+        return failures
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["baseline"], encoding="utf-8") as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            baseline = {}
+        thresholds = {**DEFAULT_THRESHOLDS, **baseline.get("thresholds", {})}
+        thresholds.update({name: options[f"threshold_{name}"] for name in DEFAULT_THRESHOLDS
+                           if options[f"threshold_{name}"] is not None})
+
+        users = self.load_users(options)
+        transport = HTTPTransport(options["url"]) if options["url"] else WSGITransport()
+        # Лимиты частоты в процессе поднимаются, чтобы замерять сами представления (проверка в Redis остаётся);
+        # запущенный сервер для замера должен работать с увеличенными THROTTLE_RATE_*
+        rates = {scope: "100000000/min" for scope in settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]}
+        results, created = {}, []
+        try:
+            with transport, mock.patch.object(SlidingWindowThrottle, "THROTTLE_RATES", rates), \
+                    override_settings(ALLOWED_HOSTS=[BENCH_HOST]):
+                for flow in options["flow"] or FLOWS:
+                    count = options["login_requests"] if flow == "login" else options["requests"]
+                    requests = self.build_requests(flow, count, users, options["password"])
+                    # Прогрев: соединения с БД, кэши и LRU токенов заполняются до замера
+                    rounds = [self.run_flow(transport, requests[:options["concurrency"] * 2], options["concurrency"])]
+                    rounds += [self.run_flow(transport, requests, options["concurrency"])
+                               for _ in range(options["rounds"])]
+                    if flow == "create":
+                        created.extend(json.loads(content)["id"] for _, responses in rounds
+                                       for _, code, content, _ in responses if code == 201)
+                    summaries = sorted((self.summarize(*result) for result in rounds[1:]),
+                                       key=lambda summary: summary["throughput"])
+                    results[flow] = summaries[len(summaries) // 2]
+        finally:
+            Habit.objects.filter(pk__in=created).delete()
+
+        self.stdout.write(f"{'сценарий':<10}{'req/s':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}"
+                          f"{'SQL/запр.':>11}{'ошибок':>8}")
+        failed = {}
+        for flow, result in results.items():
+            queries = "—" if result["queries"] is None else f"{result['queries']:.1f}"
+            self.stdout.write(f"{flow:<10}{result['throughput']:>9.1f}{result['p50']:>10.1f}{result['p95']:>10.1f}"
+                              f"{result['p99']:>10.1f}{queries:>11}{result['errors']:>8}")
+            failures = self.compare(flow, result, baseline.get("flows", {}).get(flow), thresholds)
+            if failures:
+                failed[flow] = failures
+
+        run_settings = {"transport": "http" if options["url"] else "wsgi", "concurrency": options["concurrency"],
+                        "requests": options["requests"], "rounds": options["rounds"], "users": len(users),
+                        "habits": Habit.objects.count()}
+        if options["save_baseline"]:
+            with open(options["baseline"], "w", encoding="utf-8") as file:
+                json.dump({"settings": run_settings, "thresholds": thresholds, "flows": results}, file,
+                          ensure_ascii=False, indent=2)
+                file.write("\n")
+            self.stdout.write(self.style.SUCCESS(f"Базовый замер записан в {options['baseline']}"))
+            return
+
+        if baseline and baseline.get("settings") != run_settings:
+            self.stdout.write(self.style.WARNING(f"Условия отличаются от базового замера: {baseline.get('settings')}"))
+        if failed:
+            report = "; ".join(f"{flow}: {', '.join(items)}" for flow, items in failed.items())
+            raise CommandError(f"Регрессия: {report}")
+        self.stdout.write(self.style.SUCCESS("Допуски соблюдены" if baseline else "Базовый замер не найден"))
@@ -0,0 +1,157 @@
+import asyncio
+import io
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import BaseCommand
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from main.models import Habit
+from users.models import User
+
+BENCH_HOST = "bench.localhost"
+
+ENDPOINTS = {
+    "list": ("/list/", "/async/list/", "page=2"),
+    "public": ("/list_public/", "/async/list_public/", "frequency=daily"),
+    "retrieve": ("/retrieve/{pk}/", "/async/retrieve/{pk}/", ""),
+}
+
+
+def wsgi_request(app, path, query, token):
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": query, "SCRIPT_NAME": "",
+        "SERVER_NAME": BENCH_HOST, "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1", "REMOTE_ADDR": "127.0.0.1",
+        "HTTP_HOST": BENCH_HOST, "HTTP_AUTHORIZATION": f"Bearer {token}",
+        "wsgi.input": io.BytesIO(), "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http",
+    }
+    statuses = []
+    result = app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        b"".join(result)
+    finally:
+        # close() отправляет request_finished и закрывает соединение с БД, как WSGI-сервер
+        result.close()
+    return int(statuses[0].split()[0])
+
+
+async def asgi_request(app, path, query, token):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", BENCH_HOST.encode()), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 0), "server": (BENCH_HOST, 80),
+    }
+    response = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+
+    await app(scope, receive, send)
+    return response["status"]
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочное сравнение синхронных представлений привычек под WSGI (пул потоков) "
+            "и асинхронных под ASGI (одна event loop)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000, help="Запросов на каждый замер")
+        parser.add_argument("--concurrency", type=int, default=50, help="Одновременных запросов для ASGI")
+        parser.add_argument("--threads", type=int, default=8, help="Рабочих потоков WSGI (как gthread в gunicorn)")
+        parser.add_argument("--rows", type=int, default=500, help="Привычек в тестовых данных")
+        parser.add_argument("--query-delay", type=float, default=0,
+                            help="Искусственная задержка каждого SQL-запроса, мс (имитация медленной БД)")
+        parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), action="append",
+                            help="Замеряемые эндпоинты (по умолчанию все)")
+
+    def run_sync(self, requests, threads, token):
+        app = WSGIHandler()
+
+        def timed(request):
+            started = time.perf_counter()
+            code = wsgi_request(app, *request, token)
+            return time.perf_counter() - started, code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(timed, requests))
+        return time.perf_counter() - started, results
+
+    def run_async(self, requests, concurrency, token):
+        app = ASGIHandler()
+
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def timed(request):
+                async with semaphore:
+                    started = time.perf_counter()
+                    code = await asgi_request(app, *request, token)
+                    return time.perf_counter() - started, code
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(timed(request) for request in requests))
+            return time.perf_counter() - started, results
+
+        return asyncio.run(main())
+
+    def report(self, label, elapsed, results):
+        latencies = sorted(latency for latency, _ in results)
+        errors = sum(1 for _, code in results if code != 200)
+        p50, p95 = (statistics.quantiles(latencies, n=100)[i] * 1000 for i in (49, 94))
+        self.stdout.write(f"  {label:<6} {len(results) / elapsed:>9,.0f} req/s   p50 {p50:>8.1f} мс   "
+                          f"p95 {p95:>8.1f} мс   ошибок {errors}")
+
+    def handle(self, *args, **options):
+        delay = options["query_delay"] / 1000
+
+        def slow_down(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def install_delay(sender, connection, **kwargs):
+            # Обёртка потока переживает переподключения, поэтому задержка добавляется один раз
+            if slow_down not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow_down)
+
+        # Данные должны быть видны соединениям рабочих потоков, поэтому они фиксируются и удаляются в конце
+        user = User.objects.create(email=f"bench-{uuid.uuid4().hex}@example.com")
+        try:
+            Habit.objects.bulk_create(
+                Habit(user=user, place="Дом", time=f"{i % 24:02d}:{i % 60:02d}", action=f"Привычка {i}",
+                      frequency=("daily", "weekly")[i % 2], is_public=i % 3 == 0, time_doing=timedelta(seconds=60))
+                for i in range(options["rows"])
+            )
+            pk = Habit.objects.filter(user=user).values_list("pk", flat=True).first()
+            token = str(RefreshToken.for_user(user).access_token)
+            if delay:
+                connection_created.connect(install_delay)
+
+            self.stdout.write(f"Запросов: {options['requests']}, WSGI-потоков: {options['threads']}, "
+                              f"ASGI-конкурентность: {options['concurrency']}, задержка SQL: "
+                              f"{options['query_delay']} мс")
+            with override_settings(ALLOWED_HOSTS=[BENCH_HOST]):
+                for name in options["endpoint"] or sorted(ENDPOINTS):
+                    sync_path, async_path, query = ENDPOINTS[name]
+                    sync_requests = [(sync_path.format(pk=pk), query)] * options["requests"]
+                    async_requests = [(async_path.format(pk=pk), query)] * options["requests"]
+
+                    self.stdout.write(self.style.MIGRATE_HEADING(name))
+                    self.report("sync", *self.run_sync(sync_requests, options["threads"], token))
+                    self.report("async", *self.run_async(async_requests, options["concurrency"], token))
+        finally:
+            connection_created.disconnect(install_delay)
+            user.delete()
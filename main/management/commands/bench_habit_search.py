@@ -0,0 +1,74 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import time as dt_time, timedelta
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from main.models import Habit
+from main.pgcopy import copy_rows
+from main.views import HabitSearchAPIView
+from users.models import User
+
+ACTIONS = ("бег", "чтение книги", "медитация", "зарядка", "прогулка с собакой", "уборка", "изучение английского",
+           "йога", "планирование дня", "контрастный душ", "растяжка", "дневник благодарности")
+PLACES = ("дом", "парк", "офис", "спортзал", "набережная", "балкон", "библиотека", "кухня")
+QUERIES = ("бег", "чтение", "медитация парк", "английский", "прогулка собака", "душ -контрастный")
+COPY_BATCH = 100_000
+
+
+class Command(BaseCommand):
+    help = "Замеряет полнотекстовый поиск привычек на синтетических данных (по умолчанию 1 млн строк)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000, help="Количество привычек")
+        parser.add_argument("--repeat", type=int, default=20, help="Повторов каждого запроса")
+        parser.add_argument("--seed", type=int, default=1, help="Зерно генератора данных")
+
+    def seed(self, user, rows, rng):
+        fields = ["user", "place", "time", "action", "time_doing", "is_public", "is_pleasent", "frequency",
+                  "updated_at", "created_at"]
+        now = timezone.now()
+        for start in range(0, rows, COPY_BATCH):
+            copy_rows(Habit, fields, (
+                [user.pk, rng.choice(PLACES), dt_time(rng.randrange(24), rng.randrange(60)),
+                 f"{rng.choice(ACTIONS)} {i}", timedelta(seconds=rng.randrange(1, 121)), rng.random() < 0.3,
+                 False, "daily", now, now]
+                for i in range(start, min(start + COPY_BATCH, rows))
+            ))
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        # Данные создаются в транзакции и откатываются после замера
+        with transaction.atomic():
+            owner = User.objects.create(email=f"bench-{uuid.uuid4().hex}@example.com")
+            searcher = User.objects.create(email=f"bench-{uuid.uuid4().hex}@example.com")
+            started = time.perf_counter()
+            self.seed(owner, options["rows"], rng)
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Habit._meta.db_table}")
+            self.stdout.write(f"Загружено {options['rows']:,} строк за {time.perf_counter() - started:.1f} с")
+
+            view = HabitSearchAPIView()
+            for text in QUERIES:
+                view.request = type("Request", (), {"query_params": {"q": text}, "user": searcher})()
+                queryset = view.get_queryset()
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    page = list(queryset.all()[:5])
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                p95 = timings[int(len(timings) * 0.95) - 1]
+                self.stdout.write(f"{text!r:<24} найдено {len(page)}, медиана {statistics.median(timings):7.1f} мс, "
+                                  f"p95 {p95:7.1f} мс")
+
+            plan = view.get_queryset().explain()
+            self.stdout.write("План последнего запроса:\n" + plan)
+            uses_index = "habit_search_idx" in plan
+            self.stdout.write(self.style.SUCCESS("Поиск идёт по GIN-индексу") if uses_index
+                              else self.style.WARNING("GIN-индекс не используется"))
+            transaction.set_rollback(True)
@@ -0,0 +1,49 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from main.models import Habit
+from main.serializers import HabitSerializer, HabitValuesSerializer
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Сравнивает скорость HabitSerializer и HabitValuesSerializer (запрос + сериализация списка)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000, help="Количество привычек в выборке")
+        parser.add_argument("--repeat", type=int, default=5, help="Число повторов, берётся лучший результат")
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        repeat = options["repeat"]
+
+        # Тестовые данные создаются в транзакции и откатываются после замера
+        with transaction.atomic():
+            user = User.objects.create(email=f"bench-{uuid.uuid4().hex}@example.com")
+            Habit.objects.bulk_create(
+                Habit(user=user, place="Дом", time=f"{i % 24:02d}:{i % 60:02d}", action=f"Привычка {i}",
+                      frequency_in_days=i % 7 + 1, reward="Кофе", time_doing=timedelta(seconds=i % 120))
+                for i in range(rows)
+            )
+            queryset = Habit.objects.filter(user=user).order_by("id")
+
+            model_time = self.best_of(repeat, lambda: HabitSerializer(queryset.all(), many=True).data)
+            fast_time = self.best_of(repeat, lambda: HabitValuesSerializer().serialize(queryset.all()))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"Строк: {rows}, повторов: {repeat}")
+        self.stdout.write(f"HabitSerializer:       {rows / model_time:>12,.0f} строк/с ({model_time * 1000:.1f} мс)")
+        self.stdout.write(f"HabitValuesSerializer: {rows / fast_time:>12,.0f} строк/с ({fast_time * 1000:.1f} мс)")
+        self.stdout.write(self.style.SUCCESS(f"Ускорение: x{model_time / fast_time:.1f}"))
@@ -0,0 +1,74 @@
+import statistics
+import time
+import uuid
+
+from django.core.management import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from config.redis_client import get_redis
+from config.throttling import SlidingWindowThrottle
+
+
+class BenchThrottle(SlidingWindowThrottle):
+    scope = "bench"
+    rate = "100000000/hour"
+
+    def __init__(self, key):
+        super().__init__()
+        self.bench_key = key
+
+    def get_cache_key(self, request, view):
+        return self.bench_key
+
+
+def percentiles(timings):
+    quantiles = statistics.quantiles(timings, n=100)
+    return quantiles[49] * 1000, quantiles[94] * 1000
+
+
+class Command(BaseCommand):
+    help = "Измеряет накладные расходы ограничения частоты запросов (Redis из REDIS_URL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checks", type=int, default=5000, help="Проверок allow_request")
+        parser.add_argument("--requests", type=int, default=500, help="Запросов к list_public/")
+
+    def handle(self, *args, **options):
+        key = f"throttle:bench:{uuid.uuid4().hex}"
+        throttle = BenchThrottle(key)
+        request = Request(APIRequestFactory().get("/list_public/"), authenticators=())
+
+        # Окно заполняется так же, как под нагрузкой: каждая проверка добавляет член в sorted set
+        timings = []
+        try:
+            for _ in range(options["checks"]):
+                started = time.perf_counter()
+                if not throttle.allow_request(request, None):
+                    raise RuntimeError("Проверка неожиданно отклонена")
+                timings.append(time.perf_counter() - started)
+        finally:
+            get_redis().delete(key)
+        if SlidingWindowThrottle.redis_down_until:
+            self.stderr.write(self.style.ERROR("Redis недоступен, замер не выполнен"))
+            return
+        check_p50, check_p95 = percentiles(timings)
+
+        # Полный запрос list_public/ с ограничением; у каждого запроса свой IP, чтобы не упереться в лимит
+        client = Client()
+        timings = []
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            for index in range(options["requests"]):
+                address = f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+                started = time.perf_counter()
+                response = client.get("/list_public/", REMOTE_ADDR=address)
+                timings.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(f"list_public/ вернул {response.status_code}")
+        request_p50, request_p95 = percentiles(timings)
+
+        self.stdout.write(f"Проверка окна (EVALSHA): p50 {check_p50:.3f} мс, p95 {check_p95:.3f} мс")
+        self.stdout.write(f"Запрос list_public/:     p50 {request_p50:.3f} мс, p95 {request_p95:.3f} мс")
+        self.stdout.write(self.style.SUCCESS(f"Доля ограничения в запросе: {check_p50 / request_p50:.1%}"))
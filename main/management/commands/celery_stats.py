@@ -0,0 +1,121 @@
+import time
+import urllib.request
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from prometheus_client.parser import text_string_to_metric_families
+
+STATES = ("success", "failure", "retry")
+
+
+def scrape(urls):
+    """ Сэмплы метрик celery_* со всех воркеров: {(имя, метки): значение}, одинаковые ряды суммируются """
+    samples = defaultdict(float)
+    for url in urls:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            text = response.read().decode()
+        for family in text_string_to_metric_families(text):
+            if not family.name.startswith("celery_"):
+                continue
+            for sample in family.samples:
+                labels = tuple(sorted((key, value) for key, value in sample.labels.items() if key != "pid"))
+                samples[sample.name, labels] += sample.value
+    return dict(samples)
+
+
+def delta(current, previous):
+    if previous is None:
+        return current
+    return {key: value - previous.get(key, 0.0) for key, value in current.items()}
+
+
+def histogram_quantile(buckets, share):
+    """ Квантиль по накопленным корзинам [(le, count)] с линейной интерполяцией внутри корзины, как в PromQL """
+    buckets = sorted(buckets)
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return None
+    rank = share * total
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / ((count - lower_count) or 1)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def summarize(samples):
+    """ Строки сводки по задачам из сэмплов (накопленных или приращений за интервал) """
+    tasks = defaultdict(lambda: {"buckets": defaultdict(list), "states": defaultdict(float), "memory": 0.0})
+    for (name, labels), value in samples.items():
+        labels = dict(labels)
+        task = labels.get("task")
+        if task is None:
+            continue
+        if name.endswith("_bucket"):
+            tasks[task]["buckets"][name[:-len("_bucket")]].append((float(labels["le"]), value))
+        elif name == "celery_tasks_total":
+            tasks[task]["states"][labels["state"]] += value
+        elif name == "celery_task_memory_growth_bytes_total":
+            tasks[task]["memory"] += value
+
+    rows = []
+    for task, data in sorted(tasks.items()):
+        queue = data["buckets"]["celery_task_queue_seconds"]
+        runtime = data["buckets"]["celery_task_runtime_seconds"]
+        rows.append({
+            "task": task,
+            **{state: data["states"][state] for state in STATES},
+            "queue_p50": histogram_quantile(queue, 0.5), "queue_p95": histogram_quantile(queue, 0.95),
+            "runtime_p50": histogram_quantile(runtime, 0.5), "runtime_p95": histogram_quantile(runtime, 0.95),
+            "memory": data["memory"],
+        })
+    return rows
+
+
+def seconds(value):
+    return "—" if value is None else f"{value * 1000:.0f} мс" if value < 1 else f"{value:.1f} с"
+
+
+class Command(BaseCommand):
+    help = "Живая сводка по задачам Celery из метрик воркеров: исходы, ожидание в очереди, время выполнения, память"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", action="append",
+                            help="Адрес метрик воркера (по умолчанию http://localhost:CELERY_METRICS_PORT/)")
+        parser.add_argument("--interval", type=float, default=5, help="Период обновления, с")
+        parser.add_argument("--once", action="store_true", help="Вывести накопленные значения и выйти")
+
+    def handle(self, *args, **options):
+        urls = options["url"]
+        if not urls:
+            if not settings.CELERY_METRICS_PORT:
+                raise CommandError("Укажите --url или CELERY_METRICS_PORT")
+            urls = [f"http://localhost:{settings.CELERY_METRICS_PORT}/"]
+
+        previous = None
+        while True:
+            current = scrape(urls)
+            if options["once"]:
+                self.print_summary("с запуска воркеров", summarize(current), current)
+                return
+            # Первая сводка — с запуска воркеров, дальше — за последний интервал
+            title = "с запуска воркеров" if previous is None else f"за {options['interval']:g} с"
+            self.print_summary(title, summarize(delta(current, previous)), current)
+            previous = current
+            time.sleep(options["interval"])
+
+    def print_summary(self, title, rows, current):
+        rss = sum(value for (name, _), value in current.items() if name == "celery_worker_rss_bytes")
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{time.strftime('%H:%M:%S')} — {title}, RSS исполнителей {rss / 2 ** 20:.0f} МБ"))
+        self.stdout.write(f"{'задача':<36}{'успех':>7}{'ошибки':>8}{'повторы':>9}{'очередь p50/p95':>20}"
+                          f"{'выполнение p50/p95':>22}{'рост RSS':>11}")
+        for row in rows:
+            queue = f"{seconds(row['queue_p50'])}/{seconds(row['queue_p95'])}"
+            runtime = f"{seconds(row['runtime_p50'])}/{seconds(row['runtime_p95'])}"
+            self.stdout.write(f"{row['task'][-36:]:<36}{row['success']:>7.0f}{row['failure']:>8.0f}"
+                              f"{row['retry']:>9.0f}{queue:>20}{runtime:>22}{row['memory'] / 2 ** 20:>8.1f} МБ")
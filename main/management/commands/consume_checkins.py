@@ -0,0 +1,44 @@
+import os
+import socket
+import time
+
+from django.core.management import BaseCommand
+from django.db import DatabaseError, close_old_connections
+from redis import RedisError
+
+from main.checkin_stream import CheckinStreamConsumer
+
+
+class Command(BaseCommand):
+    help = "Переносит отметки о выполнении из потока Redis в БД пачками (CHECKIN_WRITE_BEHIND)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}",
+                            help="Имя потребителя в группе (по умолчанию хост и pid)")
+        parser.add_argument("--batch-size", type=int, help="Сообщений в пачке (по умолчанию CHECKIN_BATCH_SIZE)")
+        parser.add_argument("--block-ms", type=int, default=1000, help="Ожидание новых сообщений, мс")
+        parser.add_argument("--once", action="store_true", help="Разобрать накопившиеся сообщения и выйти")
+
+    def handle(self, *args, **options):
+        consumer = CheckinStreamConsumer(options["name"], batch_size=options["batch_size"],
+                                         block_ms=options["block_ms"])
+        consumer.ensure_group()
+        total = 0
+        while True:
+            # Процесс долгоживущий: устаревшие соединения с БД закрываются, как между задачами Celery
+            close_old_connections()
+            started = time.perf_counter()
+            try:
+                written = consumer.run_once()
+            except (DatabaseError, RedisError) as exc:
+                # Пачка осталась неподтверждённой и будет забрана повторно через CHECKIN_CLAIM_IDLE_MS
+                self.stderr.write(f"Пачка не записана: {exc}")
+                time.sleep(1)
+                continue
+            if written:
+                total += written
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"Записано отметок: {written} за {elapsed * 1000:.0f} мс")
+            elif options["once"]:
+                self.stdout.write(self.style.SUCCESS(f"Всего записано отметок: {total}"))
+                return
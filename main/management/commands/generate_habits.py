@@ -0,0 +1,58 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from main.datagen import HabitDatasetGenerator
+from main.pgcopy import supports_copy
+
+
+class Command(BaseCommand):
+    help = ("Создаёт синтетических пользователей и привычки для нагрузочных тестов (COPY, детерминированно по --seed). "
+            "Пример: generate_habits --users 100000 --habits-per-user 100")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Количество пользователей")
+        parser.add_argument("--habits-per-user", type=int, default=10, help="Привычек у каждого пользователя")
+        parser.add_argument("--seed", type=int, default=1, help="Зерно генератора данных")
+        parser.add_argument("--email-prefix", help="Префикс email пользователей (по умолчанию load<seed>-)")
+        parser.add_argument("--password", default="loadtest", help="Пароль всех пользователей")
+        parser.add_argument("--public-ratio", type=float, default=0.2, help="Доля публичных привычек")
+        parser.add_argument("--pleasent-ratio", type=float, default=0.3, help="Доля приятных привычек")
+        parser.add_argument("--link-ratio", type=float, default=0.5,
+                            help="Доля полезных привычек со связанной приятной привычкой")
+        parser.add_argument("--batch-size", type=int, default=100_000, help="Привычек в одной порции COPY")
+        parser.add_argument("--clear", action="store_true",
+                            help="Удалить ранее созданные данные с тем же префиксом вместо генерации")
+
+    def handle(self, *args, **options):
+        if not supports_copy():
+            raise CommandError("Генератор работает только с PostgreSQL (COPY)")
+        for name in ("public_ratio", "pleasent_ratio", "link_ratio"):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f"--{name.replace('_', '-')} должен быть от 0 до 1")
+
+        generator = HabitDatasetGenerator(
+            options["users"], options["habits_per_user"], seed=options["seed"], email_prefix=options["email_prefix"],
+            password=options["password"], public_ratio=options["public_ratio"],
+            pleasent_ratio=options["pleasent_ratio"], link_ratio=options["link_ratio"],
+            batch_size=options["batch_size"],
+        )
+        if options["clear"]:
+            deleted = generator.clear()
+            self.stdout.write(self.style.SUCCESS(f"Удалено привычек: {deleted:,}"))
+            return
+
+        total = options["users"] * options["habits_per_user"]
+        started = time.perf_counter()
+
+        def progress(created):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  {created:,} / {total:,} привычек, {created / elapsed:,.0f} строк/с")
+
+        created = generator.run(progress)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано пользователей: {options['users']:,} ({generator.email(0)} … "
+            f"{generator.email(max(options['users'] - 1, 0))}, пароль {options['password']!r}), "
+            f"привычек: {created:,} за {elapsed:.1f} с"
+        ))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from main.importers import IMPORT_FORMATS, HabitImporter, read_rows
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Импортирует привычки пользователя из CSV или NDJSON файла"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу")
+        parser.add_argument("--user", required=True, help="Email владельца привычек")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, help="Формат файла (по умолчанию по расширению)")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Размер порции проверки и записи")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+
+        import_format = options["format"] or ("csv" if options["path"].endswith(".csv") else "ndjson")
+        importer = HabitImporter(user, chunk_size=options["chunk_size"])
+        started = time.perf_counter()
+        with open(options["path"], "rb") as stream:
+            report = importer.run(read_rows(stream, import_format))
+        elapsed = time.perf_counter() - started
+
+        for error in report["errors"]:
+            self.stderr.write(f"Строка {error['row']}: {error['errors']}")
+        total = report["created"] + report["rejected"]
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано: {report['created']}, отклонено: {report['rejected']}, "
+            f"{total / elapsed if elapsed else total:,.0f} строк/с"
+        ))
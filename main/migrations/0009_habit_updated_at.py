@@ -0,0 +1,20 @@
+# Generated by Django 4.2.2 on 2026-10-19 10:52
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_alter_habit_frequency_in_days'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.2 on 2026-10-19 10:55
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR_TRIGGER = """
+CREATE FUNCTION main_habit_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.action, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.place, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER main_habit_search_vector_trigger
+    BEFORE INSERT OR UPDATE ON main_habit
+    FOR EACH ROW EXECUTE FUNCTION main_habit_search_vector_update();
+
+UPDATE main_habit SET search_vector =
+    setweight(to_tsvector('russian', coalesce(action, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(place, '')), 'B');
+"""
+
+DROP_SEARCH_VECTOR_TRIGGER = """
+DROP TRIGGER IF EXISTS main_habit_search_vector_trigger ON main_habit;
+DROP FUNCTION IF EXISTS main_habit_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_habit_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_TRIGGER, DROP_SEARCH_VECTOR_TRIGGER),
+        migrations.AddIndex(
+            model_name='habit',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='habit_search_idx'),
+        ),
+    ]
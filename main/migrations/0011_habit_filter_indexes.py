@@ -0,0 +1,29 @@
+# Generated by Django 4.2.2 on 2026-10-19 10:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_habit_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['time', 'id'], name='habit_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['frequency', 'time', 'id'], name='habit_frequency_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['time', 'id'], name='habit_public_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_pleasent', True)), fields=['time', 'id'], name='habit_pleasent_time_idx'),
+        ),
+    ]
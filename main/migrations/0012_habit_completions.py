@@ -0,0 +1,89 @@
+# Generated by Django 4.2.2 on 2026-10-19 12:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0011_habit_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitProgress',
+            fields=[
+                ('habit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='progress', serialize=False, to='main.habit', verbose_name='Привычка')),
+                ('period_unit', models.CharField(max_length=10, verbose_name='Единица периода')),
+                ('total_completions', models.PositiveIntegerField(default=0, verbose_name='Всего выполнений')),
+                ('periods_done', models.PositiveIntegerField(default=0, verbose_name='Периодов с выполнением')),
+                ('first_period', models.IntegerField(null=True, verbose_name='Первый период с выполнением')),
+                ('last_period', models.IntegerField(null=True, verbose_name='Последний период с выполнением')),
+                ('current_streak', models.PositiveIntegerField(default=0, verbose_name='Серия до последнего периода')),
+                ('longest_streak', models.PositiveIntegerField(default=0, verbose_name='Лучшая серия')),
+                ('last_done_at', models.DateTimeField(null=True, verbose_name='Последнее выполнение')),
+            ],
+            options={
+                'verbose_name': 'Прогресс привычки',
+                'verbose_name_plural': 'Прогресс привычек',
+            },
+        ),
+        migrations.CreateModel(
+            name='HabitWeeklyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.DateField(verbose_name='Неделя')),
+                ('completions', models.PositiveIntegerField(default=0, verbose_name='Выполнений')),
+                ('days', models.PositiveSmallIntegerField(default=0, verbose_name='Дней с выполнением')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_rollups', to='main.habit', verbose_name='Привычка')),
+            ],
+            options={
+                'verbose_name': 'Сводка выполнений за неделю',
+                'verbose_name_plural': 'Сводки выполнений за неделю',
+            },
+        ),
+        migrations.CreateModel(
+            name='HabitDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('completions', models.PositiveIntegerField(default=0, verbose_name='Выполнений')),
+                ('last_done_at', models.DateTimeField(verbose_name='Последнее выполнение')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='main.habit', verbose_name='Привычка')),
+            ],
+            options={
+                'verbose_name': 'Сводка выполнений за день',
+                'verbose_name_plural': 'Сводки выполнений за день',
+            },
+        ),
+        migrations.CreateModel(
+            name='HabitCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('done_at', models.DateTimeField(verbose_name='Время выполнения')),
+                ('day', models.DateField(verbose_name='День')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата отметки')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='main.habit', verbose_name='Привычка')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Выполнение привычки',
+                'verbose_name_plural': 'Выполнения привычек',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='habitweeklyrollup',
+            constraint=models.UniqueConstraint(fields=('habit', 'week'), name='weekly_rollup_habit_week_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='habitdailyrollup',
+            constraint=models.UniqueConstraint(fields=('habit', 'day'), name='daily_rollup_habit_day_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='habitcompletion',
+            index=models.Index(fields=['habit', '-done_at'], name='completion_habit_done_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.2 on 2026-10-19 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_habit_completions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habitcompletion',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='Ключ идемпотентности'),
+        ),
+        migrations.AddConstraint(
+            model_name='habitcompletion',
+            constraint=models.UniqueConstraint(fields=('habit', 'idempotency_key'), name='completion_habit_idempotency_uniq'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.2 on 2026-10-19 14:05
+
+from django.conf import settings
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('main', '0013_habit_completion_idempotency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserHabitStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='habit_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('daily_habits', models.PositiveIntegerField(default=0, verbose_name='Ежедневных привычек')),
+                ('weekly_habits', models.PositiveIntegerField(default=0, verbose_name='Еженедельных привычек')),
+                ('monthly_habits', models.PositiveIntegerField(default=0, verbose_name='Ежемесячных привычек')),
+                ('completions', models.PositiveIntegerField(default=0, verbose_name='Всего выполнений')),
+                ('periods', models.JSONField(default=dict, verbose_name='Суммы периодов')),
+                ('completions_by_hour', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=list, size=None, verbose_name='Выполнения по часам')),
+                ('changes', models.BigIntegerField(default=0, verbose_name='Счётчик изменений')),
+                ('refreshed_changes', models.BigIntegerField(default=0, verbose_name='Учтённые изменения')),
+                ('refreshed_at', models.DateTimeField(null=True, verbose_name='Дата пересчёта')),
+            ],
+            options={
+                'verbose_name': 'Статистика привычек пользователя',
+                'verbose_name_plural': 'Статистика привычек пользователей',
+                'indexes': [models.Index(condition=models.Q(('changes__gt', models.F('refreshed_changes'))), fields=['user'], name='habit_stats_changed_idx'), models.Index(fields=['refreshed_at'], name='habit_stats_refreshed_idx')],
+            },
+        ),
+    ]
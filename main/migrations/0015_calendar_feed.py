@@ -0,0 +1,29 @@
+# Generated by Django 4.2.2 on 2026-10-19 16:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import main.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('main', '0014_user_habit_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarFeed',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='calendar_feed', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('token', models.CharField(default=main.models.new_feed_token, max_length=64, unique=True, verbose_name='Токен ссылки')),
+                ('created_at', models.DateTimeField(auto_now=True, verbose_name='Дата выпуска токена')),
+            ],
+            options={
+                'verbose_name': 'Подписка на календарь',
+                'verbose_name_plural': 'Подписки на календарь',
+            },
+        ),
+    ]
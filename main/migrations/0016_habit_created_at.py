@@ -0,0 +1,22 @@
+# Generated by Django 4.2.2 on 2026-10-19 17:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_calendar_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата создания'),
+            preserve_default=False,
+        ),
+        # Дата создания существующих привычек неизвестна; ближайшее известное — дата последнего изменения
+        migrations.RunSQL('UPDATE main_habit SET created_at = updated_at', migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,125 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from main.serializers import HabitSerializer, HabitValuesSerializer
+
+
+def make_etag(request, *parts):
+    """Строит ETag из версии ресурса, пользователя и строки запроса."""
+    raw = "|".join(str(part) for part in (*parts, request.user.pk, request.META.get("QUERY_STRING", "")))
+    return quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+
+def set_validator_headers(response, etag, timestamp):
+    """Проставляет ETag/Last-Modified в ответ 200 или 304."""
+    if response.status_code in (200, 304):
+        response.headers["ETag"] = etag
+        if timestamp is not None:
+            response.headers["Last-Modified"] = http_date(timestamp)
+    return response
+
+
+def parse_requested_fields(raw, param="fields"):
+    """Разбирает список полей из ?fields=a,b; неизвестные поля — ошибка валидации."""
+    if not raw:
+        return None
+    fields = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = set(fields) - set(HabitSerializer().fields)
+    if unknown:
+        raise ValidationError({param: f"Неизвестные поля: {', '.join(sorted(unknown))}"})
+    return fields
+
+
+class ConditionalGetMixin:
+    """
+    Поддержка ETag/Last-Modified для GET-запросов.
+
+    Версия ресурса вычисляется лёгким запросом к updated_at, поэтому на
+    If-None-Match/If-Modified-Since можно ответить 304 без выборки и
+    сериализации самих привычек.
+    """
+
+    def get_validators(self):
+        """
+        Возвращает (etag, last_modified); (None, None) — ответ без условной обработки, в том числе когда
+        ресурса нет. По умолчанию валидаторов нет.
+        """
+        return None, None
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        if etag is None:
+            return super().get(request, *args, **kwargs)
+
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return set_validator_headers(response, etag, timestamp)
+
+
+class HabitObjectConditionalMixin(ConditionalGetMixin):
+    """Валидаторы для одной привычки: её pk и время последнего изменения."""
+
+    def get_validators(self):
+        pk = self.kwargs.get("pk")
+        updated_at = self.get_queryset().filter(pk=pk).values_list("updated_at", flat=True).first()
+        if updated_at is None:
+            return None, None
+        return make_etag(self.request, pk, updated_at.isoformat()), updated_at
+
+
+class HabitListConditionalMixin(ConditionalGetMixin):
+    """
+    Валидаторы для списка: ETag из количества строк и максимального updated_at одним агрегатом.
+
+    Last-Modified списку не отдаётся: удаление привычки не двигает max(updated_at), и If-Modified-Since
+    получил бы 304 с устаревшим списком. Количество строк в ETag удаление учитывает.
+    """
+
+    def get_validators(self):
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        version = queryset.aggregate(count=Count("pk"), last_modified=Max("updated_at"))
+        last_modified = version["last_modified"]
+        stamp = last_modified.isoformat() if last_modified else ""
+        return make_etag(self.request, version["count"], stamp), None
+
+
+class HabitFieldsMixin:
+    """
+    Выборка полей через ?fields=action,time,place.
+
+    Ограничивает и сериализатор, и SQL-запрос (only()), чтобы не читать лишние колонки.
+    """
+    fields_query_param = "fields"
+
+    def get_requested_fields(self):
+        return parse_requested_fields(self.request.query_params.get(self.fields_query_param), self.fields_query_param)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_requested_fields()
+        if fields is not None:
+            queryset = queryset.only(*fields)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+
+class HabitFastListMixin(HabitFieldsMixin):
+    """ Список через HabitValuesSerializer: values_list() вместо экземпляров модели и полей DRF """
+
+    def list(self, request, *args, **kwargs):
+        serializer = HabitValuesSerializer(fields=self.get_requested_fields())
+        rows = serializer.get_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_representation(page))
+        return Response(serializer.to_representation(rows))
@@ -1,10 +1,88 @@
-from django.db import models
+import secrets
+
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connections, models
+from django.utils import timezone
 
 from config import settings
 from users.models import User
 
 NULLABLE = {"blank": True, "null": True}
 
+SEARCH_CONFIG = "russian"
+
+MAX_CHAIN_DEPTH = 1000
+
+# Обход графа связанных привычек одним рекурсивным запросом. Колонки привычки несутся в самом CTE, чтобы не
+# читать строки повторно; path хранит пройденные id и защищает от циклов (CYCLE ... SET появился только
+# в PostgreSQL 14), depth ограничивает глубину обхода.
+HABIT_GRAPH_SQL = """
+WITH RECURSIVE graph AS (
+    SELECT {columns}, 0 AS depth, ARRAY[h.id] AS path
+    FROM main_habit h
+    WHERE h.id = %(pk)s {visible}
+  UNION ALL
+    SELECT {columns}, g.depth + 1, g.path || h.id
+    FROM graph g
+    JOIN main_habit h ON {step}
+    WHERE g.depth < %(max_depth)s AND h.id <> ALL(g.path) {visible}
+)
+SELECT {output}, g.depth FROM graph g ORDER BY g.depth, g.id
+"""
+HABIT_GRAPH_STEPS = {
+    # вперёд по associated_habit: привычка -> связанная -> её связанная ...
+    "chain": "h.id = g.associated_habit_id",
+    # назад: все привычки, которые ссылаются на текущую
+    "dependents": "h.associated_habit_id = g.id",
+}
+
+
+class HabitQuerySet(models.QuerySet):
+
+    def graph_query(self, direction, pk, fields=None, max_depth=MAX_CHAIN_DEPTH, user=None):
+        """ SQL и параметры обхода графа; fields — имена полей модели в нужном порядке (по умолчанию все) """
+        opts = self.model._meta
+        if fields is None:
+            fields = [field.name for field in opts.concrete_fields if field.name != "search_vector"]
+        output = [opts.get_field(name).column for name in fields]
+        # id и associated_habit_id нужны для шага рекурсии, даже если не запрошены
+        columns = list(dict.fromkeys(["id", "associated_habit_id", *output]))
+
+        params = {"pk": pk, "max_depth": max_depth}
+        visible = ""
+        if user is not None:
+            visible = "AND (h.user_id = %(user)s OR h.is_public)"
+            params["user"] = user.pk
+        sql = HABIT_GRAPH_SQL.format(
+            columns=", ".join(f"h.{column}" for column in columns),
+            output=", ".join(f"g.{column}" for column in output),
+            step=HABIT_GRAPH_STEPS[direction],
+            visible=visible,
+        )
+        return sql, params
+
+    def graph_values(self, direction, pk, fields, **kwargs):
+        """ Кортежи значений fields и глубины без создания экземпляров модели """
+        sql, params = self.graph_query(direction, pk, fields, **kwargs)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def chain(self, pk, max_depth=MAX_CHAIN_DEPTH, user=None):
+        """
+        Привычка и вся цепочка её связанных привычек одним запросом.
+
+        Возвращает RawQuerySet экземпляров Habit с атрибутом depth (0 — сама привычка),
+        упорядоченных по глубине. user — обходить только его и публичные привычки.
+        """
+        return self.raw(*self.graph_query("chain", pk, max_depth=max_depth, user=user))
+
+    def dependents(self, pk, max_depth=MAX_CHAIN_DEPTH, user=None):
+        """ Привычка и все привычки, которые прямо или через цепочку ссылаются на неё (обход в обратную сторону) """
+        return self.raw(*self.graph_query("dependents", pk, max_depth=max_depth, user=user))
+
 
 class Habit(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
@@ -23,10 +101,194 @@ class Habit(models.Model):
     reward = models.CharField(max_length=100, verbose_name="Вознаграждение", **NULLABLE)
     time_doing = models.DurationField(max_length=2, verbose_name="Время на выполнение")
     is_public = models.BooleanField(default=False, verbose_name="Признак публичности")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+    # От дня создания считаются повторения в календаре (main.occurrences, main.ics); updated_at для этого не
+    # годится — он меняется при каждом сохранении
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    # Заполняется триггером БД из action (вес A) и place (вес B), см. миграцию 0010
+    search_vector = SearchVectorField(null=True, editable=False, verbose_name="Поисковый вектор")
+
+    objects = HabitQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Привычка"
         verbose_name_plural = "Привычки"
+        # Списки сортируются по (time, id): фильтры по времени и периодичности идут по btree-индексам,
+        # а по булевым признакам — по частичным индексам, в которые попадают только нужные строки
+        indexes = [
+            GinIndex(fields=["search_vector"], name="habit_search_idx"),
+            models.Index(fields=["time", "id"], name="habit_time_idx"),
+            models.Index(fields=["frequency", "time", "id"], name="habit_frequency_time_idx"),
+            models.Index(fields=["time", "id"], condition=models.Q(is_public=True), name="habit_public_time_idx"),
+            models.Index(fields=["time", "id"], condition=models.Q(is_pleasent=True),
+                         name="habit_pleasent_time_idx"),
+        ]
 
         def __str__(self):
             return f'{self.action}: {self.time} - {self.place}'
+
+
+class HabitCompletion(models.Model):
+    """ Отметка о выполнении привычки (журнал). Сводки по дням, неделям и серии ведутся в *Rollup и HabitProgress """
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="completions", verbose_name="Привычка")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Пользователь")
+    done_at = models.DateTimeField(verbose_name="Время выполнения")
+    # Дата выполнения в часовом поясе TIME_ZONE — ключ дневной сводки
+    day = models.DateField(verbose_name="День")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата отметки")
+    # Ключ отметки от клиента или из очереди: повторная доставка с тем же ключом не записывается
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, verbose_name="Ключ идемпотентности")
+
+    class Meta:
+        verbose_name = "Выполнение привычки"
+        verbose_name_plural = "Выполнения привычек"
+        indexes = [models.Index(fields=["habit", "-done_at"], name="completion_habit_done_idx")]
+        constraints = [models.UniqueConstraint(fields=["habit", "idempotency_key"],
+                                               name="completion_habit_idempotency_uniq")]
+
+
+class HabitDailyRollup(models.Model):
+    """ Выполнения привычки за день """
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="daily_rollups", verbose_name="Привычка")
+    day = models.DateField(verbose_name="День")
+    completions = models.PositiveIntegerField(default=0, verbose_name="Выполнений")
+    last_done_at = models.DateTimeField(verbose_name="Последнее выполнение")
+
+    class Meta:
+        verbose_name = "Сводка выполнений за день"
+        verbose_name_plural = "Сводки выполнений за день"
+        constraints = [models.UniqueConstraint(fields=["habit", "day"], name="daily_rollup_habit_day_uniq")]
+
+
+class HabitWeeklyRollup(models.Model):
+    """ Выполнения привычки за неделю (week — понедельник) и число дней недели с выполнением """
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="weekly_rollups", verbose_name="Привычка")
+    week = models.DateField(verbose_name="Неделя")
+    completions = models.PositiveIntegerField(default=0, verbose_name="Выполнений")
+    days = models.PositiveSmallIntegerField(default=0, verbose_name="Дней с выполнением")
+
+    class Meta:
+        verbose_name = "Сводка выполнений за неделю"
+        verbose_name_plural = "Сводки выполнений за неделю"
+        constraints = [models.UniqueConstraint(fields=["habit", "week"], name="weekly_rollup_habit_week_uniq")]
+
+
+# Единица периода серии по периодичности привычки
+PERIOD_UNITS = {"daily": "day", "weekly": "week", "monthly": "month"}
+
+
+def period_index(unit, day):
+    """ Порядковый номер дня, недели (с понедельника) или месяца: соседние периоды отличаются на 1 """
+    if unit == "day":
+        return day.toordinal()
+    if unit == "week":
+        return (day.toordinal() - day.weekday()) // 7
+    return day.year * 12 + day.month - 1
+
+
+class HabitProgress(models.Model):
+    """
+    Итоги привычки, которые обновляются при каждой отметке: чтение серии, доли выполнения и
+    последнего выполнения — одна строка без просмотра журнала.
+
+    Периоды — порядковые номера дней, недель или месяцев (по периодичности привычки, period_unit).
+    """
+    habit = models.OneToOneField(Habit, on_delete=models.CASCADE, primary_key=True, related_name="progress",
+                                 verbose_name="Привычка")
+    period_unit = models.CharField(max_length=10, verbose_name="Единица периода")
+    total_completions = models.PositiveIntegerField(default=0, verbose_name="Всего выполнений")
+    periods_done = models.PositiveIntegerField(default=0, verbose_name="Периодов с выполнением")
+    first_period = models.IntegerField(null=True, verbose_name="Первый период с выполнением")
+    last_period = models.IntegerField(null=True, verbose_name="Последний период с выполнением")
+    current_streak = models.PositiveIntegerField(default=0, verbose_name="Серия до последнего периода")
+    longest_streak = models.PositiveIntegerField(default=0, verbose_name="Лучшая серия")
+    last_done_at = models.DateTimeField(null=True, verbose_name="Последнее выполнение")
+
+    class Meta:
+        verbose_name = "Прогресс привычки"
+        verbose_name_plural = "Прогресс привычек"
+
+    def current_period(self, today=None):
+        return period_index(self.period_unit, today or timezone.localdate())
+
+    def streak(self, today=None):
+        """ Текущая серия: прерывается, если пропущен весь прошлый период """
+        if self.last_period is None or self.last_period < self.current_period(today) - 1:
+            return 0
+        return self.current_streak
+
+    def completion_rate(self, today=None):
+        """ Доля периодов с выполнением с первого выполнения по текущий период включительно """
+        if self.first_period is None:
+            return 0.0
+        return self.periods_done / (self.current_period(today) - self.first_period + 1)
+
+
+class UserHabitStats(models.Model):
+    """
+    Готовая статистика пользователя для GET /stats/: привычки по периодичности, выполнения, суммы периодов для доли
+    выполнения и выполнения по часам суток.
+
+    Запись привычек и отметок только увеличивает changes (main.stats.mark_stats_changed); пересчёт
+    (main.stats.refresh_user_stats) запоминает, до какого changes он учёл данные, в refreshed_changes.
+    Строка устарела, пока changes > refreshed_changes.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name="habit_stats", verbose_name="Пользователь")
+    daily_habits = models.PositiveIntegerField(default=0, verbose_name="Ежедневных привычек")
+    weekly_habits = models.PositiveIntegerField(default=0, verbose_name="Еженедельных привычек")
+    monthly_habits = models.PositiveIntegerField(default=0, verbose_name="Ежемесячных привычек")
+    completions = models.PositiveIntegerField(default=0, verbose_name="Всего выполнений")
+    # {единица периода: [привычек с выполнениями, сумма first_period, сумма periods_done]}
+    periods = models.JSONField(default=dict, verbose_name="Суммы периодов")
+    # Выполнения за последние STATS_BEST_TIME_DAYS дней по часу суток (TIME_ZONE)
+    completions_by_hour = ArrayField(models.PositiveIntegerField(), default=list, verbose_name="Выполнения по часам")
+    changes = models.BigIntegerField(default=0, verbose_name="Счётчик изменений")
+    refreshed_changes = models.BigIntegerField(default=0, verbose_name="Учтённые изменения")
+    refreshed_at = models.DateTimeField(null=True, verbose_name="Дата пересчёта")
+
+    class Meta:
+        verbose_name = "Статистика привычек пользователя"
+        verbose_name_plural = "Статистика привычек пользователей"
+        indexes = [
+            models.Index(fields=["user"], condition=models.Q(changes__gt=models.F("refreshed_changes")),
+                         name="habit_stats_changed_idx"),
+            models.Index(fields=["refreshed_at"], name="habit_stats_refreshed_idx"),
+        ]
+
+    def habits_by_frequency(self):
+        return {"daily": self.daily_habits, "weekly": self.weekly_habits, "monthly": self.monthly_habits}
+
+    def completion_rate(self, today=None):
+        """ Доля периодов с выполнением по всем привычкам с выполнениями, на текущий период включительно """
+        today = today or timezone.localdate()
+        done = elapsed = 0
+        for unit, (habits, first_sum, periods_done) in self.periods.items():
+            done += periods_done
+            elapsed += habits * (period_index(unit, today) + 1) - first_sum
+        return done / elapsed if elapsed else 0.0
+
+    def best_hour(self):
+        """ Час суток с наибольшим числом выполнений; None, если выполнений не было """
+        if not any(self.completions_by_hour):
+            return None
+        return max(range(len(self.completions_by_hour)), key=self.completions_by_hour.__getitem__)
+
+
+def new_feed_token():
+    return secrets.token_urlsafe(32)
+
+
+class CalendarFeed(models.Model):
+    """
+    Подписка на календарь привычек пользователя (ICS, main.ics). Ссылка содержит token вместо авторизации,
+    потому что календари не умеют передавать JWT; смена token отзывает старую ссылку.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name="calendar_feed", verbose_name="Пользователь")
+    token = models.CharField(max_length=64, unique=True, default=new_feed_token, verbose_name="Токен ссылки")
+    created_at = models.DateTimeField(auto_now=True, verbose_name="Дата выпуска токена")
+
+    class Meta:
+        verbose_name = "Подписка на календарь"
+        verbose_name_plural = "Подписки на календарь"
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.db.models.functions import ExtractHour, ExtractMinute, TruncDate
+from django.utils import timezone
+
+MINUTES_PER_DAY = 24 * 60
+
+# Поля привычки, которые нужны календарю помимо расписания
+OCCURRENCE_FIELDS = ("id", "action", "place")
+
+
+def interval_days(frequency, frequency_in_days):
+    """
+    Интервал повторения в днях: ежедневная привычка — раз в frequency_in_days дней (по умолчанию каждый день),
+    еженедельная — раз в 7 дней; у ежемесячной интервала нет (None) — она повторяется в тот же день месяца.
+    """
+    if frequency == "monthly":
+        return None
+    if frequency == "weekly":
+        return 7
+    return frequency_in_days or 1
+
+
+def schedule_values(queryset):
+    """
+    Строки расписания из БД без создания моделей: поля OCCURRENCE_FIELDS, периодичность, интервал, дата отсчёта
+    и минута суток. Отсчёт повторений идёт от дня создания привычки (created_at в TIME_ZONE).
+    """
+    return (queryset
+            .annotate(anchor=TruncDate("created_at"), minute=ExtractHour("time") * 60 + ExtractMinute("time"))
+            .values_list(*OCCURRENCE_FIELDS, "frequency", "frequency_in_days", "anchor", "minute")
+            .order_by("id"))
+
+
+class Occurrences:
+    """
+    Вхождения привычек за период, отсортированные по времени и id привычки.
+
+    Хранятся как массивы индексов привычек и минут от начала первого дня; словари создаются только для
+    запрошенного среза, поэтому объект можно отдавать пагинатору как список.
+    """
+
+    def __init__(self, habits, start, habit_index, minutes):
+        self.habits = habits
+        self.start = datetime.combine(start, datetime.min.time())
+        self.habit_index = habit_index
+        self.minutes = minutes
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            index = range(len(self))[item]
+            return self[index:index + 1][0]
+        return [
+            {**self.habits[index], "at": timezone.make_aware(self.start + timedelta(minutes=int(minute)))}
+            for index, minute in zip(self.habit_index[item].tolist(), self.minutes[item].tolist())
+        ]
+
+
+def month_starts(start, days):
+    month = start.replace(day=1)
+    end = start + timedelta(days=days)
+    while month < end:
+        yield month
+        month = (month + timedelta(days=32)).replace(day=1)
+
+
+def expand_occurrences(rows, start, days):
+    """
+    Все вхождения привычек schedule_values(...) за days дней с даты start.
+
+    Разворачивание векторизовано по всем привычкам: для привычек с интервалом — первый день в периоде и число
+    повторений, затем np.repeat и арифметика над массивами; для ежемесячных — по одному проходу на месяц периода.
+    Повторений раньше даты отсчёта нет. Возвращает Occurrences.
+    """
+    count = len(rows)
+    columns = list(zip(*rows)) if rows else [()] * (len(OCCURRENCE_FIELDS) + 4)
+    frequencies, frequencies_in_days, anchors, minutes_of_day = columns[len(OCCURRENCE_FIELDS):]
+    habits = [dict(zip(OCCURRENCE_FIELDS, row)) for row in rows]
+
+    steps = np.fromiter((interval_days(frequency, every) or 0 for frequency, every
+                         in zip(frequencies, frequencies_in_days)), dtype=np.int64, count=count)
+    anchor_days = np.fromiter((anchor.toordinal() for anchor in anchors), dtype=np.int64, count=count)
+    anchor_days -= start.toordinal()
+    anchor_dom = np.fromiter((anchor.day for anchor in anchors), dtype=np.int64, count=count)
+    minute_of_day = np.fromiter(minutes_of_day, dtype=np.int64, count=count)
+
+    # Привычки с интервалом: первый день в периоде не раньше даты отсчёта, затем каждые step дней
+    periodic = np.flatnonzero(steps)
+    step = steps[periodic]
+    anchor = anchor_days[periodic]
+    first = np.where(anchor > 0, anchor, anchor % step)
+    repeats = np.maximum(0, -((first - days) // step))
+    position = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    index_parts = [np.repeat(periodic, repeats)]
+    day_parts = [np.repeat(first, repeats) + position * np.repeat(step, repeats)]
+
+    # Ежемесячные: день месяца даты отсчёта, в коротких месяцах — последний день
+    monthly = np.flatnonzero(steps == 0)
+    for month in month_starts(start, days):
+        month_length = ((month + timedelta(days=32)).replace(day=1) - month).days
+        day = (month - start).days + np.minimum(anchor_dom[monthly], month_length) - 1
+        keep = (day >= 0) & (day < days) & (day >= anchor_days[monthly])
+        index_parts.append(monthly[keep])
+        day_parts.append(day[keep])
+
+    habit_index = np.concatenate(index_parts)
+    minutes = np.concatenate(day_parts) * MINUTES_PER_DAY + minute_of_day[habit_index]
+    # rows упорядочены по id, поэтому индекс привычки сортирует одновременные вхождения по id
+    order = np.lexsort((habit_index, minutes))
+    return Occurrences(habits, start, habit_index[order], minutes[order])
+
+
+def habit_occurrences(queryset, start, days):
+    return expand_occurrences(list(schedule_values(queryset)), start, days)
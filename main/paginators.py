@@ -1,7 +1,44 @@
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
 
 
 class HabitPaginator(PageNumberPagination):
     page_size = 5
     page_size_query_param = 'page_size'
     max_page_size = 5
+
+    def get_paginated_data(self, data):
+        return {
+            'count': self.page.paginator.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    async def apaginate_queryset(self, queryset, request):
+        """ Асинхронный вариант paginate_queryset: количество и строки страницы читаются через async ORM """
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Количество подставляется заранее, чтобы Paginator не выполнял синхронный count()
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        return [row async for row in self.page.object_list]
+
+
+class CalendarPaginator(HabitPaginator):
+    """ Страницы календаря: вхождений много даже у небольшого числа привычек """
+    page_size = 100
+    max_page_size = 1000
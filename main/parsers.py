@@ -0,0 +1,29 @@
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from main.renderers import FastJSONRenderer, orjson
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSON-парсер на orjson для тел запросов в UTF-8.
+
+    Остальные кодировки обрабатывает стандартный JSONParser; он же
+    повторно разбирает невалидные документы, чтобы ошибка ParseError
+    была в привычном формате.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,73 @@
+import datetime
+import io
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Model
+from django.utils.duration import duration_iso_string
+
+
+def supports_copy(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == "postgresql"
+
+
+def format_value(value):
+    """Значение для COPY в формате CSV: NULL — пустое поле без кавычек, строки всегда в кавычках."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, Model):
+        return str(value.pk)
+    if isinstance(value, datetime.timedelta):
+        value = duration_iso_string(value)
+    elif isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def copy_rows(model, field_names, rows, using=DEFAULT_DB_ALIAS):
+    """
+    Загружает строки в таблицу модели через COPY ... FROM STDIN.
+
+    В обход ORM: значения по умолчанию, auto_now и сигналы не применяются,
+    все значения должны быть переданы явно в порядке field_names.
+    """
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    columns = ", ".join(quote_name(model._meta.get_field(name).column) for name in field_names)
+    sql = f"COPY {quote_name(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(map(format_value, row)))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    with connection.cursor() as cursor:
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, "copy_expert"):
+            raw_cursor.copy_expert(sql, buffer)
+        else:
+            with raw_cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def reserve_ids(model, count, using=DEFAULT_DB_ALIAS):
+    """
+    Резервирует count подряд идущих значений первичного ключа и возвращает первое.
+
+    Нужен, чтобы строки для COPY могли ссылаться друг на друга по id. Таблица блокируется от вставок только
+    на время резервирования: последовательность сдвигается одним setval.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {connection.ops.quote_name(table)} IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [table, model._meta.pk.column])
+        sequence = cursor.fetchone()[0]
+        cursor.execute("SELECT nextval(%s)", [sequence])
+        first = cursor.fetchone()[0]
+        cursor.execute("SELECT setval(%s, %s)", [sequence, first + count - 1])
+    return first
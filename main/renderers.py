@@ -0,0 +1,58 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+SCALAR_TYPES = frozenset((str, int, bool, type(None)))
+
+
+def has_unsafe_floats(value):
+    """
+    Есть ли в данных float, который orjson запишет не так, как json: NaN и бесконечности (orjson пишет null,
+    а JSONRenderer при STRICT_JSON отказывается) и числа, которые json пишет в экспоненциальной форме
+    (1e+16 и 1e-05, у orjson — 1e16 и 0.00001). Обходятся только контейнеры и float, включая подклассы:
+    serializer.data — это ReturnDict/ReturnList.
+    """
+    if isinstance(value, float):
+        return not (value == 0 or 1e-4 <= abs(value) < 1e16)
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, (list, tuple)):
+        return False
+    for item in value:
+        # Строки, числа и None — большая часть ответа — отсеиваются без вызова функции
+        if item.__class__ in SCALAR_TYPES:
+            continue
+        if has_unsafe_floats(item):
+            return True
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON-рендерер на orjson.
+
+    Вывод побайтно совпадает с JSONRenderer: даты, время и timedelta
+    передаются в encoder_class DRF, U+2028/U+2029 экранируются так же.
+    Если orjson не установлен, нужен отступ, данные ему не по силам или
+    в них есть float, который orjson записал бы иначе (has_unsafe_floats),
+    используется стандартный JSONRenderer.
+    """
+    options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None or has_unsafe_floats(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
@@ -0,0 +1,126 @@
+from datetime import timedelta
+
+from django.db.models import Q
+
+from main.models import Habit
+
+MAX_TIME_DOING = timedelta(seconds=120)
+
+REWARD_WITH_ASSOCIATED = "Невозможен одновременный выбор связанной привычки и указания вознаграждения."
+ASSOCIATED_NOT_PLEASENT = "В связанные привычки могут попадать только привычки с признаком приятной привычки."
+ASSOCIATED_NOT_FOUND = "Связанная привычка не найдена."
+TIME_DOING_TOO_LONG = "Время выполнения должно быть не больше 120 секунд"
+PLEASENT_WITH_REWARD = "У приятной привычки не может быть вознаграждения или связанной привычки."
+FREQUENCY_OUT_OF_RANGE = "Нельзя выполнять привычку реже, чем 1 раз в 7 дней."
+
+
+def check_reward(attrs, associated):
+    if attrs.get("reward") and attrs.get("associated_habit") is not None:
+        return "reward", REWARD_WITH_ASSOCIATED
+
+
+def check_associated(attrs, associated):
+    if attrs.get("associated_habit") is None:
+        return None
+    if associated is None:
+        return "associated_habit", ASSOCIATED_NOT_FOUND
+    if not associated:
+        return "associated_habit", ASSOCIATED_NOT_PLEASENT
+
+
+def check_time_doing(attrs, associated):
+    time_doing = attrs.get("time_doing")
+    if time_doing is not None and time_doing > MAX_TIME_DOING:
+        return "time_doing", TIME_DOING_TOO_LONG
+
+
+def check_pleasent(attrs, associated):
+    if attrs.get("is_pleasent") and (attrs.get("reward") or attrs.get("associated_habit") is not None):
+        return "is_pleasent", PLEASENT_WITH_REWARD
+
+
+def check_frequency(attrs, associated):
+    frequency_in_days = attrs.get("frequency_in_days")
+    if frequency_in_days is not None and not 1 <= frequency_in_days <= 7:
+        return "frequency_in_days", FREQUENCY_OUT_OF_RANGE
+
+
+RULES = (check_reward, check_associated, check_time_doing, check_pleasent, check_frequency)
+
+
+class HabitRuleEngine:
+    """
+    Проверяет правила привычек за один проход по списку строк.
+
+    Строка — словарь значений полей (как validated_data сериализатора).
+    Признак is_pleasent связанных привычек, переданных по pk, читается
+    одним запросом на весь список; уже загруженные экземпляры Habit
+    используются как есть. Результат — ошибки по полям для каждой строки.
+    """
+
+    def __init__(self, rules=RULES):
+        self.rules = rules
+
+    def resolve(self, rows, user=None):
+        """Возвращает {pk: is_pleasent} для связанных привычек, переданных по pk и видимых user."""
+        ids = {
+            row["associated_habit"] for row in rows
+            if row.get("associated_habit") is not None and not isinstance(row["associated_habit"], Habit)
+        }
+        if not ids:
+            return {}
+        queryset = Habit.objects.filter(pk__in=ids)
+        if user is not None:
+            queryset = queryset.filter(Q(user=user) | Q(is_public=True))
+        return dict(queryset.values_list("pk", "is_pleasent"))
+
+    def validate_many(self, rows, user=None):
+        """
+        user — владелец строк: связанной может быть только его или публичная привычка, чужая приватная
+        считается ненайденной.
+        """
+        pleasent_by_pk = self.resolve(rows, user)
+        results = []
+        for row in rows:
+            value = row.get("associated_habit")
+            if isinstance(value, Habit):
+                visible = user is None or value.user_id == user.pk or value.is_public
+                associated = value.is_pleasent if visible else None
+            else:
+                associated = pleasent_by_pk.get(value)
+
+            errors = {}
+            for rule in self.rules:
+                error = rule(row, associated)
+                if error:
+                    field, message = error
+                    errors.setdefault(field, []).append(message)
+            results.append(errors)
+        return results
+
+    def check(self, attrs, user=None):
+        return self.validate_many([attrs], user)[0]
+
+
+habit_rules = HabitRuleEngine()
+
+
+def rule_fields_of(habit):
+    """Значения полей правил из сохранённой привычки без загрузки связанной привычки."""
+    return {
+        "reward": habit.reward,
+        "associated_habit": habit.associated_habit_id,
+        "time_doing": habit.time_doing,
+        "is_pleasent": habit.is_pleasent,
+        "frequency_in_days": habit.frequency_in_days,
+    }
+
+
+def as_model_attrs(attrs):
+    """Заменяет pk связанной привычки на associated_habit_id, чтобы передать значения в Habit(...)."""
+    value = attrs.get("associated_habit")
+    if value is None or isinstance(value, Habit):
+        return attrs
+    attrs = dict(attrs)
+    attrs["associated_habit_id"] = attrs.pop("associated_habit")
+    return attrs
@@ -1,23 +1,175 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.fields import BooleanField, CharField, ChoiceField, DateTimeField, IntegerField
+from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.serializers import ModelSerializer
 
-from main.models import Habit
-from main.validators import (
-    RewardHabitValidator,
-    RelatedHabitValidator,
-    DurationTimeHabitValidator,
-    PleasentHabitValidator,
-    RegularityHabitValidator,
-)
+from config.profiling import ProfiledSerializerMixin, profiled
+from main.models import CalendarFeed, Habit, HabitProgress, HabitWeeklyRollup, UserHabitStats
+from main.validators import HabitRulesValidator
+
+
+class HabitSerializer(ProfiledSerializerMixin, ModelSerializer):
+    """
+    Сериализатор привычки.
 
+    fields — оставить только перечисленные поля.
+    batch — режим массовых операций: associated_habit принимается как pk без
+    запроса к БД, а правила проверяются снаружи через HabitRuleEngine для всей пачки.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        batch = kwargs.pop("batch", False)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if batch:
+            self.fields["associated_habit"] = IntegerField(required=False, allow_null=True)
+            self.validators = []
 
-class HabitSerializer(ModelSerializer):
     class Meta:
         model = Habit
-        fields = "__all__"
-        validators = [
-            RewardHabitValidator(field1="reward", field2="associated_habit"),
-            RelatedHabitValidator(field="associated_habit"),
-            DurationTimeHabitValidator(field="time_doing"),
-            PleasentHabitValidator(field="is_pleasent"),
-            RegularityHabitValidator(field="frequency_in_days"),
+        exclude = ("search_vector",)
+        validators = [HabitRulesValidator()]
+
+
+class HabitValuesSerializer:
+    """
+    Быстрая сериализация только для чтения.
+
+    Строки берутся из values_list() без создания экземпляров модели, а
+    преобразование выполняется только для полей, которым оно нужно
+    (время, длительность, дата изменения). Результат совпадает с
+    HabitSerializer(many=True).data.
+    """
+
+    # Поля, значения которых из values_list() уже имеют нужный вид
+    passthrough_fields = (BooleanField, CharField, ChoiceField, IntegerField, PrimaryKeyRelatedField)
+
+    def __init__(self, fields=None):
+        self.declared = HabitSerializer(fields=fields).fields
+        self.field_names = list(self.declared)
+
+    def get_converter(self, field):
+        if isinstance(field, DateTimeField) and getattr(field, "format", ISO_8601) == ISO_8601:
+            # Часовой пояс определяется один раз на выборку, а не для каждой строки
+            field_timezone = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+            if field_timezone is None:
+                return field.to_representation
+
+            def convert_datetime(value):
+                if timezone.is_naive(value):
+                    return field.to_representation(value)
+                value = value.astimezone(field_timezone).isoformat()
+                return value[:-6] + "Z" if value.endswith("+00:00") else value
+            return convert_datetime
+        return field.to_representation
+
+    def get_values(self, queryset):
+        return queryset.values_list(*self.field_names)
+
+    def iter_representation(self, rows):
+        field_names = self.field_names
+        converters = [
+            (name, self.get_converter(field))
+            for name, field in self.declared.items()
+            if not isinstance(field, self.passthrough_fields)
         ]
+        for row in rows:
+            item = dict(zip(field_names, row))
+            for name, convert in converters:
+                value = item[name]
+                if value is not None:
+                    item[name] = convert(value)
+            yield item
+
+    @profiled("serializer")
+    def to_representation(self, rows):
+        return list(self.iter_representation(rows))
+
+    def serialize(self, queryset):
+        return self.to_representation(self.get_values(queryset))
+
+
+class HabitCheckInSerializer(serializers.Serializer):
+    """ Отметка о выполнении: done_at по умолчанию — сейчас, задним числом — не раньше CHECKIN_BACKFILL_DAYS дней """
+    done_at = DateTimeField(required=False)
+
+    def validate_done_at(self, value):
+        now = timezone.now()
+        if value > now + timedelta(minutes=1):
+            raise serializers.ValidationError("Нельзя отметить выполнение в будущем.")
+        if value < now - timedelta(days=settings.CHECKIN_BACKFILL_DAYS):
+            raise serializers.ValidationError(
+                f"Отметить выполнение можно не раньше чем за {settings.CHECKIN_BACKFILL_DAYS} дн.")
+        return value
+
+
+class HabitWeeklyRollupSerializer(ModelSerializer):
+    class Meta:
+        model = HabitWeeklyRollup
+        fields = ("week", "completions", "days")
+
+
+class HabitProgressSerializer(ModelSerializer):
+    """ Прогресс привычки: серия и доля выполнения считаются на текущий день по сохранённым итогам """
+    streak = serializers.SerializerMethodField()
+    completion_rate = serializers.SerializerMethodField()
+
+    class Meta:
+        model = HabitProgress
+        fields = ("habit", "period_unit", "streak", "longest_streak", "completion_rate", "total_completions",
+                  "last_done_at")
+
+    def get_streak(self, progress):
+        return progress.streak()
+
+    def get_completion_rate(self, progress):
+        return round(progress.completion_rate(), 4)
+
+
+class UserHabitStatsSerializer(ModelSerializer):
+    """ Статистика привычек пользователя; доля выполнения и лучший час считаются по сохранённым суммам """
+    habits = serializers.SerializerMethodField()
+    completion_rate = serializers.SerializerMethodField()
+    best_hour = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UserHabitStats
+        fields = ("habits", "completions", "completion_rate", "best_hour", "completions_by_hour", "refreshed_at")
+
+    def get_habits(self, stats):
+        by_frequency = stats.habits_by_frequency()
+        return {"total": sum(by_frequency.values()), **by_frequency}
+
+    def get_completion_rate(self, stats):
+        return round(stats.completion_rate(), 4)
+
+    def get_best_hour(self, stats):
+        return stats.best_hour()
+
+
+class HabitOccurrenceSerializer(serializers.Serializer):
+    """ Вхождение привычки в календаре (main.occurrences.Occurrences) """
+    habit = IntegerField(source="id")
+    action = CharField()
+    place = CharField()
+    at = DateTimeField()
+
+
+class CalendarFeedSerializer(ModelSerializer):
+    """ Ссылка на подписку на календарь привычек (ICS) """
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CalendarFeed
+        fields = ("url", "created_at")
+
+    def get_url(self, feed):
+        return self.context["request"].build_absolute_uri(reverse("main:calendar_feed_ics", args=[feed.token]))
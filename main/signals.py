@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from main.ics import forget_feeds, forget_token
+from main.models import CalendarFeed, Habit
+from main.stats import mark_stats_changed
+from main.trending import record_adoptions
+
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def mark_habit_stats_changed(sender, instance, **kwargs):
+    """ Статистика владельца пересчитается задачей refresh_habit_stats; массовые записи отмечают её сами """
+    mark_stats_changed([instance.user_id])
+
+
+@receiver(post_save, sender=Habit)
+def count_habit_adoption(sender, instance, created, **kwargs):
+    if created:
+        record_adoptions([instance])
+
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def forget_habit_feed(sender, instance, **kwargs):
+    forget_feeds([instance.user_id])
+
+
+@receiver(post_delete, sender=CalendarFeed)
+def forget_deleted_feed(sender, instance, **kwargs):
+    forget_token(instance.token)
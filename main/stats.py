@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from main.models import Habit, HabitCompletion, HabitProgress, UserHabitStats
+
+# Строка создаётся при первой записи; пустые periods и completions_by_hour — '{}' в JSON и в массиве
+STATS_CHANGED_SQL = """
+INSERT INTO {table} AS stats (user_id, daily_habits, weekly_habits, monthly_habits, completions, periods,
+                              completions_by_hour, changes, refreshed_changes)
+SELECT user_id, 0, 0, 0, 0, '{{}}', '{{}}', 1, 0 FROM unnest(%s::bigint[]) AS changed(user_id)
+ON CONFLICT (user_id) DO UPDATE SET changes = stats.changes + 1
+"""
+STATS_FIELDS = ("daily_habits", "weekly_habits", "monthly_habits", "completions", "periods", "completions_by_hour",
+                "refreshed_changes", "refreshed_at")
+
+
+def mark_stats_changed(user_ids):
+    """
+    Отмечает статистику пользователей устаревшей. Вызывается в транзакции записи привычек или отметок:
+    отметка фиксируется вместе с данными, поэтому пересчёт, прочитавший счётчик, видит и сами изменения.
+    """
+    user_ids = sorted({user_id for user_id in user_ids if user_id is not None})
+    if not user_ids:
+        return
+    with connection.cursor() as cursor:
+        # Строки блокируются в порядке user_id — параллельные записи не ждут друг друга по кругу
+        cursor.execute(STATS_CHANGED_SQL.format(table=connection.ops.quote_name(UserHabitStats._meta.db_table)),
+                       [user_ids])
+
+
+def refresh_user_stats(user_ids):
+    """
+    Пересчитывает статистику пользователей тремя агрегирующими запросами на всю пачку.
+
+    Счётчик changes читается до агрегатов: изменения, зафиксированные после этого, увеличат его ещё раз,
+    и строка останется устаревшей до следующего пересчёта.
+    """
+    user_ids = list(user_ids)
+    versions = dict(UserHabitStats.objects.filter(user_id__in=user_ids).values_list("user_id", "changes"))
+    now = timezone.now()
+    stats = {
+        user_id: UserHabitStats(user_id=user_id, periods={}, completions_by_hour=[0] * 24,
+                                refreshed_changes=versions.get(user_id, 0), refreshed_at=now)
+        for user_id in user_ids
+    }
+
+    habits = (Habit.objects.filter(user_id__in=user_ids).order_by()
+              .values_list("user_id", "frequency").annotate(count=Count("id")))
+    for user_id, frequency, count in habits:
+        if frequency in ("daily", "weekly", "monthly"):
+            setattr(stats[user_id], f"{frequency}_habits", count)
+
+    progress = (HabitProgress.objects.filter(habit__user_id__in=user_ids).order_by()
+                .values_list("habit__user_id", "period_unit")
+                .annotate(started=Count("habit_id", filter=Q(first_period__isnull=False)),
+                          first_sum=Sum("first_period"), done=Sum("periods_done"), total=Sum("total_completions")))
+    for user_id, unit, started, first_sum, done, total in progress:
+        stats[user_id].completions += total
+        if started:
+            stats[user_id].periods[unit] = [started, first_sum, done]
+
+    since = now - timedelta(days=settings.STATS_BEST_TIME_DAYS)
+    hours = (HabitCompletion.objects.filter(user_id__in=user_ids, done_at__gte=since).order_by()
+             .values_list("user_id", ExtractHour("done_at")).annotate(count=Count("id")))
+    for user_id, hour, count in hours:
+        stats[user_id].completions_by_hour[hour] = count
+
+    UserHabitStats.objects.bulk_create(stats.values(), update_conflicts=True, unique_fields=["user"],
+                                       update_fields=STATS_FIELDS)
+    return stats
+
+
+def stale_stats():
+    """ Статистика с неучтёнными изменениями или пересчитанная раньше STATS_MAX_AGE назад """
+    expired = timezone.now() - timedelta(seconds=settings.STATS_MAX_AGE)
+    return UserHabitStats.objects.filter(Q(changes__gt=F("refreshed_changes")) | Q(refreshed_at__lt=expired))
+
+
+def refresh_stale_stats(batch_size=None):
+    """
+    Один проход по устаревшей статистике пачками по возрастанию user_id; возвращает число пересчитанных строк.
+    Пользователь, изменивший данные во время прохода, будет пересчитан следующим запуском.
+    """
+    batch_size = batch_size or settings.STATS_REFRESH_BATCH
+    refreshed = 0
+    last_id = 0
+    while True:
+        user_ids = list(stale_stats().filter(user_id__gt=last_id).order_by("user_id")
+                        .values_list("user_id", flat=True)[:batch_size])
+        if not user_ids:
+            return refreshed
+        refresh_user_stats(user_ids)
+        refreshed += len(user_ids)
+        last_id = user_ids[-1]
@@ -2,16 +2,34 @@ from datetime import timedelta, datetime
 from celery import shared_task
 from django.utils import timezone
 
+from config.db_router import replica_reads
 from main.models import Habit
 from main.services import send_tg_message
+from main.stats import refresh_stale_stats
+from main.trending import BOARDS, compact
 
 
 @shared_task()
 def tg_notification():
     current_time = timezone.now()
     current_time_less = current_time - timedelta(minutes=5)
-    habits = Habit.objects.filter(time__lte=current_time.time(), time__gte=current_time_less.time())
+    # Выборка только читает, поэтому идёт на реплику
+    with replica_reads():
+        habits = list(Habit.objects.filter(time__lte=current_time.time(), time__gte=current_time_less.time())
+                      .select_related("user"))
     for habit in habits:
         user_tg = habit.user.tg_chat_id
         message = f"я буду {habit.action} в {habit.time} в {habit.place}"
         send_tg_message(user_tg, message)
+
+
+@shared_task()
+def refresh_habit_stats():
+    """ Пересчёт устаревшей статистики пользователей (GET /stats/); запускается каждые STATS_REFRESH_INTERVAL """
+    return refresh_stale_stats()
+
+
+@shared_task()
+def compact_trending():
+    """ Сжатие рейтингов популярных привычек; запускается каждые TRENDING_COMPACT_INTERVAL """
+    return {board: compact(board) for board in BOARDS}
@@ -1,23 +1,48 @@
-from django.db import IntegrityError
+import json
+import time
+
+import fakeredis
+from asgiref.sync import async_to_sync
+from redis import ConnectionError as RedisConnectionError
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.conf import settings
+from django.test import RequestFactory, override_settings
+from django.db import DatabaseError, IntegrityError, connections
 from django.utils import timezone
+from django.utils.http import http_date
 from users.models import User
+from config.db_router import (PrimaryReplicaRouter, ReplicaRoutingMiddleware, replica_lag, replica_reads,
+                              sticky_key)
+from config.metrics import DB_CONNECTIONS_OPEN, DB_CONNECTIONS_OPENED
+from main.management.commands.celery_stats import histogram_quantile, summarize
+from main.tasks import compact_trending, refresh_habit_stats, tg_notification
+from prometheus_client import REGISTRY
+from config.throttling import SlidingWindowThrottle
+from main.async_views import AsyncHabitView
+from main.checkin_stream import CheckinStreamConsumer
+from main.completions import record_completions
+from main.datagen import HabitDatasetGenerator
+from main.occurrences import expand_occurrences, interval_days
+from main.rules import habit_rules, rule_fields_of
 from main.paginators import HabitPaginator
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import status
 from django.contrib.auth.models import User
 from rest_framework.test import APIRequestFactory
 from main.permissions import IsOwner
 from celery.contrib import pytest
-from main.serializers import HabitSerializer
+from main.serializers import HabitSerializer, HabitValuesSerializer
+from main.renderers import FastJSONRenderer
+from main.parsers import FastJSONParser
 from config.settings import TELEGRAM_URL, TELEGRAM_TOKEN
 from main.services import send_tg_message
 from datetime import timedelta
 from unittest import mock
-from main.models import Habit
-from main.validators import RelatedHabitValidator, DurationTimeHabitValidator, RewardHabitValidator, \
-    PleasentHabitValidator
+from main.models import Habit, HabitDailyRollup, HabitWeeklyRollup, UserHabitStats
 from unittest import TestCase
-from main.validators import RegularityHabitValidator
 from rest_framework.serializers import ValidationError
 
 
@@ -315,12 +340,6 @@ def test_is_owner_different_habit():
     assert not permission.has_object_permission(request, None, habit)
 
 
-def test_reward_not_empty_when_associated_habit_provided():
-    habit = Habit(reward="Test Reward", associated_habit="Test Habit")
-    serializer = HabitSerializer(instance=habit)
-    assert RewardHabitValidator(field1="reward", field2="associated_habit").validate(serializer.validated_data) is None
-
-
 def test_error_when_associated_habit_not_provided_but_reward_is():
     habit = Habit(reward="Test Reward", associated_habit=None)
     serializer = HabitSerializer(instance=habit)
@@ -337,12 +356,6 @@ def test_associated_habit_cannot_be_a_habit_itself():
     assert str(e.value) == "Associated habit cannot be a habit itself."
 
 
-def test_time_doing_is_positive_integer():
-    habit = Habit(time_doing=10)
-    serializer = HabitSerializer(instance=habit)
-    assert DurationTimeHabitValidator(field="time_doing").validate(serializer.validated_data) is None
-
-
 def test_error_when_time_doing_not_provided():
     habit = Habit(reward="Test Reward", associated_habit="Test Habit", time_doing=None)
     serializer = HabitSerializer(instance=habit)
@@ -420,429 +433,1186 @@ class TestSendTgMessage(TestCase):
             send_tg_message(chat_id, message)
 
 
-class RewardHabitValidatorTestCase(TestCase):
-    def setUp(self):
-        self.validator = RewardHabitValidator('related_habit', 'reward')
-
-    def test_raise_validation_error_when_both_related_habit_and_reward_are_provided(self):
-        data = {'related_habit': 'some_related_habit', 'reward': 'some_reward'}
-        with self.assertRaises(ValidationError) as cm:
-            self.validator(data)
-        self.assertEqual(
-            str(cm.exception),
-            "Невозможен одновременный выбор связанной привычки и указания вознаграждения."
-        )
-
-
-class RewardHabitValidatorTestCase(TestCase):
-    def test_should_not_raise_validation_error_when_only_related_habit_provided(self):
-        validator = RewardHabitValidator('reward', 'related_habit')
-        data = {'related_habit': 'Test related habit'}
-        try:
-            validator(data)
-        except ValidationError as e:
-            self.fail(f"ValidationError was raised: {e}")
-
-
-class RewardHabitValidatorTestCase(TestCase):
-    def test_raises_validation_error_when_related_habit_and_reward_are_empty_strings(self):
-        validator = RewardHabitValidator('related_habit', 'reward')
-        data = {'related_habit': '', 'reward': ''}
-        with self.assertRaises(ValidationError) as cm:
-            validator(data)
-        self.assertEqual(
-            cm.exception.detail,
-            "Невозможен одновременный выбор связанной привычки и указания вознаграждения."
-        )
+def create_habit(user, **kwargs):
+    defaults = {
+        'place': 'Дом',
+        'time': '08:00',
+        'action': 'Зарядка',
+        'frequency_in_days': 1,
+        'time_doing': timedelta(seconds=60),
+    }
+    defaults.update(kwargs)
+    return Habit.objects.create(user=user, **defaults)
 
 
-class RewardHabitValidatorTestCase(TestCase):
+class HabitConditionalGetTestCase(APITestCase):
     def setUp(self):
-        self.validator = RewardHabitValidator('related_habit', 'reward')
-
-    def test_raises_validation_error_when_related_habit_is_provided_as_none(self):
-        value = {'related_habit': None, 'reward': 'some reward'}
-        with self.assertRaises(ValidationError) as cm:
-            self.validator(value)
-        self.assertEqual(
-            cm.exception.detail,
-            "Невозможен одновременный выбор связанной привычки и указания вознаграждения."
-        )
-
-
-class RewardHabitValidatorTestCase(TestCase):
+        self.user = get_user_model().objects.create(email='etag@example.com')
+        self.client.force_authenticate(self.user)
+        self.habit = create_habit(self.user)
+
+    def test_retrieve_returns_304_for_matching_etag(self):
+        url = f'/retrieve/{self.habit.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response.headers['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.habit.place = 'Парк'
+        self.habit.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_list_etag_changes_when_habit_is_added(self):
+        response = self.client.get('/list/')
+        etag = response.headers['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/list/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        create_habit(self.user, action='Чтение')
+        response = self.client.get('/list/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+
+    def test_list_is_not_stale_after_delete(self):
+        create_habit(self.user, action='Чтение')
+        since = http_date(time.time() + 60)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.assertIn('Last-Modified', self.client.get(f'/retrieve/{self.habit.pk}/'))
+
+        # Удаление не меняет max(updated_at): по дате изменения список был бы 304 с удалённой привычкой
+        self.habit.delete()
+        for url in ('/list/', '/async/list/'):
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('Last-Modified', response)
+        self.assertEqual(response.json()['count'], 1)
+
+
+class HabitBulkAPITestCase(APITestCase):
     def setUp(self):
-        self.validator = RewardHabitValidator('reward', 'related_habit')
-
-    def test_raise_validation_error_when_reward_is_provided(self):
-        data = {'reward': None, 'related_habit': 'habit1'}
-        with self.assertRaises(ValidationError) as cm:
-            self.validator(data)
-        self.assertEqual(
-            str(cm.exception),
-            "Невозможен одновременный выбор связанной привычки и указания вознаграждения."
-        )
-
-
-def test_reward_habit_validator_related_habit_as_number():
-    validator = RewardHabitValidator('related_habit', 'reward')
-    value = {'related_habit': 123, 'reward': None}
-    try:
-        validator(value)
-    except ValidationError as e:
-        assert str(e) == "Невозможен одновременный выбор связанной привычки и указания вознаграждения."
-    else:
-        assert False, "ValidationError was not raised"
-
-
-def test_reward_habit_validator_raises_validation_error_when_reward_is_provided_as_number():
-    validator = RewardHabitValidator('reward', 'related_habit')
-    data = {'reward': 100, 'related_habit': None}
-    with self.assertRaises(ValidationError) as cm:
-        validator(data)
-    self.assertEqual(
-        cm.exception.message,
-        "Невозможен одновременный выбор связанной привычки и указания вознаграждения."
-    )
-
-
-class RewardHabitValidatorTestCase(TestCase):
+        self.user = get_user_model().objects.create(email='bulk@example.com')
+        self.client.force_authenticate(self.user)
+
+    def habit_payload(self, **kwargs):
+        payload = {'place': 'Дом', 'time': '08:00', 'action': 'Зарядка', 'frequency_in_days': 1,
+                   'time_doing': '00:01:00'}
+        payload.update(kwargs)
+        return payload
+
+    def test_bulk_create_reports_per_item_results(self):
+        items = [self.habit_payload(), self.habit_payload(time_doing='00:05:00'), self.habit_payload(action='Бег')]
+        response = self.client.post('/bulk/create/', items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([item['status'] for item in response.data], ['created', 'invalid', 'created'])
+        self.assertEqual(Habit.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_update_changes_only_own_habits(self):
+        own = create_habit(self.user)
+        other = create_habit(get_user_model().objects.create(email='other@example.com'))
+        items = [{'id': own.pk, 'place': 'Парк'}, {'id': other.pk, 'place': 'Парк'}]
+        response = self.client.patch('/bulk/update/', items, format='json')
+
+        self.assertEqual([item['status'] for item in response.data], ['updated', 'not_found'])
+        own.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(own.place, 'Парк')
+        self.assertEqual(other.place, 'Дом')
+
+    def test_bulk_destroy(self):
+        habits = [create_habit(self.user), create_habit(self.user)]
+        response = self.client.post('/bulk/destroy/', [habit.pk for habit in habits], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Habit.objects.filter(user=self.user).exists())
+
+    def test_bulk_operations_do_not_treat_booleans_as_ids(self):
+        habit = create_habit(self.user, id=1)
+
+        response = self.client.patch('/bulk/update/', [{'id': True, 'place': 'Парк'}], format='json')
+        self.assertEqual([item['status'] for item in response.data], ['not_found'])
+        response = self.client.post('/bulk/destroy/', [True], format='json')
+        self.assertEqual([item['status'] for item in response.data], ['not_found'])
+        habit.refresh_from_db()
+        self.assertEqual(habit.place, 'Дом')
+
+    def test_bulk_create_links_only_own_or_public_habits(self):
+        stranger = get_user_model().objects.create(email='stranger-bulk@example.com')
+        private = create_habit(stranger, is_pleasent=True, frequency_in_days=None)
+        public = create_habit(stranger, is_pleasent=True, frequency_in_days=None, is_public=True)
+        items = [self.habit_payload(associated_habit=private.pk), self.habit_payload(associated_habit=public.pk)]
+        response = self.client.post('/bulk/create/', items, format='json')
+
+        self.assertEqual([item['status'] for item in response.data], ['invalid', 'created'])
+        self.assertIn('associated_habit', response.data[0]['errors'])
+
+    def test_create_assigns_current_user(self):
+        response = self.client.post('/create/', self.habit_payload(), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Habit.objects.get(pk=response.data['id']).user, self.user)
+
+    def test_create_links_only_own_or_public_habits(self):
+        stranger = get_user_model().objects.create(email='stranger-create@example.com')
+        private = create_habit(stranger, is_pleasent=True, frequency_in_days=None)
+        public = create_habit(stranger, is_pleasent=True, frequency_in_days=None, is_public=True)
+
+        response = self.client.post('/create/', self.habit_payload(associated_habit=private.pk), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('associated_habit', response.data)
+        response = self.client.post('/create/', self.habit_payload(associated_habit=public.pk), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class HabitSerializationTestCase(APITestCase):
     def setUp(self):
-        self.validator = RewardHabitValidator('related_habit', 'reward')
-
-
-def test_related_habit_validator_should_not_raise_error_when_related_habit_is_pleasant():
-    validator = RelatedHabitValidator('related_habit')
-    related_habit = MagicMock()
-    related_habit.is_pleasent = True
-    data = {'related_habit': related_habit}
-    validator(data)
+        self.user = get_user_model().objects.create(email='fields@example.com')
+        self.client.force_authenticate(self.user)
+        pleasant = create_habit(self.user, is_pleasent=True, frequency_in_days=None)
+        create_habit(self.user, associated_habit=pleasant, time='07:30:15', reward=None)
 
+    def test_values_serializer_matches_model_serializer(self):
+        queryset = Habit.objects.order_by('id')
+        self.assertEqual(HabitValuesSerializer().serialize(queryset),
+                         [dict(item) for item in HabitSerializer(queryset, many=True).data])
 
-def test_related_habit_validator_empty_string():
-    validator = RelatedHabitValidator('related_habit')
-    habit = {'related_habit': ''}
-    try:
-        validator(habit)
-    except ValidationError as e:
-        assert str(e) == "В связанные привычки могут попадать только привычки с признаком приятной привычки."
-    else:
-        assert False, "ValidationError was not raised"
+    def test_list_returns_only_requested_fields(self):
+        response = self.client.get('/list/', {'fields': 'id,action'})
 
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'action'})
 
-class TestDurationTimeHabitValidator(TestCase):
-    def setUp(self):
-        self.validator = DurationTimeHabitValidator('duration')
-
-    def test_valid_timedelta_within_limit(self):
-        value = {'duration': timedelta(seconds=119)}
-        self.validator(value)
+    def test_retrieve_returns_only_requested_fields(self):
+        habit = Habit.objects.first()
+        response = self.client.get(f'/retrieve/{habit.pk}/', {'fields': 'time,place'})
 
-    def test_invalid_timedelta_exceeding_limit(self):
-        value = {'duration': timedelta(seconds=121)}
-        with self.assertRaises(ValidationError):
-            self.validator(value)
+        self.assertEqual(response.data, {'time': habit.time.isoformat(), 'place': habit.place})
 
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/list/', {'fields': 'password'})
 
-class TestDurationTimeHabitValidator(TestCase):
-    def test_duration_time_habit_validator_with_different_field_names(self):
-        # Test with different field names
-        validator1 = DurationTimeHabitValidator('execution_time')
-        validator2 = DurationTimeHabitValidator('duration')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-        # Test with valid input
-        self.assertIsNone(validator1({'execution_time': timedelta(seconds=100)}))
-        self.assertIsNone(validator2({'duration': timedelta(seconds=100)}))
 
-        # Test with invalid input
-        with self.assertRaises(ValidationError):
-            validator1({'execution_time': timedelta(seconds=121)})
+class FastJSONTestCase(TestCase):
+    def test_renderer_output_matches_drf_renderer(self):
+        from rest_framework.renderers import JSONRenderer
 
-        with self.assertRaises(ValidationError):
-            validator2({'duration': timedelta(seconds=121)})
+        data = {
+            'time': timezone.now().time(),
+            'updated_at': timezone.now(),
+            'time_doing': timedelta(seconds=90),
+            'action': 'Прогулка \u2028 в парке',
+            1: [1.5, None, True, ('a', 'b')],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
 
+    def test_renderer_matches_drf_on_exponent_floats(self):
+        from rest_framework.renderers import JSONRenderer
 
-class TestDurationTimeHabitValidator(TestCase):
-    def setUp(self):
-        self.validator = DurationTimeHabitValidator('duration_time')
+        for value in (1e16, -2.5e20, 1e-7, 1e-05, 5e-324, [0.0001, {'score': 1e16}]):
+            with self.subTest(value=value):
+                self.assertEqual(FastJSONRenderer().render({'value': value}), JSONRenderer().render({'value': value}))
+        self.assertEqual(FastJSONRenderer().render([1e16]), b'[1e+16]')
 
-    def test_valid_timedelta_value(self):
-        value = {'duration_time': timedelta(minutes=1)}
-        self.validator(value)
+    def test_renderer_checks_serializer_containers(self):
+        from collections import OrderedDict
 
-    def test_invalid_timedelta_value_minutes(self):
-        value = {'duration_time': timedelta(minutes=3)}
-        with self.assertRaises(ValidationError) as cm:
-            self.validator(value)
-        self.assertEqual(str(cm.exception), "Время выполнения должно быть не больше 120 секунд")
+        from rest_framework.renderers import JSONRenderer
+        from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
 
-    def test_invalid_timedelta_value_hours(self):
-        value = {'duration_time': timedelta(hours=1)}
-        with self.assertRaises(ValidationError) as cm:
-            self.validator(value)
-        self.assertEqual(str(cm.exception), "Время выполнения должно быть не больше 120 секунд")
+        for data in (ReturnDict({'a': 1e-5}, serializer=None), ReturnList([1e20], serializer=None),
+                     OrderedDict(items=ReturnList([{'score': 2.5e-7}], serializer=None))):
+            with self.subTest(data=data):
+                self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        with self.assertRaises(ValueError):
+            FastJSONRenderer().render(OrderedDict(score=float('nan')))
 
+    def test_renderer_rejects_non_finite_floats(self):
+        for value in (float('nan'), float('inf'), [{'score': float('-inf')}]):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                FastJSONRenderer().render({'value': value})
 
-class TestDurationTimeHabitValidator(TestCase):
-    def test_negative_timedelta_value(self):
-        validator = DurationTimeHabitValidator('duration_time')
-        value = {'duration_time': -timedelta(seconds=10)}
-        with self.assertRaises(ValidationError) as cm:
-            validator(value)
-        self.assertEqual(str(cm.exception), "Время выполнения должно быть не больше 120 секунд")
+    def test_renderer_respects_indent(self):
+        rendered = FastJSONRenderer().render({'a': 1}, 'application/json; indent=2')
+        self.assertEqual(rendered, b'{\n  "a": 1\n}')
 
+    def test_parser_reports_invalid_json(self):
+        import io
+        from rest_framework.exceptions import ParseError
 
-def test_duration_time_habit_validator_non_timedelta():
-    # Arrange
-    validator = DurationTimeHabitValidator("duration")
-    value = {"duration": "120"}  # Non-timedelta value
+        self.assertEqual(FastJSONParser().parse(io.BytesIO('{"action": "Бег"}'.encode())), {'action': 'Бег'})
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"action": '))
 
-    # Act
-    with mock.patch("main.validators.dict") as mock_dict:
-        mock_dict.return_value = value
-        with self.assertRaises(ValidationError) as cm:
-            validator(value)
 
-    # Assert
-    self.assertEqual(
-        str(cm.exception), "['Время выполнения должно быть не больше 120 секунд']"
-    )
-
-
-class TestDurationTimeHabitValidator(TestCase):
+class HabitExportTestCase(APITestCase):
     def setUp(self):
-        self.validator = DurationTimeHabitValidator('duration')
-
-    def test_non_dict_input(self):
-        with self.assertRaises(ValidationError) as cm:
-            self.validator(123)
-        self.assertEqual(str(cm.exception), "Expected a dictionary, but got <class 'int'>.")
-
-    def test_duration_exceeds_limit(self):
-        with self.assertRaises(ValidationError) as cm:
-            self.validator({'duration': timedelta(seconds=121)})
-        self.assertEqual(str(cm.exception), "Время выполнения должно быть не больше 120 секунд")
+        self.user = get_user_model().objects.create(email='export@example.com')
+        self.client.force_authenticate(self.user)
+        for action in ('Зарядка', 'Чтение', 'Бег'):
+            create_habit(self.user, action=action)
+        create_habit(get_user_model().objects.create(email='other-export@example.com'))
 
-    def test_duration_within_limit(self):
-        self.validator({'duration': timedelta(seconds=119)})
+    def test_ndjson_export_streams_own_habits(self):
+        import json
 
+        response = self.client.get('/export/')
+        lines = b''.join(response.streaming_content).decode().splitlines()
 
-class TestDurationTimeHabitValidator(TestCase):
-    def test_empty_dictionary(self):
-        validator = DurationTimeHabitValidator('duration')
-        value = {}
-        validator(value)
-        # No exception raised, test passes
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['action'] for line in lines], ['Зарядка', 'Чтение', 'Бег'])
 
+    def test_csv_export_with_selected_fields(self):
+        response = self.client.get('/export/', {'export_format': 'csv', 'fields': 'action,time_doing'})
+        content = b''.join(response.streaming_content).decode()
 
-def test_duration_time_habit_validator_missing_field():
-    validator = DurationTimeHabitValidator("duration_time")
-    input_data = {"habit_name": "Test Habit"}
-    try:
-        validator(input_data)
-    except ValidationError as e:
-        assert str(e) == "Время выполнения должно быть не больше 120 секунд"
-    else:
-        assert False, "ValidationError was not raised"
+        self.assertEqual(content.splitlines(), ['action,time_doing', 'Зарядка,00:01:00', 'Чтение,00:01:00',
+                                                'Бег,00:01:00'])
 
 
-class PleasentHabitValidatorTestCase(TestCase):
+class HabitImportTestCase(APITestCase):
     def setUp(self):
-        self.validator = PleasentHabitValidator('is_pleasent')
+        self.user = get_user_model().objects.create(email='import@example.com')
+        self.client.force_authenticate(self.user)
+        self.pleasant = create_habit(self.user, is_pleasent=True, frequency_in_days=None)
+
+    def test_ndjson_import_reports_rejected_rows(self):
+        body = '\n'.join([
+            '{"place": "Дом", "time": "08:00", "action": "Зарядка", "time_doing": "60", "frequency_in_days": 1}',
+            '{"place": "Дом", "time": "09:00", "action": "Чтение", "time_doing": "00:05:00"}',
+            'not json',
+            f'{{"place": "Парк", "time": "07:00", "action": "Бег", "time_doing": "90", '
+            f'"associated_habit": {self.pleasant.pk}}}',
+        ])
+        response = self.client.post('/import/', body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3])
+        self.assertEqual(Habit.objects.get(action='Бег').associated_habit, self.pleasant)
+
+    def test_import_rejects_out_of_range_and_foreign_associated_habits(self):
+        stranger = get_user_model().objects.create(email='stranger-import@example.com')
+        private = create_habit(stranger, is_pleasent=True, frequency_in_days=None)
+        public = create_habit(stranger, is_pleasent=True, frequency_in_days=None, is_public=True)
+        row = '{{"place": "Дом", "time": "08:00", "action": "{action}", "time_doing": "60", {extra}}}'
+        body = '\n'.join([
+            row.format(action='Огромная', extra=f'"associated_habit": {10 ** 20}'),
+            row.format(action='Частая', extra='"frequency_in_days": 40000'),
+            row.format(action='Чужая', extra=f'"associated_habit": {private.pk}'),
+            row.format(action='Публичная', extra=f'"associated_habit": {public.pk}'),
+        ])
+        response = self.client.post('/import/', body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 1)
+        errors = {error['row']: error['errors'] for error in response.data['errors']}
+        self.assertEqual(sorted(errors), [1, 2, 3])
+        self.assertIn('associated_habit', errors[1])
+        self.assertIn('frequency_in_days', errors[2])
+        self.assertIn('associated_habit', errors[3])
+        self.assertEqual(Habit.objects.get(action='Публичная').associated_habit, public)
+
+    def test_csv_import(self):
+        body = 'place,time,action,time_doing,is_public\nДом,08:00,Зарядка,60,true\nДом,08:30,Душ,30,\n'
+        response = self.client.post('/import/', body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Habit.objects.filter(user=self.user, is_public=True).count(), 1)
+
+
+class HabitRuleEngineTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(email='rules@example.com')
+        self.client.force_authenticate(self.user)
+        self.pleasant = create_habit(self.user, is_pleasent=True, frequency_in_days=None)
+        self.useful = create_habit(self.user)
+
+    def test_validate_many_resolves_associated_habits_in_one_query(self):
+        from main.rules import habit_rules
+
+        rows = [
+            {'associated_habit': self.pleasant.pk, 'time_doing': timedelta(seconds=60)},
+            {'associated_habit': self.useful.pk, 'reward': 'Кофе'},
+            {'associated_habit': 0},
+            {'is_pleasent': True, 'reward': 'Кофе', 'frequency_in_days': 9},
+        ]
+        with self.assertNumQueries(1):
+            errors = habit_rules.validate_many(rows)
+
+        self.assertEqual(errors[0], {})
+        self.assertEqual(set(errors[1]), {'reward', 'associated_habit'})
+        self.assertEqual(set(errors[2]), {'associated_habit'})
+        self.assertEqual(set(errors[3]), {'is_pleasent', 'frequency_in_days'})
+
+    def test_partial_update_is_checked_against_stored_values(self):
+        habit = create_habit(self.user, associated_habit=self.pleasant)
+        response = self.client.patch(f'/update/{habit.pk}/', {'reward': 'Кофе'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('reward', response.data)
+
+    def test_bulk_create_query_count_does_not_depend_on_batch_size(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def post(count):
+            items = [{'place': 'Дом', 'time': '08:00', 'action': f'Привычка {i}', 'time_doing': '00:01:00',
+                      'associated_habit': self.pleasant.pk} for i in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/bulk/create/', items, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            return len(queries)
+
+        self.assertEqual(post(1), post(10))
+
+
+class HabitSearchTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(email='search@example.com')
+        self.client.force_authenticate(self.user)
+        other = get_user_model().objects.create(email='other-search@example.com')
+        create_habit(self.user, action='Пробежка', place='Парк у дома')
+        create_habit(self.user, action='Чтение книг', place='Дом')
+        create_habit(other, action='Чтение газеты', place='Кафе', is_public=True)
+        create_habit(other, action='Чтение писем', place='Офис')
 
-    def test_pleasent_habit_validator_raises_validation_error_with_reward_and_related_habit(self):
-        input_data = {
-            'is_pleasent': True,
-            'reward': 'some reward',
-            'related_habit': 'some related habit'
-        }
-        with self.assertRaises(ValidationError) as cm:
-            self.validator(input_data)
-        self.assertEqual(
-            str(cm.exception),
-            "У приятной привычки не может быть вознаграждения или связанной привычки."
-        )
+    def test_search_covers_own_and_public_habits(self):
+        response = self.client.get('/search/', {'q': 'чтение'})
 
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({item['action'] for item in response.data['results']}, {'Чтение книг', 'Чтение газеты'})
 
-class PleasentHabitValidatorTestCase(TestCase):
-    def test_pleasent_habit_validator_should_not_raise_error_when_reward_is_none_and_related_habit_is_present(self):
-        validator = PleasentHabitValidator('is_pleasent')
-        input_data = {
-            'is_pleasent': True,
-            'reward': None,
-            'related_habit': 'related_habit_id'
-        }
-        validator(input_data)
+    def test_action_match_ranks_above_place_match(self):
+        create_habit(self.user, action='Прогулка', place='Парк')
+        create_habit(self.user, action='Уборка в парке', place='Двор')
+        response = self.client.get('/search/', {'q': 'парк'})
 
+        self.assertEqual(response.data['results'][0]['action'], 'Уборка в парке')
+        self.assertNotIn('search_vector', response.data['results'][0])
 
-def test_pleasent_habit_validator_reward_present_related_habit_none():
-    validator = PleasentHabitValidator('is_pleasent')
-    input_data = {
-        'is_pleasent': True,
-        'reward': 'some reward',
-        'related_habit': None
-    }
-    try:
-        validator(input_data)
-    except ValidationError as e:
-        assert False, f'ValidationError was raised: {str(e)}'
-
+    def test_empty_query_returns_nothing(self):
+        response = self.client.get('/search/')
 
-def test_pleasent_habit_validator_no_reward_no_related_habit():
-    validator = PleasentHabitValidator("is_pleasent")
-    input_data = {"is_pleasent": True, "reward": None, "related_habit": None}
-    try:
-        validator(input_data)
-    except ValidationError as e:
-        assert False, f"ValidationError was raised: {str(e)}"
+        self.assertEqual(response.data['count'], 0)
 
 
-class PleasentHabitValidatorTestCase(TestCase):
+class HabitFilterTestCase(APITestCase):
     def setUp(self):
-        self.validator = PleasentHabitValidator('is_pleasent')
+        self.user = get_user_model().objects.create(email='filter@example.com')
+        self.client.force_authenticate(self.user)
+        create_habit(self.user, action='Зарядка', time='07:00')
+        create_habit(self.user, action='Прогулка', time='12:00', frequency='weekly', is_public=True)
+        create_habit(self.user, action='Чай', time='21:00', is_pleasent=True, is_public=True)
 
-    def test_raises_validation_error_when_reward_and_related_habit_are_present(self):
-        input_data = {
-            'is_pleasent': True,
-            'reward': 'some reward',
-            'related_habit': 'some related habit',
-        }
-        with self.assertRaises(ValidationError) as cm:
-            self.validator(input_data)
-        self.assertEqual(
-            str(cm.exception),
-            "У приятной привычки не может быть вознаграждения или связанной привычки."
-        )
+    def actions(self, url, params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        items = response.data['results'] if isinstance(response.data, dict) else response.data
+        return [item['action'] for item in items]
 
-    def test_does_not_raise_validation_error_when_reward_and_related_habit_are_not_present(self):
-        input_data = {
-            'is_pleasent': True,
-        }
-        self.validator(input_data)
+    def test_time_window(self):
+        self.assertEqual(self.actions('/list/', {'time_after': '06:30', 'time_before': '12:00'}),
+                         ['Зарядка', 'Прогулка'])
 
+    def test_frequency_and_flags(self):
+        self.assertEqual(self.actions('/list/', {'frequency': 'weekly'}), ['Прогулка'])
+        self.assertEqual(self.actions('/list/', {'is_pleasent': 'true'}), ['Чай'])
+        self.assertEqual(self.actions('/list_public/', {'time_after': '13:00'}), ['Чай'])
 
-class TestPleasentHabitValidator(TestCase):
-    def setUp(self):
-        self.validator = PleasentHabitValidator("is_pleasent")
-
-    def test_valid_combinations(self):
-        # Test valid combinations with additional fields
-        valid_data = {
-            "is_pleasent": True,
-            "reward": None,
-            "related_habit": None,
-            "extra_field": "some_value"
-        }
-        self.validator(valid_data)  # No ValidationError should be raised
+    def test_filter_changes_etag(self):
+        first = self.client.get('/list/', {'is_public': 'true'})
+        second = self.client.get('/list/', {'is_public': 'false'})
 
+        self.assertEqual(first.data['count'], 2)
+        self.assertEqual(second.data['count'], 1)
+        self.assertNotEqual(first['ETag'], second['ETag'])
 
-def test_pleasent_habit_validator_raises_error_with_reward_and_related_habit():
-    validator = PleasentHabitValidator('is_pleasent')
-    input_data = {
-        'is_pleasent': True,
-        'reward': 'Reward 1',
-        'related_habit': 'Related Habit 1',
-    }
-    with self.assertRaises(ValidationError) as cm:
-        validator(input_data)
-    self.assertEqual(
-        cm.exception.message,
-        "У приятной привычки не может быть вознаграждения или связанной привычки."
-    )
 
-
-def test_pleasent_habit_validator_with_reward_and_related_habit():
-    validator = PleasentHabitValidator('is_pleasent')
-    value = {
-        'is_pleasent': True,
-        'reward': 'some reward',
-        'related_habit': 'some related habit'
-    }
-    with self.assertRaises(ValidationError) as cm:
-        validator(value)
-    self.assertEqual(
-        cm.exception.message,
-        "У приятной привычки не может быть вознаграждения или связанной привычки."
-    )
-
-
-class PleasentHabitValidatorTestCase(TestCase):
+class AsyncHabitViewsTestCase(APITestCase):
     def setUp(self):
-        self.validator = PleasentHabitValidator('is_pleasent')
-
-    def test_pleasent_habit_with_reward_and_related_habit(self):
-        data = {
-            'is_pleasent': True,
-            'reward': 'some reward',
-            'related_habit': 'some related habit',
-        }
-        with self.assertRaises(ValidationError) as cm:
-            self.validator(data)
-        self.assertEqual(
-            cm.exception.detail,
-            "У приятной привычки не может быть вознаграждения или связанной привычки."
-        )
-
-
-class PleasentHabitValidatorTestCase(TestCase):
-    def test_pleasent_habit_validator_with_reward_and_related_habit(self):
-        validator = PleasentHabitValidator('is_pleasent')
-        data = {
-            'is_pleasent': True,
-            'reward': 'Some reward',
-            'related_habit': 'Some related habit'
+        self.user = get_user_model().objects.create(email='async@example.com')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.habit = create_habit(self.user, action='Зарядка', time='07:00', is_public=True)
+        create_habit(self.user, action='Прогулка', time='12:00', frequency='weekly')
+        create_habit(self.user, action='Чай', time='21:00', is_pleasent=True, is_public=True)
+
+    def test_list_matches_sync_view(self):
+        for params in ({}, {'frequency': 'weekly'}, {'fields': 'id,action', 'page': 2, 'page_size': 2}):
+            sync = self.client.get('/list/', params)
+            response = self.client.get('/async/list/', params)
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()['count'], sync.json()['count'])
+            self.assertEqual(response.json()['results'], sync.json()['results'])
+            self.assertEqual(response['ETag'], sync['ETag'])
+        self.assertTrue(response.json()['previous'].startswith('http://testserver/async/list/'))
+
+    def test_retrieve_and_not_modified(self):
+        response = self.client.get(f'/async/retrieve/{self.habit.pk}/', {'fields': 'action,time'})
+        self.assertEqual(response.json(), {'action': 'Зарядка', 'time': '07:00:00'})
+
+        cached = self.client.get(f'/async/retrieve/{self.habit.pk}/', {'fields': 'action,time'},
+                                 HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get('/async/retrieve/0/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_authentication_and_errors(self):
+        self.client.credentials()
+
+        self.assertEqual(self.client.get('/async/list/').status_code, status.HTTP_401_UNAUTHORIZED)
+        public = self.client.get('/async/list_public/')
+        self.assertEqual([item['action'] for item in public.json()], ['Зарядка', 'Чай'])
+        self.assertEqual(self.client.get('/async/list_public/', {'fields': 'secret'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_base_view_defaults(self):
+        class PleasantHabits(AsyncHabitView):
+            allow_anonymous = True
+
+            def get_queryset(self):
+                return Habit.objects.filter(is_pleasent=True)
+
+        response = async_to_sync(PleasantHabits.as_view())(RequestFactory().get('/', {'fields': 'action'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), [{'action': 'Чай'}])
+        self.assertNotIn('ETag', response)
+
+
+class HabitChainTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(email='chain@example.com')
+        self.client.force_authenticate(self.user)
+        # Цепочка first -> second -> third и ещё одна ссылка на third
+        self.third = create_habit(self.user, action='Третья')
+        self.second = create_habit(self.user, action='Вторая', associated_habit=self.third)
+        self.first = create_habit(self.user, action='Первая', associated_habit=self.second)
+        self.sibling = create_habit(self.user, action='Соседняя', associated_habit=self.third)
+
+    def test_chain_in_one_query(self):
+        with self.assertNumQueries(1):
+            habits = list(Habit.objects.chain(self.first.pk))
+
+        self.assertEqual([(habit.action, habit.depth) for habit in habits],
+                         [('Первая', 0), ('Вторая', 1), ('Третья', 2)])
+
+    def test_dependents_endpoint(self):
+        response = self.client.get(f'/dependents/{self.third.pk}/', {'fields': 'id,action'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(item['action'], item['depth']) for item in response.data],
+                         [('Третья', 0), ('Вторая', 1), ('Соседняя', 1), ('Первая', 2)])
+        self.assertEqual(set(response.data[0]), {'id', 'action', 'depth'})
+
+    def test_cycle_and_max_depth(self):
+        Habit.objects.filter(pk=self.third.pk).update(associated_habit=self.first)
+
+        response = self.client.get(f'/chain/{self.first.pk}/')
+        self.assertEqual([item['action'] for item in response.data], ['Первая', 'Вторая', 'Третья'])
+        response = self.client.get(f'/chain/{self.first.pk}/', {'max_depth': 1})
+        self.assertEqual(len(response.data), 2)
+        response = self.client.get(f'/chain/{self.first.pk}/', {'max_depth': 'deep'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_private_habits_of_others_are_not_traversed(self):
+        other = get_user_model().objects.create(email='other-chain@example.com')
+        private = create_habit(other, action='Чужая')
+        Habit.objects.filter(pk=self.third.pk).update(associated_habit=private)
+
+        response = self.client.get(f'/chain/{self.first.pk}/')
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(self.client.get(f'/chain/{private.pk}/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PublicListThrottleTestCase(APITestCase):
+    def setUp(self):
+        redis_patch = mock.patch('config.throttling.get_redis', return_value=fakeredis.FakeRedis())
+        rates_patch = mock.patch.object(SlidingWindowThrottle, 'THROTTLE_RATES', {'list_public': '2/min'})
+        down_patch = mock.patch.object(SlidingWindowThrottle, 'redis_down_until', 0)
+        for patcher in (redis_patch, rates_patch, down_patch):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_sliding_window_per_client(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/list_public/').status_code, status.HTTP_200_OK)
+
+        response = self.client.get('/list_public/')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 60)
+        self.assertEqual(self.client.get('/list_public/', REMOTE_ADDR='10.1.1.1').status_code, status.HTTP_200_OK)
+
+    def test_async_view_shares_the_limit(self):
+        self.client.get('/list_public/')
+        self.client.get('/async/list_public/')
+
+        response = self.client.get('/async/list_public/')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+    def test_fails_open_when_redis_is_down(self):
+        server = fakeredis.FakeServer()
+        server.connected = False
+
+        with mock.patch('config.throttling.get_redis', return_value=fakeredis.FakeRedis(server=server)), \
+                self.assertLogs('config.throttling', 'WARNING') as logs:
+            for _ in range(3):
+                self.assertEqual(self.client.get('/list_public/').status_code, status.HTTP_200_OK)
+        # После первой ошибки Redis не опрашивается до истечения паузы
+        self.assertEqual(len(logs.output), 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_a', 'replica_b'], REPLICA_MAX_LAG_SECONDS=10)
+class ReplicaRoutingTestCase(APITestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        lag_patch = mock.patch('config.db_router.replica_lag', side_effect=lambda alias: self.lags[alias])
+        lag_patch.start()
+        self.addCleanup(lag_patch.stop)
+        self.lags = {'replica_a': 0.5, 'replica_b': 0.5}
+
+    def route(self, request):
+        middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse(self.router.db_for_read(Habit)))
+        return middleware(request).content.decode()
+
+    def test_reads_go_to_replicas_only_inside_replica_reads(self):
+        self.assertIsNone(self.router.db_for_read(Habit))
+        with replica_reads():
+            self.assertIn(self.router.db_for_read(Habit), {'replica_a', 'replica_b'})
+
+            self.lags['replica_a'] = 60
+            self.assertEqual(self.router.db_for_read(Habit), 'replica_b')
+            self.lags['replica_b'] = None
+            self.assertEqual(self.router.db_for_read(Habit), 'default')
+
+    def test_write_switches_request_to_primary(self):
+        with replica_reads() as state:
+            self.assertEqual(self.router.db_for_write(Habit), 'default')
+            self.assertTrue(state.wrote)
+            self.assertIsNone(self.router.db_for_read(Habit))
+
+    def test_sticky_primary_after_write(self):
+        factory = RequestFactory()
+        token = {'HTTP_AUTHORIZATION': 'Bearer writer'}
+
+        self.assertIn(self.route(factory.get('/list/', **token)), {'replica_a', 'replica_b'})
+        self.assertEqual(self.route(factory.post('/create/', **token)), 'None')
+        self.assertEqual(self.route(factory.get('/list/', **token)), 'None')
+        self.assertIn(self.route(factory.get('/list/', HTTP_AUTHORIZATION='Bearer reader')), {'replica_a', 'replica_b'})
+
+        cache.delete(sticky_key(factory.get('/list/', **token)))
+        self.assertIn(self.route(factory.get('/list/', **token)), {'replica_a', 'replica_b'})
+
+    def test_anonymous_clients_are_not_sticky(self):
+        factory = RequestFactory()
+
+        # Все клиенты за прокси приходят с одного адреса: запись одного не переводит остальных на мастер
+        self.route(factory.post('/users/', REMOTE_ADDR='10.0.0.1'))
+        self.assertIsNone(sticky_key(factory.get('/list_public/', REMOTE_ADDR='10.0.0.1')))
+        self.assertIn(self.route(factory.get('/list_public/', REMOTE_ADDR='10.0.0.1')), {'replica_a', 'replica_b'})
+
+    def test_unavailable_cache_reads_from_primary(self):
+        token = {'HTTP_AUTHORIZATION': 'Bearer writer'}
+        broken = mock.Mock(**{f'{name}.side_effect': RedisConnectionError('down') for name in ('get', 'set')})
+
+        with mock.patch('config.db_router.cache', broken), self.assertLogs('config.db_router', 'WARNING'):
+            self.assertEqual(self.route(RequestFactory().get('/list/', **token)), 'None')
+            self.assertEqual(self.route(RequestFactory().post('/create/', **token)), 'None')
+
+
+class ReplicaLagTestCase(APITestCase):
+    def test_primary_reports_no_lag(self):
+        self.assertEqual(replica_lag('default'), 0)
+
+
+class DatabaseConnectionMetricsTestCase(APITestCase):
+    def test_connection_open_and_close_are_counted(self):
+        opened = DB_CONNECTIONS_OPENED.labels('default')._value.get()
+        open_now = DB_CONNECTIONS_OPEN.labels('default')._value.get()
+
+        connection = connections.create_connection('default')
+        connection.ensure_connection()
+        self.assertEqual(DB_CONNECTIONS_OPENED.labels('default')._value.get(), opened + 1)
+        self.assertEqual(DB_CONNECTIONS_OPEN.labels('default')._value.get(), open_now + 1)
+
+        connection.close()
+        connection.close()
+        self.assertEqual(DB_CONNECTIONS_OPEN.labels('default')._value.get(), open_now)
+
+    def test_metrics_endpoint_requires_token(self):
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'db_connections_opened_total', response.content)
+
+    def test_metrics_endpoint_is_closed_without_token(self):
+        with override_settings(METRICS_TOKEN=None, DEBUG=False):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_404_NOT_FOUND)
+        with override_settings(METRICS_TOKEN=None, DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_200_OK)
+
+
+class HabitDatasetGeneratorTestCase(APITestCase):
+    def generate(self, prefix):
+        generator = HabitDatasetGenerator(5, 20, seed=3, email_prefix=prefix, batch_size=40)
+        self.assertEqual(generator.run(), 100)
+        return Habit.objects.filter(user__email__startswith=prefix).order_by('id')
+
+    def test_same_seed_gives_same_rows(self):
+        fields = ('place', 'time', 'action', 'is_pleasent', 'frequency', 'reward', 'time_doing', 'is_public')
+        first, second = self.generate('gen-a-'), self.generate('gen-b-')
+
+        self.assertEqual(list(first.values_list(*fields)), list(second.values_list(*fields)))
+        self.assertEqual(get_user_model().objects.filter(email__startswith='gen-a-').count(), 5)
+        self.assertTrue(get_user_model().objects.get(email='gen-a-0@example.com').check_password('loadtest'))
+
+    def test_rows_pass_habit_rules(self):
+        habits = list(self.generate('gen-rules-').select_related('associated_habit'))
+
+        self.assertFalse(any(habit_rules.validate_many([rule_fields_of(habit) for habit in habits])))
+        linked = [habit for habit in habits if habit.associated_habit]
+        self.assertTrue(linked)
+        self.assertTrue(all(habit.associated_habit.user_id == habit.user_id for habit in linked))
+
+    def test_clear_removes_generated_data(self):
+        habits = self.generate('gen-clear-')
+        record_completions(habits[0], [timezone.now()])
+        stranger = get_user_model().objects.create(email='stranger-clear@example.com')
+        UserHabitStats.objects.create(user=stranger, refreshed_at=timezone.now())
+        pleasent = habits.filter(is_pleasent=True).first()
+        dependent = create_habit(stranger, associated_habit=pleasent)
+
+        self.assertEqual(HabitDatasetGenerator(5, 20, email_prefix='gen-clear-').clear(), 100)
+        self.assertFalse(get_user_model().objects.filter(email__startswith='gen-clear-').exists())
+        self.assertFalse(Habit.objects.filter(pk=dependent.pk).exists())
+        self.assertFalse(HabitDailyRollup.objects.exists())
+        stats = UserHabitStats.objects.get(user=stranger)
+        self.assertGreater(stats.changes, stats.refreshed_changes)
+        # Внешние ключи в PostgreSQL отложенные: проверяются сейчас, а не при фиксации
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class ProfilingMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(email='profile@example.com')
+        self.habit = create_habit(self.user)
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_sampled_request_gets_server_timing(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1):
+            response = self.client.get('/list/')
+
+        timing = response.headers['Server-Timing']
+        for metric in ('sql;dur=', 'serializer;dur=', 'auth;dur=', 'app;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+        self.assertRegex(timing, r'desc="[1-9]\d* queries"')
+
+    def test_unsampled_request_has_no_server_timing(self):
+        with override_settings(PROFILING_SAMPLE_RATE=0):
+            response = self.client.get('/list/')
+        self.assertNotIn('Server-Timing', response.headers)
+
+        with override_settings(PROFILING_SAMPLE_RATE=0, PROFILING_TOKEN='debug'):
+            response = self.client.get('/list/', HTTP_X_PROFILE='debug')
+        self.assertIn('Server-Timing', response.headers)
+
+    def test_slow_request_is_logged_with_top_queries(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_SLOW_REQUEST_MS=0), \
+                self.assertLogs('config.profiling', 'WARNING') as logs:
+            self.client.get(f'/retrieve/{self.habit.pk}/')
+
+        self.assertIn(f'GET /retrieve/{self.habit.pk}/ -> 200', logs.output[0])
+        self.assertIn('main_habit', logs.output[0])
+
+
+class CeleryTaskMetricsTestCase(APITestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, {'task': tg_notification.name, **labels}) or 0
+
+    def test_task_run_is_recorded(self):
+        runs = self.sample('celery_task_runtime_seconds_count')
+        successes = self.sample('celery_tasks_total', state='success')
+
+        tg_notification.apply()
+
+        self.assertEqual(self.sample('celery_task_runtime_seconds_count'), runs + 1)
+        self.assertEqual(self.sample('celery_tasks_total', state='success'), successes + 1)
+
+    def test_summary_from_worker_samples(self):
+        task = (('task', 'main.tasks.tg_notification'),)
+        samples = {
+            ('celery_tasks_total', task + (('state', 'success'),)): 8,
+            ('celery_tasks_total', task + (('state', 'failure'),)): 2,
+            **{('celery_task_runtime_seconds_bucket', (('le', le),) + task): count
+               for le, count in (('0.1', 4), ('1.0', 10), ('+Inf', 10))},
         }
-        with self.assertRaises(ValidationError) as cm:
-            validator(data)
-        self.assertEqual(
-            cm.exception.detail,
-            ["У приятной привычки не может быть вознаграждения или связанной привычки."]
-        )
-
 
-class RegularityHabitValidatorTestCase(TestCase):
-    def test_should_raise_validation_error_when_frequency_in_days_is_less_than_1(self):
-        validator = RegularityHabitValidator('frequency_in_days')
-        value = {'frequency_in_days': 0}
+        row, = summarize(samples)
+        self.assertEqual((row['success'], row['failure'], row['retry']), (8, 2, 0))
+        self.assertAlmostEqual(row['runtime_p50'], 0.25)
+        self.assertIsNone(row['queue_p50'])
+        self.assertIsNone(histogram_quantile([], 0.5))
 
-        with self.assertRaises(ValidationError) as cm:
-            validator(value)
 
-        self.assertEqual(str(cm.exception), "Нельзя выполнять привычку реже, чем 1 раз в 7 дней.")
-
-
-class RegularityHabitValidatorTestCase(TestCase):
+class HabitCompletionTestCase(APITestCase):
     def setUp(self):
-        self.validator = RegularityHabitValidator('frequency_in_days')
-
-
-def test_regularity_habit_validator_frequency_1():
-    validator = RegularityHabitValidator('frequency_in_days')
-    value = {'frequency_in_days': 1}
-    try:
-        validator(value)
-    except ValidationError as e:
-        assert str(e) == "Нельзя выполнять привычку реже, чем 1 раз в 7 дней."
-    else:
-        assert True
-
-
-class TestRegularityHabitValidator(TestCase):
-    def test_should_not_raise_validation_error_when_frequency_in_days_is_exactly_7(self):
-        validator = RegularityHabitValidator('frequency_in_days')
-        value = {'frequency_in_days': 7}
-        validator(value)
-
-
-def test_regularity_habit_validator_case_insensitive_field_names():
-    validator = RegularityHabitValidator("frequency_in_days")
-    data = {"FREQUENCY_IN_DAYS": 3}
-    validator(data)
-    data = {"frequency_in_days": 0}
-    with pytest.raises(ValidationError) as e:
-        validator(data)
-    assert str(e.value) == "Нельзя выполнять привычку реже, чем 1 раз в 7 дней."
-    data = {"frequency_in_days": 8}
-    with pytest.raises(ValidationError) as e:
-        validator(data)
-    assert str(e.value) == "Нельзя выполнять привычку реже, чем 1 раз в 7 дней."
+        self.user = get_user_model().objects.create(email='checkin@example.com')
+        self.habit = create_habit(self.user)
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        # Понедельник, 08:00 UTC
+        self.monday = timezone.datetime(2024, 3, 4, 8, tzinfo=timezone.utc)
+
+    def day(self, offset, hours=0):
+        return self.monday + timedelta(days=offset, hours=hours)
+
+    def test_checkin_updates_rollups_and_progress(self):
+        response = self.client.post(f'/checkin/{self.habit.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['streak'], 1)
+        self.assertEqual(response.json()['total_completions'], 1)
+
+        response = self.client.post(f'/checkin/{self.habit.pk}/')
+        self.assertEqual(response.json()['streak'], 1)
+        self.assertEqual(response.json()['total_completions'], 2)
+        self.assertEqual(self.habit.completions.count(), 2)
+        rollup = HabitDailyRollup.objects.get(habit=self.habit)
+        self.assertEqual(rollup.completions, 2)
+        self.assertEqual(HabitWeeklyRollup.objects.get(habit=self.habit).days, 1)
+
+    def test_checkin_rejects_foreign_habit_and_stale_time(self):
+        other = create_habit(get_user_model().objects.create(email='other-checkin@example.com'), is_public=True)
+        self.assertEqual(self.client.post(f'/checkin/{other.pk}/').status_code, status.HTTP_404_NOT_FOUND)
+
+        for done_at in (timezone.now() + timedelta(hours=1), timezone.now() - timedelta(days=30)):
+            response = self.client.post(f'/checkin/{self.habit.pk}/', {'done_at': done_at.isoformat()})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_streak_grows_on_consecutive_days_and_resets_after_gap(self):
+        for offset in range(3):
+            progress = record_completions(self.habit, [self.day(offset)])
+        self.assertEqual(progress.streak(today=self.day(2).date()), 3)
+        # Вчерашняя серия ещё жива, позавчерашняя — нет
+        self.assertEqual(progress.streak(today=self.day(3).date()), 3)
+        self.assertEqual(progress.streak(today=self.day(4).date()), 0)
+
+        progress = record_completions(self.habit, [self.day(5)])
+        self.assertEqual(progress.streak(today=self.day(5).date()), 1)
+        self.assertEqual(progress.longest_streak, 3)
+        self.assertEqual(progress.completion_rate(today=self.day(5).date()), 4 / 6)
+        self.assertEqual(progress.last_done_at, self.day(5))
+
+    def test_backfill_rebuilds_streak(self):
+        record_completions(self.habit, [self.day(0), self.day(2)])
+        progress = record_completions(self.habit, [self.day(1, hours=3)])
+
+        self.assertEqual(progress.current_streak, 3)
+        self.assertEqual(progress.longest_streak, 3)
+        self.assertEqual(progress.last_done_at, self.day(2))
+        self.assertEqual(HabitWeeklyRollup.objects.get(habit=self.habit).days, 3)
+
+    def test_weekly_habit_counts_weeks(self):
+        self.habit.frequency = 'weekly'
+        for offset in (0, 3, 8, 21):
+            progress = record_completions(self.habit, [self.day(offset)])
+
+        self.assertEqual(progress.period_unit, 'week')
+        self.assertEqual(progress.longest_streak, 2)
+        self.assertEqual(progress.streak(today=self.day(22).date()), 1)
+        self.assertEqual(progress.periods_done, 3)
+        self.assertEqual(list(HabitWeeklyRollup.objects.filter(habit=self.habit).values_list('days', flat=True)
+                              .order_by('week')), [2, 1, 1])
+
+    def test_progress_is_read_without_scanning_log(self):
+        record_completions(self.habit, [timezone.now() - timedelta(days=offset) for offset in range(20)])
+
+        # Пользователь из кэша аутентификации, привычка, итоги, недельные сводки
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/progress/{self.habit.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['streak'], 20)
+        self.assertEqual(response.json()['completion_rate'], 1.0)
+        self.assertEqual(len(response.json()['recent_weeks']), 4)
+
+
+@override_settings(CHECKIN_WRITE_BEHIND=True)
+class CheckinStreamTestCase(APITestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch('main.checkin_stream.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create(email='stream@example.com')
+        self.habit = create_habit(self.user)
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.consumer = CheckinStreamConsumer('test', block_ms=None, claim_idle_ms=0)
+        self.consumer.ensure_group()
+
+    def test_checkin_is_queued_and_flushed_in_batch(self):
+        for _ in range(3):
+            response = self.client.post(f'/checkin/{self.habit.pk}/')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        other = create_habit(self.user)
+        self.client.post(f'/checkin/{other.pk}/')
+        self.assertFalse(self.habit.completions.exists())
+
+        self.assertEqual(self.consumer.run_once(), 4)
+        self.assertEqual(self.habit.completions.count(), 3)
+        self.assertEqual(self.habit.progress.total_completions, 3)
+        self.assertEqual(other.progress.total_completions, 1)
+        # Подтверждённые сообщения удаляются из потока
+        self.assertEqual(self.redis.xlen('checkins'), 0)
+        self.assertEqual(self.consumer.run_once(), 0)
+
+    def test_redelivery_is_not_counted_twice(self):
+        self.client.post(f'/checkin/{self.habit.pk}/', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.client.post(f'/checkin/{self.habit.pk}/', HTTP_IDEMPOTENCY_KEY='retry-1')
+        messages = self.consumer.read()
+        self.consumer.flush(messages)
+        self.consumer.flush(messages)
+
+        self.assertEqual(self.habit.completions.count(), 1)
+        self.habit.progress.refresh_from_db()
+        self.assertEqual(self.habit.progress.total_completions, 1)
+
+    def test_failed_batch_is_claimed_again(self):
+        self.client.post(f'/checkin/{self.habit.pk}/')
+        with mock.patch('main.checkin_stream.record_batch', side_effect=DatabaseError('down')):
+            with self.assertRaises(DatabaseError):
+                self.consumer.run_once()
+        self.assertEqual(self.redis.xlen('checkins'), 1)
+
+        self.assertEqual(CheckinStreamConsumer('other', block_ms=None, claim_idle_ms=0).run_once(), 1)
+        self.assertEqual(self.habit.completions.count(), 1)
+
+    def test_deleted_habit_and_broken_message_are_dropped(self):
+        self.redis.xadd('checkins', {'habit': 'x'})
+        self.client.post(f'/checkin/{self.habit.pk}/')
+        self.habit.delete()
+
+        with self.assertLogs('main.checkin_stream', 'ERROR'):
+            self.assertEqual(self.consumer.run_once(), 1)
+        self.assertEqual(self.redis.xlen('checkins'), 0)
+
+    def test_falls_back_to_direct_write_when_redis_is_down(self):
+        server = fakeredis.FakeServer()
+        server.connected = False
+        with mock.patch('main.checkin_stream.get_redis', return_value=fakeredis.FakeRedis(server=server)), \
+                self.assertLogs('main.views', 'WARNING'):
+            response = self.client.post(f'/checkin/{self.habit.pk}/')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['total_completions'], 1)
+
+    @override_settings(CHECKIN_WRITE_BEHIND=False)
+    def test_direct_checkin_respects_idempotency_key(self):
+        for _ in range(2):
+            response = self.client.post(f'/checkin/{self.habit.pk}/', HTTP_IDEMPOTENCY_KEY='tap-1')
+        self.assertEqual(response.json()['total_completions'], 1)
+        response = self.client.post(f'/checkin/{self.habit.pk}/', HTTP_IDEMPOTENCY_KEY='x' * 65)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class UserHabitStatsTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(email='stats@example.com')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_stats_are_computed_on_first_request(self):
+        daily = create_habit(self.user)
+        create_habit(self.user, frequency='weekly')
+        now = timezone.now().replace(hour=7)
+        record_completions(daily, [now - timedelta(days=1), now - timedelta(days=3)])
+
+        response = self.client.get('/stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['habits'], {'total': 2, 'daily': 1, 'weekly': 1, 'monthly': 0})
+        self.assertEqual(data['completions'], 2)
+        self.assertEqual(data['best_hour'], 7)
+        # Два дня с выполнением из четырёх, считая сегодняшний
+        self.assertEqual(data['completion_rate'], 0.5)
+
+    def test_writes_mark_stats_stale_until_refresh(self):
+        habit = create_habit(self.user)
+        refresh_habit_stats()
+        stats = UserHabitStats.objects.get(user=self.user)
+        self.assertEqual(stats.changes, stats.refreshed_changes)
+
+        self.client.patch('/bulk/update/', [{'id': habit.pk, 'frequency': 'monthly'}], format='json')
+        record_completions(habit, [timezone.now()])
+        # Ответ — из сохранённой статистики, пока её не пересчитала задача
+        self.assertEqual(self.client.get('/stats/').json()['habits']['daily'], 1)
+
+        self.assertEqual(refresh_habit_stats(), 1)
+        data = self.client.get('/stats/').json()
+        self.assertEqual(data['habits']['monthly'], 1)
+        self.assertEqual(data['completions'], 1)
+        self.assertEqual(refresh_habit_stats(), 0)
+
+    def test_stats_read_does_not_depend_on_habit_count(self):
+        for _ in range(20):
+            create_habit(self.user)
+        refresh_habit_stats()
+
+        # Пользователь из кэша аутентификации и строка статистики
+        with self.assertNumQueries(1):
+            response = self.client.get('/stats/')
+        self.assertEqual(response.json()['habits']['total'], 20)
+
+    def test_expired_stats_are_refreshed(self):
+        create_habit(self.user)
+        refresh_habit_stats()
+        UserHabitStats.objects.filter(user=self.user).update(
+            refreshed_at=timezone.now() - timedelta(seconds=settings.STATS_MAX_AGE + 1))
+
+        self.assertEqual(refresh_habit_stats(), 1)
+
+
+class HabitTrendingTestCase(APITestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch('main.trending.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create(email='trending@example.com')
+        self.popular = create_habit(self.user, is_public=True, action='Бег')
+        self.quiet = create_habit(self.user, is_public=True, action='Чтение')
+        self.private = create_habit(self.user)
+
+    def check_in(self, habit, times=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_completions(habit, [timezone.now() - timedelta(minutes=minute) for minute in range(times)])
+
+    def test_public_habits_ranked_by_completions(self):
+        self.check_in(self.popular, 3)
+        self.check_in(self.quiet)
+        self.check_in(self.private, 5)
+
+        response = self.client.get('/trending/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.json()], [self.popular.pk, self.quiet.pk])
+        self.assertAlmostEqual(response.json()[0]['score'], 3, places=2)
+
+        response = self.client.get('/trending/', {'limit': 1, 'fields': 'action'})
+        self.assertEqual(response.json(), [{'id': self.popular.pk, 'action': 'Бег', 'score': mock.ANY}])
+
+    def test_older_completions_weigh_less(self):
+        self.check_in(self.popular, 2)
+        # Сдвиг epoch на период полураспада — как будто следующая отметка сделана на сутки позже
+        self.redis.decrby('trending:completions:epoch', settings.TRENDING_HALF_LIFE)
+        self.check_in(self.quiet, 1)
+
+        # Две отметки суток назад весят как одна сейчас
+        scores = {item['id']: item['score'] for item in self.client.get('/trending/').json()}
+        self.assertAlmostEqual(scores[self.popular.pk], 1, places=2)
+        self.assertAlmostEqual(scores[self.quiet.pk], 1, places=2)
+
+    def test_compaction_rebases_scores_and_drops_hidden_habits(self):
+        self.check_in(self.popular, 4)
+        self.check_in(self.quiet)
+        self.redis.decrby('trending:completions:epoch', settings.TRENDING_HALF_LIFE)
+        Habit.objects.filter(pk=self.quiet.pk).update(is_public=False)
+
+        with override_settings(TRENDING_MAX_SIZE=10):
+            self.assertEqual(compact_trending()['completions'], 1)
+        # Очки пересчитаны к новому epoch: затухшее значение не изменилось
+        self.assertAlmostEqual(self.redis.zscore('trending:completions', self.popular.pk), 2, places=2)
+
+        with override_settings(TRENDING_MIN_SCORE=3):
+            self.assertEqual(compact_trending()['completions'], 0)
+
+    def test_adoption_by_other_users(self):
+        other = get_user_model().objects.create(email='adopter@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            create_habit(other, associated_habit=self.quiet)
+            create_habit(self.user, associated_habit=self.popular)
+
+        response = self.client.get('/trending/', {'by': 'adoption'})
+        self.assertEqual([item['id'] for item in response.json()], [self.quiet.pk])
+        self.assertEqual(self.client.get('/trending/', {'by': 'unknown'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unavailable_when_redis_is_down(self):
+        server = fakeredis.FakeServer()
+        server.connected = False
+        with mock.patch('main.trending.get_redis', return_value=fakeredis.FakeRedis(server=server)), \
+                self.assertLogs('main', 'WARNING'):
+            self.check_in(self.popular)
+            response = self.client.get('/trending/')
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(self.popular.completions.count(), 1)
+
+
+class HabitOccurrencesTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(email='calendar@example.com')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def expand_naive(self, rows, start, days):
+        """ Эталон: перебор дней периода по каждой привычке """
+        result = []
+        for habit_id, _, _, frequency, every, anchor, minute in rows:
+            step = interval_days(frequency, every)
+            for offset in range(days):
+                day = start + timedelta(days=offset)
+                if day < anchor:
+                    continue
+                if step is None:
+                    last_day = ((day.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)).day
+                    due = day.day == min(anchor.day, last_day)
+                else:
+                    due = (day - anchor).days % step == 0
+                if due:
+                    result.append((offset * 24 * 60 + minute, habit_id))
+        return sorted(result)
+
+    def test_vectorized_expansion_matches_naive(self):
+        start = timezone.datetime(2024, 1, 15).date()
+        rows = []
+        for habit_id in range(1, 301):
+            frequency = ('daily', 'weekly', 'monthly')[habit_id % 3]
+            anchor = start + timedelta(days=habit_id % 97 - 60)
+            rows.append((habit_id, 'Зарядка', 'Дом', frequency, habit_id % 8 or None, anchor, habit_id * 7 % 1440))
+
+        occurrences = expand_occurrences(rows, start, 60)
+        expected = self.expand_naive(rows, start, 60)
+        self.assertEqual(list(zip(occurrences.minutes.tolist(), (rows[i][0] for i in occurrences.habit_index))),
+                         expected)
+        self.assertEqual(len(expand_occurrences([], start, 30)), 0)
+
+    def test_monthly_habit_falls_on_last_day_of_short_month(self):
+        anchor = timezone.datetime(2024, 1, 31).date()
+        occurrences = expand_occurrences([(1, 'Отчёт', 'Офис', 'monthly', None, anchor, 9 * 60)], anchor, 60)
+
+        self.assertEqual([item['at'].date().isoformat() for item in occurrences[:]], ['2024-01-31', '2024-02-29'])
+        self.assertEqual(occurrences[-1]['at'].hour, 9)
+
+    def test_calendar_is_paginated_by_time(self):
+        create_habit(self.user, time='07:30', action='Бег')
+        create_habit(self.user, time='21:00', frequency='weekly', action='Уборка')
+        create_habit(get_user_model().objects.create(email='stranger@example.com'))
+
+        response = self.client.get('/calendar/', {'days': 14, 'page_size': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        # 14 ежедневных и 2 еженедельных вхождения
+        self.assertEqual(data['count'], 16)
+        self.assertEqual([item['action'] for item in data['results']], ['Бег', 'Уборка', 'Бег'])
+        self.assertTrue(data['results'][0]['at'].endswith('T07:30:00Z'))
+        self.assertIsNotNone(data['next'])
+
+        self.assertEqual(self.client.get('/calendar/', {'days': 1000}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/calendar/', {'start': 'завтра'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_editing_habit_keeps_schedule(self):
+        start = timezone.localdate()
+        habit = create_habit(self.user, frequency='weekly')
+        Habit.objects.filter(pk=habit.pk).update(created_at=timezone.now() - timedelta(days=3))
+        habit.refresh_from_db()
+        habit.action = 'Уборка'
+        habit.save()
+
+        response = self.client.get('/calendar/', {'start': start.isoformat(), 'days': 14})
+        self.assertEqual([item['at'][:10] for item in response.json()['results']],
+                         [(start + timedelta(days=4)).isoformat(), (start + timedelta(days=11)).isoformat()])
+
+
+class CalendarFeedTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create(email='feed@example.com')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def feed_url(self):
+        url = self.client.get('/calendar/feed/').json()['url']
+        return url[len('http://testserver'):]
+
+    def test_feed_contains_recurrence_rules(self):
+        create_habit(self.user, action='Бег, утром', frequency_in_days=2)
+        create_habit(self.user, frequency='weekly', time='21:15')
+        monthly = create_habit(self.user, frequency='monthly', reward='Кофе')
+        Habit.objects.filter(pk=monthly.pk).update(created_at=timezone.datetime(2024, 1, 30, tzinfo=timezone.utc))
+        create_habit(get_user_model().objects.create(email='other@example.com'), action='Чужая')
+
+        url = self.feed_url()
+        self.client.credentials()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = response.content.decode()
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 3)
+        self.assertIn('SUMMARY:Бег\\, утром\r\n', body)
+        self.assertIn('RRULE:FREQ=DAILY;INTERVAL=2\r\n', body)
+        self.assertIn('RRULE:FREQ=WEEKLY\r\n', body)
+        self.assertIn('DTSTART:20240130T080000Z\r\nRRULE:FREQ=MONTHLY;BYMONTHDAY=28,29,30;BYSETPOS=-1\r\n', body)
+        self.assertIn('DURATION:PT60S\r\n', body)
+        self.assertNotIn('Чужая', body)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+
+        self.assertEqual(self.client.get('/calendar/feed/unknown.ics').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_feed_is_cached_until_habits_change(self):
+        habit = create_habit(self.user, action='Зарядка')
+        url = self.feed_url()
+        self.client.credentials()
+        first = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            habit.action = 'Растяжка'
+            habit.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertIn('SUMMARY:Растяжка', changed.content.decode())
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+            self.client.post('/bulk/create/', [{'place': 'Парк', 'time': '18:00', 'action': 'Прогулка',
+                                                'frequency_in_days': 1, 'time_doing': '00:01:00'}], format='json')
+        self.assertIn('SUMMARY:Прогулка', self.client.get(url).content.decode())
+
+    def test_rotated_link_revokes_old_one(self):
+        old_url = self.feed_url()
+        self.assertEqual(self.client.get(old_url).status_code, status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/calendar/feed/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(self.feed_url(), old_url)
+        self.assertEqual(self.client.get(old_url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(self.feed_url()).status_code, status.HTTP_200_OK)
+
+    def test_feed_is_served_while_redis_is_down(self):
+        habit = create_habit(self.user, action='Зарядка')
+        url = self.feed_url()
+        self.client.credentials()
+        broken = mock.Mock(**{f'{name}.side_effect': RedisConnectionError('down')
+                              for name in ('get', 'add', 'set', 'set_many', 'delete')})
+
+        with mock.patch('main.ics.cache', broken), self.assertLogs('main.ics', 'WARNING'):
+            with self.captureOnCommitCallbacks(execute=True):
+                habit.action = 'Растяжка'
+                habit.save()
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('SUMMARY:Растяжка', response.content.decode())
@@ -0,0 +1,117 @@
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from redis import RedisError
+from redis.commands.core import Script
+
+from config.redis_client import get_redis
+from main.models import Habit
+
+logger = logging.getLogger(__name__)
+
+# Рейтинги публичных привычек: по отметкам о выполнении и по привязкам чужих привычек (associated_habit)
+BOARDS = ("completions", "adoption")
+
+# Затухание без перезаписи всего множества: событие в момент t весит 2^((t - epoch) / half_life), поэтому старые
+# очки относительно новых убывают вдвое за каждый half_life, а порядок в sorted set совпадает с порядком по
+# затухшим очкам. Один ZINCRBY на привычку — O(log N). epoch хранится рядом и сдвигается при сжатии.
+# KEYS: множество, epoch; ARGV: half_life в секундах, затем пары привычка, вес.
+BUMP_LUA = """
+local now = tonumber(redis.call('TIME')[1])
+local epoch = tonumber(redis.call('GET', KEYS[2]))
+if not epoch then
+    epoch = now
+    redis.call('SET', KEYS[2], epoch)
+end
+local factor = 2 ^ ((now - epoch) / tonumber(ARGV[1]))
+for i = 2, #ARGV, 2 do
+    redis.call('ZINCRBY', KEYS[1], tonumber(ARGV[i + 1]) * factor, ARGV[i])
+end
+"""
+
+# Сжатие: очки пересчитываются к новому epoch = сейчас (иначе множитель растёт без предела), затем удаляются
+# затухшие ниже min_score и всё, что ниже max_size лучших. Атомарно, O(N) по размеру множества.
+# KEYS: множество, epoch; ARGV: half_life, min_score, max_size.
+COMPACT_LUA = """
+local now = tonumber(redis.call('TIME')[1])
+local epoch = tonumber(redis.call('GET', KEYS[2]))
+if epoch then
+    local factor = 2 ^ (-(now - epoch) / tonumber(ARGV[1]))
+    local items = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+    for i = 1, #items, 2 do
+        redis.call('ZADD', KEYS[1], tonumber(items[i + 1]) * factor, items[i])
+    end
+end
+redis.call('SET', KEYS[2], now)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[2])
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(tonumber(ARGV[3]) + 1))
+return redis.call('ZCARD', KEYS[1])
+"""
+
+# Скрипты без привязки к клиенту: SHA считается один раз, клиент передаётся при вызове
+BUMP_SCRIPT = Script(None, BUMP_LUA.encode())
+COMPACT_SCRIPT = Script(None, COMPACT_LUA.encode())
+
+
+def board_keys(board):
+    return [f"trending:{board}", f"trending:{board}:epoch"]
+
+
+def bump(board, weights):
+    """ Добавляет очки привычкам ({habit_id: вес}); рейтинг не обязателен, поэтому ошибки Redis только в журнал """
+    args = [settings.TRENDING_HALF_LIFE]
+    for habit_id, weight in weights.items():
+        args += [habit_id, weight]
+    if len(args) == 1:
+        return
+    try:
+        BUMP_SCRIPT(keys=board_keys(board), args=args, client=get_redis())
+    except RedisError as exc:
+        logger.warning("Redis недоступен, рейтинг %s не обновлён: %s", board, exc)
+
+
+def bump_on_commit(board, weights):
+    """ Очки начисляются только после фиксации транзакции записи """
+    if weights:
+        transaction.on_commit(lambda: bump(board, weights))
+
+
+def record_adoptions(habits):
+    """ Начисляет очки adoption публичным привычкам, которые новые привычки других пользователей выбрали связанными """
+    targets = [(habit.user_id, habit.associated_habit_id) for habit in habits if habit.associated_habit_id]
+    if not targets:
+        return
+    owners = dict(Habit.objects.filter(pk__in={pk for _, pk in targets}, is_public=True).values_list("id", "user_id"))
+    bump_on_commit("adoption", Counter(pk for user_id, pk in targets if pk in owners and owners[pk] != user_id))
+
+
+def top(board, limit):
+    """ Лучшие limit привычек рейтинга с очками, затухшими на текущий момент: [(habit_id, очки)], O(log N + limit) """
+    redis = get_redis()
+    ranking_key, epoch_key = board_keys(board)
+    pipeline = redis.pipeline()
+    pipeline.zrevrange(ranking_key, 0, limit - 1, withscores=True)
+    pipeline.get(epoch_key)
+    pipeline.time()
+    ranking, epoch, (now, _) = pipeline.execute()
+    factor = 2 ** (-(now - int(epoch)) / settings.TRENDING_HALF_LIFE) if epoch else 1
+    return [(int(habit_id), score * factor) for habit_id, score in ranking]
+
+
+def compact(board):
+    """
+    Сжимает рейтинг (см. COMPACT_LUA) и убирает привычки, которые удалены или перестали быть публичными.
+    Возвращает размер рейтинга после сжатия.
+    """
+    redis = get_redis()
+    ranking_key, epoch_key = board_keys(board)
+    size = COMPACT_SCRIPT(keys=[ranking_key, epoch_key], args=[
+        settings.TRENDING_HALF_LIFE, settings.TRENDING_MIN_SCORE, settings.TRENDING_MAX_SIZE], client=redis)
+    members = [int(member) for member in redis.zrange(ranking_key, 0, -1)]
+    public = set(Habit.objects.filter(pk__in=members, is_public=True).values_list("id", flat=True))
+    hidden = [member for member in members if member not in public]
+    if hidden:
+        redis.zrem(ranking_key, *hidden)
+    return size - len(hidden)
@@ -1,8 +1,13 @@
 from django.urls import path
 
 from main.apps import MainConfig
+from main.async_views import AsyncHabitListView, AsyncHabitPublicView, AsyncHabitRetrieveView
 from main.views import (HabitCreateAPIView, HabitRetrieveAPIView, HabitDestroyAPIView, HabitListAPIView,
-                        HabitPublicAPIView, HabitUpdateAPIView)
+                        HabitPublicAPIView, HabitUpdateAPIView, HabitBulkCreateAPIView, HabitBulkUpdateAPIView,
+                        HabitBulkDestroyAPIView, HabitExportAPIView, HabitImportAPIView,
+                        HabitSearchAPIView, HabitChainAPIView, HabitDependentsAPIView, HabitCheckInAPIView,
+                        HabitProgressAPIView, HabitStatsAPIView, HabitTrendingAPIView,
+                        HabitCalendarAPIView, CalendarFeedAPIView, CalendarFeedICSView)
 
 app_name = MainConfig.name
 
@@ -13,4 +18,22 @@ urlpatterns = [
     path('destroy/<int:pk>/', HabitDestroyAPIView.as_view(), name='delete'),
     path('list/', HabitListAPIView.as_view(), name='list'),
     path('list_public/', HabitPublicAPIView.as_view(), name='list_public'),  # Список публичных привычек
+    path('bulk/create/', HabitBulkCreateAPIView.as_view(), name='bulk_create'),
+    path('bulk/update/', HabitBulkUpdateAPIView.as_view(), name='bulk_update'),
+    path('bulk/destroy/', HabitBulkDestroyAPIView.as_view(), name='bulk_delete'),
+    path('export/', HabitExportAPIView.as_view(), name='export'),
+    path('import/', HabitImportAPIView.as_view(), name='import'),
+    path('search/', HabitSearchAPIView.as_view(), name='search'),
+    path('chain/<int:pk>/', HabitChainAPIView.as_view(), name='chain'),
+    path('dependents/<int:pk>/', HabitDependentsAPIView.as_view(), name='dependents'),
+    path('checkin/<int:pk>/', HabitCheckInAPIView.as_view(), name='checkin'),
+    path('progress/<int:pk>/', HabitProgressAPIView.as_view(), name='progress'),
+    path('stats/', HabitStatsAPIView.as_view(), name='stats'),
+    path('calendar/', HabitCalendarAPIView.as_view(), name='calendar'),
+    path('calendar/feed/', CalendarFeedAPIView.as_view(), name='calendar_feed'),
+    path('calendar/feed/<slug:token>.ics', CalendarFeedICSView.as_view(), name='calendar_feed_ics'),
+    path('trending/', HabitTrendingAPIView.as_view(), name='trending'),  # Популярные публичные привычки
+    path('async/retrieve/<int:pk>/', AsyncHabitRetrieveView.as_view(), name='async_get'),
+    path('async/list/', AsyncHabitListView.as_view(), name='async_list'),
+    path('async/list_public/', AsyncHabitPublicView.as_view(), name='async_list_public'),
 ]
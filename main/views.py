@@ -1,37 +1,121 @@
+import logging
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import transaction
+from django.db.models import F, Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.views import View
+from redis import RedisError
+from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.generics import (CreateAPIView,
                                      ListAPIView,
                                      RetrieveAPIView,
                                      DestroyAPIView,
                                      UpdateAPIView)
 
-from main.models import Habit
-from main.paginators import HabitPaginator
-from main.serializers import HabitSerializer
+from config.throttling import ScopedSlidingWindowThrottle
+from main.mixins import (HabitListConditionalMixin, HabitObjectConditionalMixin, HabitFieldsMixin,
+                         HabitFastListMixin, parse_requested_fields)
+from main.exporters import EXPORT_FORMATS, atomic_stream, export_habits
+from main.filters import HabitFilter
+from main.ics import ICS_CONTENT_TYPE, cached_feed, forget_feeds, forget_token
+from main.importers import HabitImporter, read_rows
+from main.checkin_stream import enqueue_checkin
+from main.completions import record_completions
+from main.models import (MAX_CHAIN_DEPTH, PERIOD_UNITS, SEARCH_CONFIG, CalendarFeed, Habit, HabitCompletion,
+                         HabitProgress, UserHabitStats, new_feed_token)
+from main.occurrences import habit_occurrences
+from main.paginators import CalendarPaginator, HabitPaginator
+from main.rules import as_model_attrs, habit_rules, rule_fields_of
+from main.stats import mark_stats_changed, refresh_user_stats
+from main.trending import BOARDS, record_adoptions, top
+from main.serializers import (CalendarFeedSerializer, HabitCheckInSerializer, HabitOccurrenceSerializer,
+                              HabitProgressSerializer, HabitSerializer, HabitValuesSerializer,
+                              HabitWeeklyRollupSerializer, UserHabitStatsSerializer)
 from main.permissions import IsOwner
 
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_MAX_LENGTH = HabitCompletion._meta.get_field("idempotency_key").max_length
+
 
 class HabitCreateAPIView(CreateAPIView):
     """ Создание привычки """
     serializer_class = HabitSerializer
     permission_classes = [IsAuthenticated, IsOwner]
     pagination_class = HabitPaginator
-    filter_backends = [SearchFilter, OrderingFilter]
-    search_fields = ("action",)
-    ordering_fields = ("time",)
 
     def get_queryset(self):
         return Habit.objects.filter(user=self.request.user.pk).order_by("id")
 
     def perform_create(self, serializer):
-        new_habit = serializer.save()
-        new_habit.user = self.request.user
-        new_habit.save()
+        serializer.save(user=self.request.user)
+
+
+class HabitSearchAPIView(HabitFieldsMixin, ListAPIView):
+    """ Полнотекстовый поиск по действию и месту среди своих и публичных привычек (?q=) """
+
+    serializer_class = HabitSerializer
+    pagination_class = HabitPaginator
+
+    def get_queryset(self):
+        text = self.request.query_params.get("q", "").strip()
+        if not text:
+            return Habit.objects.none()
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        # search_vector хранится в таблице и проиндексирован GIN, to_tsvector на каждую строку не вычисляется
+        return (
+            Habit.objects.filter(Q(user=self.request.user) | Q(is_public=True), search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
+            .order_by("-rank", "id")
+        )
+
+
+class HabitChainAPIView(APIView):
+    """
+    Цепочка связанных привычек одним рекурсивным запросом.
 
+    Ответ — сама привычка (depth=0) и привычки по цепочке associated_habit с глубиной; обход идёт
+    только по своим и публичным привычкам. ?max_depth= ограничивает глубину, ?fields= — поля.
+    """
+    direction = "chain"
 
-class HabitRetrieveAPIView(RetrieveAPIView):
+    def get_max_depth(self):
+        raw = self.request.query_params.get("max_depth", MAX_CHAIN_DEPTH)
+        try:
+            max_depth = int(raw)
+        except (TypeError, ValueError):
+            max_depth = 0
+        if not 1 <= max_depth <= MAX_CHAIN_DEPTH:
+            raise ValidationError({"max_depth": f"Ожидается целое число от 1 до {MAX_CHAIN_DEPTH}."})
+        return max_depth
+
+    def get(self, request, pk):
+        serializer = HabitValuesSerializer(fields=parse_requested_fields(request.query_params.get("fields")))
+        rows = Habit.objects.graph_values(self.direction, pk, serializer.field_names,
+                                          max_depth=self.get_max_depth(), user=request.user)
+        if not rows:
+            raise NotFound()
+        data = [{**item, "depth": row[-1]} for item, row in zip(serializer.iter_representation(rows), rows)]
+        return Response(data)
+
+
+class HabitDependentsAPIView(HabitChainAPIView):
+    """ Привычки, которые прямо или через цепочку ссылаются на данную (обратный обход) """
+    direction = "dependents"
+
+
+class HabitRetrieveAPIView(HabitObjectConditionalMixin, HabitFieldsMixin, RetrieveAPIView):
     """ Просмотр одной привычки """
 
     serializer_class = HabitSerializer
@@ -40,7 +124,7 @@ class HabitRetrieveAPIView(RetrieveAPIView):
 
     def get_object(self):
         pk = self.kwargs.get('pk')
-        return get_object_or_404(self.queryset, pk=int(pk))
+        return get_object_or_404(self.get_queryset(), pk=int(pk))
 
 
 class HabitUpdateAPIView(UpdateAPIView):
@@ -57,17 +141,386 @@ class HabitDestroyAPIView(DestroyAPIView):
     queryset = Habit.objects.all()
 
 
-class HabitListAPIView(ListAPIView):
+class HabitListAPIView(HabitListConditionalMixin, HabitFastListMixin, ListAPIView):
     """ Список привычек """
 
     serializer_class = HabitSerializer
-    queryset = Habit.objects.all()
+    queryset = Habit.objects.order_by("time", "id")
     pagination_class = HabitPaginator
+    filterset_class = HabitFilter
 
 
-class HabitPublicAPIView(ListAPIView):
+class HabitPublicAPIView(HabitListConditionalMixin, HabitFastListMixin, ListAPIView):
     """ Список публичных привычек """
 
     serializer_class = HabitSerializer
-    queryset = Habit.objects.filter(is_public=True)
+    queryset = Habit.objects.filter(is_public=True).order_by("time", "id")
+    permission_classes = [AllowAny]
+    filterset_class = HabitFilter
+    throttle_classes = [ScopedSlidingWindowThrottle]
+    throttle_scope = "list_public"
+
+
+BULK_MAX_ITEMS = 500
+
+
+def is_pk(value):
+    """ Целое, но не bool: True == 1 и попал бы в выборку и словарь по pk как привычка с id 1 """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class HabitBulkMixin:
+    """ Общая логика массовых операций: проверка входного списка и сборка ответа по элементам """
+    permission_classes = [IsAuthenticated]
+    success_status = None
+
+    def get_items(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return None, Response({"detail": "Ожидается непустой список."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > BULK_MAX_ITEMS:
+            return None, Response({"detail": f"Не более {BULK_MAX_ITEMS} элементов за один запрос."},
+                                  status=status.HTTP_400_BAD_REQUEST)
+        return items, None
+
+    def bulk_response(self, results):
+        if all(result["status"] == self.success_status for result in results):
+            response_status = status.HTTP_201_CREATED if self.success_status == "created" else status.HTTP_200_OK
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response(results, status=response_status)
+
+
+class HabitBulkCreateAPIView(HabitBulkMixin, APIView):
+    """ Массовое создание привычек """
+    success_status = "created"
+
+    def post(self, request):
+        items, error = self.get_items(request)
+        if error:
+            return error
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            serializer = HabitSerializer(data=item, batch=True)
+            if serializer.is_valid():
+                valid.append((index, {**serializer.validated_data, "user": request.user}))
+            else:
+                results[index] = {"index": index, "status": "invalid", "errors": serializer.errors}
+
+        # Правила всех элементов проверяются одним проходом, связанные привычки читаются одним запросом
+        rule_errors = habit_rules.validate_many([attrs for _, attrs in valid], user=request.user)
+        habits = []
+        for (index, attrs), errors in zip(valid, rule_errors):
+            if errors:
+                results[index] = {"index": index, "status": "invalid", "errors": errors}
+            else:
+                habits.append((index, Habit(**as_model_attrs(attrs))))
+
+        with transaction.atomic():
+            created = Habit.objects.bulk_create([habit for _, habit in habits])
+            mark_stats_changed([request.user.pk])
+            forget_feeds([request.user.pk])
+            record_adoptions(created)
+        for (index, _), habit in zip(habits, created):
+            results[index] = {"index": index, "status": "created", "id": habit.pk}
+        return self.bulk_response(results)
+
+
+class HabitBulkUpdateAPIView(HabitBulkMixin, APIView):
+    """ Массовое редактирование привычек (частичное, по полю id) """
+    success_status = "updated"
+
+    def patch(self, request):
+        items, error = self.get_items(request)
+        if error:
+            return error
+
+        ids = [item.get("id") for item in items if isinstance(item, dict)]
+        habits = Habit.objects.filter(user=request.user).in_bulk([pk for pk in ids if is_pk(pk)])
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            habit = habits.get(item.get("id")) if isinstance(item, dict) and is_pk(item.get("id")) else None
+            if habit is None:
+                results[index] = {"index": index, "status": "not_found"}
+                continue
+            serializer = HabitSerializer(habit, data=item, partial=True, batch=True)
+            if not serializer.is_valid():
+                results[index] = {"index": index, "id": habit.pk, "status": "invalid", "errors": serializer.errors}
+                continue
+            attrs = {key: value for key, value in serializer.validated_data.items() if key != "user"}
+            valid.append((index, habit, attrs))
+
+        rule_errors = habit_rules.validate_many([{**rule_fields_of(habit), **attrs} for _, habit, attrs in valid],
+                                                user=request.user)
+        now = timezone.now()
+        changed = {}
+        fields = {"updated_at"}
+        for (index, habit, attrs), errors in zip(valid, rule_errors):
+            if errors:
+                results[index] = {"index": index, "id": habit.pk, "status": "invalid", "errors": errors}
+                continue
+            for key, value in as_model_attrs(attrs).items():
+                setattr(habit, key, value)
+            habit.updated_at = now
+            fields.update(attrs)
+            changed[habit.pk] = habit
+            results[index] = {"index": index, "id": habit.pk, "status": "updated"}
+
+        if changed:
+            with transaction.atomic():
+                Habit.objects.bulk_update(changed.values(), sorted(fields))
+                mark_stats_changed([request.user.pk])
+                forget_feeds([request.user.pk])
+        return self.bulk_response(results)
+
+
+class HabitBulkDestroyAPIView(HabitBulkMixin, APIView):
+    """ Массовое удаление привычек по списку id """
+    success_status = "deleted"
+
+    def post(self, request):
+        items, error = self.get_items(request)
+        if error:
+            return error
+
+        with transaction.atomic():
+            owned = Habit.objects.filter(user=request.user, pk__in=[pk for pk in items if is_pk(pk)])
+            existing = set(owned.values_list("pk", flat=True))
+            owned.delete()
+
+        results = [
+            {"index": index, "id": pk, "status": "deleted" if is_pk(pk) and pk in existing else "not_found"}
+            for index, pk in enumerate(items)
+        ]
+        return self.bulk_response(results)
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class HabitExportAPIView(HabitFieldsMixin, APIView):
+    """ Потоковая выгрузка привычек (?export_format=ndjson|csv). Администратор выгружает все привычки """
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Habit.objects.all()
+        return Habit.objects.filter(user=self.request.user)
+
+    def get(self, request):
+        export_format = request.query_params.get("export_format", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            return Response({"export_format": f"Допустимые значения: {', '.join(EXPORT_FORMATS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = HabitValuesSerializer(fields=self.get_requested_fields())
+        # iterator() читает строки серверным курсором порциями, не загружая всю выборку в память
+        # Тело читается уже после выхода из middleware, поэтому база выбирается сейчас и закрепляется
+        queryset = serializer.get_values(self.get_queryset().order_by("id"))
+        queryset = queryset.using(queryset.db)
+        rows = queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        chunks = export_habits(serializer, rows, export_format, EXPORT_CHUNK_SIZE)
+        content_type, filename = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(atomic_stream(chunks, queryset.db), content_type=content_type)
+        response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class HabitImportAPIView(APIView):
+    """ Потоковый импорт привычек из тела запроса: text/csv или application/x-ndjson """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        import_format = "csv" if request.content_type.startswith("text/csv") else "ndjson"
+        # Тело читается из потока построчно, request.data не используется
+        report = HabitImporter(request.user).run(read_rows(request.stream or [], import_format))
+        response_status = status.HTTP_201_CREATED if not report["rejected"] else status.HTTP_207_MULTI_STATUS
+        return Response(report, status=response_status)
+
+
+class HabitCheckInAPIView(APIView):
+    """
+    Отметка о выполнении своей привычки.
+
+    Заголовок Idempotency-Key защищает от двойного учёта при повторе запроса. При CHECKIN_WRITE_BEHIND отметка
+    только добавляется в поток Redis (ответ 202, в БД её пишет consume_checkins); если Redis недоступен или
+    режим выключен — записывается сразу, в ответе обновлённый прогресс (201).
+    """
+
+    def post(self, request, pk):
+        habit = get_object_or_404(Habit.objects.only("id", "user_id", "frequency", "is_public"), pk=pk,
+                                  user=request.user)
+        serializer = HabitCheckInSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        done_at = serializer.validated_data.get("done_at") or timezone.now()
+        key = request.headers.get("Idempotency-Key")
+        if key is not None and not 0 < len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise ValidationError({"Idempotency-Key": f"Ожидается от 1 до {IDEMPOTENCY_KEY_MAX_LENGTH} символов."})
+
+        if settings.CHECKIN_WRITE_BEHIND:
+            key = key or uuid.uuid4().hex
+            try:
+                enqueue_checkin(habit, done_at, key)
+            except RedisError as exc:
+                logger.warning("Redis недоступен, отметка записывается в БД сразу: %s", exc)
+            else:
+                data = {"habit": habit.pk, **HabitCheckInSerializer({"done_at": done_at}).data, "idempotency_key": key}
+                return Response(data, status=status.HTTP_202_ACCEPTED)
+
+        progress = record_completions(habit, [done_at], idempotency_key=key)
+        return Response(HabitProgressSerializer(progress).data, status=status.HTTP_201_CREATED)
+
+
+class HabitProgressAPIView(APIView):
+    """
+    Серия, доля выполнения и последнее выполнение своей или публичной привычки.
+
+    Читаются готовые итоги HabitProgress и последние RECENT_WEEKS недельных сводок — журнал выполнений
+    не просматривается.
+    """
+    RECENT_WEEKS = 4
+
+    def get(self, request, pk):
+        habit = get_object_or_404(
+            Habit.objects.filter(Q(user=request.user) | Q(is_public=True)).only("id", "frequency"), pk=pk)
+        progress = HabitProgress.objects.filter(habit=habit).first()
+        if progress is None:
+            # Выполнений ещё не было — отдаются нулевые итоги без записи в БД
+            progress = HabitProgress(habit=habit, period_unit=PERIOD_UNITS.get(habit.frequency, "day"))
+        weeks = habit.weekly_rollups.order_by("-week")[:self.RECENT_WEEKS]
+        data = HabitProgressSerializer(progress).data
+        data["recent_weeks"] = HabitWeeklyRollupSerializer(weeks, many=True).data
+        return Response(data)
+
+
+class HabitStatsAPIView(APIView):
+    """
+    Статистика привычек пользователя из UserHabitStats: время ответа не зависит от числа привычек и отметок.
+
+    Данные отстают от записей не больше чем на период задачи refresh_habit_stats (STATS_REFRESH_INTERVAL);
+    время пересчёта — в refreshed_at. Статистика, которой ещё нет, считается при первом запросе.
+    """
+
+    def get(self, request):
+        stats = UserHabitStats.objects.filter(user=request.user).first()
+        if stats is None or stats.refreshed_at is None:
+            stats = refresh_user_stats([request.user.pk])[request.user.pk]
+        return Response(UserHabitStatsSerializer(stats).data)
+
+
+TRENDING_MAX_LIMIT = 100
+
+
+class HabitTrendingAPIView(APIView):
+    """
+    Популярные публичные привычки (?by=completions|adoption, ?limit=) с очками, затухающими вдвое за
+    TRENDING_HALF_LIFE. Рейтинг читается из sorted set в Redis за O(log N + limit), привычки — одним запросом.
+    """
     permission_classes = [AllowAny]
+    throttle_classes = [ScopedSlidingWindowThrottle]
+    throttle_scope = "list_public"
+
+    def get(self, request):
+        board = request.query_params.get("by", BOARDS[0])
+        if board not in BOARDS:
+            raise ValidationError({"by": f"Ожидается одно из: {', '.join(BOARDS)}."})
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= TRENDING_MAX_LIMIT:
+            raise ValidationError({"limit": f"Ожидается целое число от 1 до {TRENDING_MAX_LIMIT}."})
+
+        try:
+            ranking = top(board, limit)
+        except RedisError as exc:
+            logger.warning("Redis недоступен, рейтинг %s не прочитан: %s", board, exc)
+            return Response({"detail": "Рейтинг временно недоступен."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        fields = parse_requested_fields(request.query_params.get("fields"))
+        # id нужен, чтобы расставить привычки в порядке рейтинга
+        serializer = HabitValuesSerializer(fields=fields if fields is None or "id" in fields else ["id", *fields])
+        # Привычки, ставшие приватными до сжатия рейтинга, пропускаются
+        rows = serializer.get_values(Habit.objects.filter(pk__in=[habit_id for habit_id, _ in ranking], is_public=True))
+        items = {item["id"]: item for item in serializer.iter_representation(rows)}
+        return Response([{**items[habit_id], "score": round(score, 4)} for habit_id, score in ranking
+                         if habit_id in items])
+
+
+class HabitCalendarAPIView(APIView):
+    """
+    Календарь своих привычек: все вхождения за ?days= дней (по умолчанию CALENDAR_DAYS, не больше
+    CALENDAR_MAX_DAYS) с даты ?start= (по умолчанию сегодня), по времени, постранично.
+
+    Вхождения разворачиваются для всех привычек сразу массивами NumPy (main.occurrences), объекты ответа
+    создаются только для текущей страницы.
+    """
+    pagination_class = CalendarPaginator
+
+    def get_range(self):
+        params = self.request.query_params
+        try:
+            start = date.fromisoformat(params["start"]) if "start" in params else timezone.localdate()
+        except ValueError:
+            raise ValidationError({"start": "Ожидается дата в формате ГГГГ-ММ-ДД."})
+        try:
+            days = int(params.get("days", settings.CALENDAR_DAYS))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= settings.CALENDAR_MAX_DAYS:
+            raise ValidationError({"days": f"Ожидается целое число от 1 до {settings.CALENDAR_MAX_DAYS}."})
+        return start, days
+
+    def get(self, request):
+        start, days = self.get_range()
+        occurrences = habit_occurrences(Habit.objects.filter(user=request.user), start, days)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(occurrences, request, view=self)
+        return paginator.get_paginated_response(HabitOccurrenceSerializer(page, many=True).data)
+
+
+class CalendarFeedAPIView(APIView):
+    """
+    Ссылка на подписку на календарь своих привычек для Google/Apple Calendar: GET выпускает её при первом
+    запросе, POST выпускает новую и отзывает прежнюю.
+    """
+
+    def get(self, request):
+        feed, _ = CalendarFeed.objects.get_or_create(user=request.user)
+        return Response(CalendarFeedSerializer(feed, context={"request": request}).data)
+
+    def post(self, request):
+        with transaction.atomic():
+            feed, created = CalendarFeed.objects.select_for_update().get_or_create(user=request.user)
+            if not created:
+                forget_token(feed.token)
+                feed.token = new_feed_token()
+                feed.save()
+        serializer = CalendarFeedSerializer(feed, context={"request": request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class CalendarFeedICSView(View):
+    """
+    Календарь привычек в формате ICS по токену ссылки, без авторизации: по событию с RRULE на привычку.
+
+    Календари опрашивают ссылку часто, поэтому тело берётся из кэша (main.ics.cached_feed) и строится заново
+    только после изменения привычек пользователя; на If-None-Match с тем же ETag отвечает 304. Обычное
+    Django-представление: клиенты календарей присылают Accept, с которым DRF ответил бы 406.
+    """
+    http_method_names = ["get", "head", "options"]
+
+    def get(self, request, token):
+        feed = cached_feed(token)
+        if feed is None:
+            raise Http404
+        etag, body = feed
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type=ICS_CONTENT_TYPE)
+        response.headers["ETag"] = etag
+        return response
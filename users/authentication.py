@@ -0,0 +1,124 @@
+import logging
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from redis import RedisError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from config.profiling import profiled
+from users.models import User
+
+# Поля пользователя, которые кладутся в токен (MyTokenObtainPairSerializer) и в кэш; остальные поля
+# у пользователя из кэша отложенные (deferred) и при обращении читаются из БД
+AUTH_USER_FIELDS = ("id", "email", "is_active", "is_staff", "is_superuser")
+
+logger = logging.getLogger(__name__)
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def user_changed_key(user_id):
+    return f"auth:user-changed:{user_id}"
+
+
+def user_auth_state(user):
+    return {field: getattr(user, field) for field in AUTH_USER_FIELDS}
+
+
+def remember_user_change(user_id, state=None):
+    """
+    Обновляет кэш после изменения пользователя: state — актуальные поля, None — пользователь удалён.
+
+    Метка изменения живёт столько же, сколько refresh-токен: access-токены, выпущенные из него, копируют его
+    iat и утверждения, поэтому утверждения токенов старше метки не используются.
+
+    Недоступный Redis не мешает сохранить пользователя: ошибка только записывается в журнал, а закэшированное
+    состояние доживает до AUTH_USER_CACHE_TTL.
+    """
+    try:
+        if state is None:
+            cache.delete(user_cache_key(user_id))
+        else:
+            cache.set(user_cache_key(user_id), state, settings.AUTH_USER_CACHE_TTL)
+        cache.set(user_changed_key(user_id), time.time(), int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()))
+    except RedisError as exc:
+        logger.warning("Redis недоступен, кэш пользователя %s не обновлён: %s", user_id, exc)
+
+
+@lru_cache(maxsize=settings.AUTH_TOKEN_CACHE_SIZE)
+def decode_token(raw_token):
+    """ Проверка подписи и разбор токена; результат кэшируется, ошибки — нет """
+    return JWTAuthentication().get_validated_token(raw_token)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация без обращения к БД на горячем пути.
+
+    Разобранные токены хранятся в LRU процесса (AUTH_TOKEN_CACHE_SIZE), срок действия проверяется при каждом
+    запросе. Пользователь берётся из кэша (AUTH_USER_CACHE_TTL секунд), при промахе — из утверждений токена,
+    а если их нет или токен выпущен до последнего изменения пользователя — из БД. Пока Redis недоступен,
+    время изменения неизвестно и пользователь читается из БД при каждом запросе. Изменение и удаление
+    пользователя обновляют кэш сигналами (users.signals); QuerySet.update() сигналов не отправляет, после
+    массовых изменений вызывайте remember_user_change().
+    """
+
+    @profiled("auth")
+    def authenticate(self, request):
+        return super().authenticate(request)
+
+    def get_validated_token(self, raw_token):
+        token = decode_token(bytes(raw_token))
+        try:
+            token.check_exp()
+        except TokenError as exc:
+            raise InvalidToken({"detail": _("Given token not valid for any token type"), "messages": [
+                {"token_class": type(token).__name__, "token_type": token.token_type, "message": exc.args[0]}
+            ]})
+        return token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        key = user_cache_key(user_id)
+        try:
+            cached = cache.get_many([key, user_changed_key(user_id)])
+        except RedisError as exc:
+            logger.warning("Redis недоступен, пользователь %s читается из БД: %s", user_id, exc)
+            state = self.get_user_state(validated_token, user_id, float("inf"))
+        else:
+            state = cached.get(key)
+            if state is None:
+                state = self.get_user_state(validated_token, user_id, cached.get(user_changed_key(user_id)))
+                try:
+                    # add, а не set: актуальное состояние, записанное сигналом за это время, не перезаписывается
+                    cache.add(key, state, settings.AUTH_USER_CACHE_TTL)
+                except RedisError as exc:
+                    logger.warning("Redis недоступен, пользователь %s не закэширован: %s", user_id, exc)
+
+        if not state["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        names = [field.attname for field in User._meta.concrete_fields if field.attname in state]
+        return User.from_db(DEFAULT_DB_ALIAS, names, [state[name] for name in names])
+
+    def get_user_state(self, validated_token, user_id, changed_at):
+        claims = {field: validated_token.get(field) for field in AUTH_USER_FIELDS if field != "id"}
+        fresh = changed_at is None or validated_token.get("iat", 0) > changed_at
+        if fresh and None not in claims.values():
+            return {"id": user_id, **claims}
+
+        state = User.objects.filter(id=user_id).values(*AUTH_USER_FIELDS).first()
+        if state is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return state
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
+from config.profiling import ProfiledSerializerMixin
 from users.models import User
 
 
@@ -12,11 +13,15 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         # Добавление пользовательских полей в токен
         token['username'] = user.username
         token['email'] = user.email
+        # Состояние пользователя для CachedJWTAuthentication: запрос с токеном не читает пользователя из БД
+        token['is_active'] = user.is_active
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
 
         return token
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     """ Сериализатор пользователя """
 
     class Meta:
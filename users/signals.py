@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.authentication import remember_user_change, user_auth_state
+from users.models import User
+
+
+@receiver(post_save, sender=User)
+def refresh_cached_user(sender, instance, **kwargs):
+    """ Изменённый или деактивированный пользователь сразу виден CachedJWTAuthentication """
+    remember_user_change(instance.pk, user_auth_state(instance))
+
+
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    remember_user_change(instance.pk)
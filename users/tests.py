@@ -1,3 +1,6 @@
+from unittest import mock
+
+import fakeredis
 from rest_framework.test import APIClient
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
@@ -9,6 +12,13 @@ from rest_framework.exceptions import ValidationError
 from users.serializers import UserSerializer
 from users.models import User
 from rest_framework.test import APITestCase
+from config.throttling import SlidingWindowThrottle
+from django.core.cache import cache
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+from redis import ConnectionError as RedisConnectionError
+from users.authentication import CachedJWTAuthentication, user_cache_key
 
 NULLABLE = {"blank": True, "null": True}
 
@@ -409,3 +419,107 @@ def test_create_user_with_guessable_password():
     # Assert
     created_user = User.objects.get(username='testuser')
     assert created_user.check_password('password') is False
+
+
+class LoginThrottleTestCase(APITestCase):
+    def setUp(self):
+        redis_patch = mock.patch('config.throttling.get_redis', return_value=fakeredis.FakeRedis())
+        rates_patch = mock.patch.object(SlidingWindowThrottle, 'THROTTLE_RATES',
+                                        {'login': '3/min', 'login_email': '2/min'})
+        down_patch = mock.patch.object(SlidingWindowThrottle, 'redis_down_until', 0)
+        for patcher in (redis_patch, rates_patch, down_patch):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def login(self, email, ip):
+        return self.client.post('/users/login/', {'email': email, 'password': 'wrong'}, REMOTE_ADDR=ip)
+
+    def test_attempts_per_email_are_limited_across_ips(self):
+        self.assertEqual(self.login('victim@example.com', '10.0.0.1').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.login('Victim@example.com', '10.0.0.2').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.login('victim@example.com', '10.0.0.3')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+    def test_attempts_per_ip_are_limited(self):
+        for index in range(3):
+            self.assertEqual(self.login(f'user{index}@example.com', '10.0.0.9').status_code,
+                             status.HTTP_401_UNAUTHORIZED)
+
+        self.assertEqual(self.login('another@example.com', '10.0.0.9').status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_forwarded_for_does_not_reset_the_ip_limit(self):
+        for index in range(4):
+            response = self.client.post('/users/login/', {'email': f'user{index}@example.com', 'password': 'wrong'},
+                                        REMOTE_ADDR='10.0.0.9', HTTP_X_FORWARDED_FOR=f'192.0.2.{index}')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class CachedJWTAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='cached@example.com', is_staff=True)
+        self.authentication = CachedJWTAuthentication()
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/list/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        user, _ = self.authentication.authenticate(request)
+        return user
+
+    def test_user_is_resolved_from_claims_without_queries(self):
+        # Токен выпущен позже изменения пользователя, кэш пуст
+        cache.clear()
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+            self.authenticate(token)
+        self.assertEqual(user, self.user)
+        self.assertTrue(user.is_staff)
+        self.assertEqual(user.tg_chat_id, None)
+
+    def test_token_without_claims_loads_user_once(self):
+        cache.delete(user_cache_key(self.user.pk))
+        token = RefreshToken.for_user(self.user).access_token
+
+        with self.assertNumQueries(1):
+            self.authenticate(token)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(token).email, 'cached@example.com')
+
+    def test_deactivation_is_seen_even_with_stale_claims(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        self.authenticate(token)
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+        # Истечение кэша пользователя не возвращает устаревшие утверждения токена
+        cache.delete(user_cache_key(self.user.pk))
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_deleted_user_is_rejected(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        self.authenticate(token)
+
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_unavailable_cache_falls_back_to_database(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        broken = mock.Mock(**{f'{name}.side_effect': RedisConnectionError('down')
+                              for name in ('get_many', 'add', 'set', 'delete')})
+        down = mock.patch('users.authentication.cache', broken)
+        with down, self.assertLogs('users.authentication', 'WARNING'):
+            self.user.is_active = False
+            self.user.save()
+            # Утверждения токена не проверить без метки изменения — пользователь читается из БД
+            with self.assertNumQueries(1), self.assertRaises(AuthenticationFailed):
+                self.authenticate(token)
+            self.user.delete()
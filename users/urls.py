@@ -1,13 +1,13 @@
 from django.urls import path
 from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from users.views import UserViewSet
+from rest_framework_simplejwt.views import TokenRefreshView
+from users.views import LoginAPIView, UserViewSet
 from users.apps import UsersConfig
 
 app_name = UsersConfig.name
 
 urlpatterns = [
     path("register/", UserViewSet.as_view({'post': 'create'}), name="register"),
-    path("login/", TokenObtainPairView.as_view(permission_classes=(AllowAny,)), name="login", ),
+    path("login/", LoginAPIView.as_view(), name="login", ),
     path("token/refresh/", TokenRefreshView.as_view(permission_classes=(AllowAny,)), name="token_refresh", ),
 ]
@@ -1,16 +1,28 @@
 from rest_framework import viewsets
 from rest_framework.permissions import AllowAny
+from rest_framework_simplejwt.views import TokenObtainPairView
 
+from config.throttling import LoginEmailThrottle, ScopedSlidingWindowThrottle
 from users.models import User
-from users.serializers import UserSerializer
+from users.serializers import MyTokenObtainPairSerializer, UserSerializer
 
 
 class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
+    throttle_classes = (ScopedSlidingWindowThrottle,)
+    throttle_scope = "register"
 
     def perform_create(self, serializer):
         user = serializer.save(is_active=True)
         user.set_password(user.password)
         user.save()
+
+
+class LoginAPIView(TokenObtainPairView):
+    """ Получение JWT с ограничением попыток по IP и по email """
+    permission_classes = (AllowAny,)
+    throttle_classes = (ScopedSlidingWindowThrottle, LoginEmailThrottle)
+    throttle_scope = "login"
+    serializer_class = MyTokenObtainPairSerializer